@@ -2,9 +2,10 @@
 # src/core/agents.py
 Módulo de agentes e guardrails do sistema.
 """
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 import json
 import os
+import time
 from pydantic import BaseModel
 
 from src.core import ModelManager
@@ -40,6 +41,24 @@ def load_config() -> Dict[str, Any]:
 # Configurações globais
 CONFIG = load_config()
 
+def generation_kwargs(format: str, output_schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Monta os argumentos de geração de um guardrail.
+    
+    Para o formato "json", o schema de saída declarado no agents.json é repassado
+    ao ModelManager, que restringe a decodificação dos modelos locais.
+    
+    Args:
+        format: Formato de saída solicitado
+        output_schema: JSON schema declarado para o guardrail (opcional)
+        
+    Returns:
+        Dict com argumentos adicionais para generate_response
+    """
+    if format == "json" and output_schema:
+        return {"response_schema": output_schema}
+    return {}
+
 class PromptRequirement(BaseModel):
     """Requisito para estruturação do prompt."""
     name: str
@@ -48,7 +67,12 @@ class PromptRequirement(BaseModel):
     value: Optional[str] = None
 
 class AgentResult(BaseModel):
-    """Resultado de uma execução do agente."""
+    """
+    Resultado de uma execução do agente.
+    
+    raw_responses tem um registro por etapa (guardrail executado): stage, guardrail,
+    response (ou error), latency_ms, model, tokens e cached.
+    """
     output: Any
     prompt_final: str = ""
     guardrails: List[Dict[str, Any]] = []
@@ -95,17 +119,42 @@ class AgentOrchestrator:
             logger.error(f"Erro ao carregar configurações: {str(e)}")
             raise
         
-    def execute(self, prompt: str, format: str = "text") -> AgentResult:
+    def execute(self, prompt: str, format: str = "text",
+                on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> AgentResult:
         """
         Executa o fluxo completo de processamento.
         
         Args:
             prompt: Prompt do usuário
             format: Formato de saída desejado
+            on_event: Callback chamado ao fim de cada guardrail (opcional, usado no streaming)
             
         Returns:
             Resultado do processamento
         """
+        def stage(name: str, guardrail_id: str, process: Callable[..., str], *args, **kwargs) -> str:
+            # Executa um guardrail registrando a etapa em raw_responses (também em caso de erro)
+            record = {"guardrail": guardrail_id, "stage": name}
+            raw_responses.append(record)
+            start = time.perf_counter()
+            with self.model_manager.track_usage() as usage:
+                try:
+                    record["response"] = process(*args, **kwargs)
+                    return record["response"]
+                except Exception as e:
+                    record["error"] = str(e)
+                    raise
+                finally:
+                    record.update(latency_ms=round((time.perf_counter() - start) * 1000, 1), model=usage["model"],
+                                  tokens=usage["tokens"], cached=usage["calls"] > 0 and usage["cached"])
+        
+        def emit(event: Dict[str, Any]) -> None:
+            if on_event:
+                try:
+                    on_event(event)
+                except Exception as e:
+                    logger.warning(f"Falha ao notificar evento {event.get('event')}: {str(e)}")
+        
         try:
             logger.info(f"Iniciando execução para prompt: {prompt[:50]}...")
             
@@ -116,13 +165,12 @@ class AgentOrchestrator:
             # Processa cada guardrail de entrada dinamicamente
             for guardrail_id, guardrail in self.input_guardrails.items():
                 try:
-                    result = guardrail.process(prompt)
+                    result = stage("input", guardrail_id, guardrail.process, prompt, format=format)
                     prompt_responses.append(result)
-                    raw_responses.append({"guardrail": guardrail_id, "response": result})
                     logger.debug(f"Texto gerado por {guardrail_id}: {result[:50]}...")
                 except Exception as e:
                     logger.warning(f"Falha no guardrail {guardrail_id}: {str(e)}")
-                    raw_responses.append({"guardrail": guardrail_id, "error": str(e)})
+                emit({"event": "guardrail", **raw_responses[-1]})
             
             # Concatena os resultados dos guardrails em um prompt final
             prompt_final = f"{prompt}\n\n" + "\n\n".join(prompt_responses)
@@ -130,17 +178,22 @@ class AgentOrchestrator:
             # Gera prompt TDD
             try:
                 # Processa com o guardrail de saída
-                result = self.output_guardrails["gerar_prompt_tdd"].process(prompt_final)
+                result = stage("output", "gerar_prompt_tdd", self.output_guardrails["gerar_prompt_tdd"].process,
+                               prompt_final, format=format)
+                emit({"event": "guardrail", **raw_responses[-1]})
                 
                 # Verifica coerência (opcional)
                 coherence_result = None
                 if "verificar_coerencia" in self.output_guardrails:
                     try:
-                        coherence_result = self.output_guardrails["verificar_coerencia"].process(
+                        coherence_result = stage(
+                            "output", "verificar_coerencia", self.output_guardrails["verificar_coerencia"].process,
                             f"Resultado: {result}\nPrompt original: {prompt}", 
-                            {"original": prompt, "result": result}
+                            {"original": prompt, "result": result},
+                            format=format
                         )
                         logger.debug(f"Resultado da verificação de coerência: {coherence_result}")
+                        emit({"event": "guardrail", **raw_responses[-1]})
                     except Exception as e:
                         logger.warning(f"Erro na verificação de coerência: {str(e)}")
                 
@@ -213,14 +266,16 @@ class InputGuardrail:
         self.config = config
         self.model_manager = model_manager
         self.requirements = config.get("requirements", "")
+        self.output_schema = config.get("output_schema")
         logger.info("InputGuardrail inicializado")
         
-    def process(self, prompt: str) -> str:
+    def process(self, prompt: str, format: str = "text") -> str:
         """
         Processa o prompt e gera uma resposta textual como sugestão ou complemento.
         
         Args:
             prompt: Prompt do usuário
+            format: Formato de saída solicitado; em "json" a geração é restrita ao output_schema
             
         Returns:
             Texto com sugestões ou complementos ao prompt
@@ -235,7 +290,7 @@ class InputGuardrail:
                 {"role": "user", "content": prompt}
             ]
             
-            response = self.model_manager.generate_response(messages)
+            response = self.model_manager.generate_response(messages, **generation_kwargs(format, self.output_schema))
             logger.debug(f"Resposta do modelo: {response}")
             
             # Limpa o output se estiver em formato de bloco de código
@@ -272,14 +327,16 @@ class OutputGuardrail:
         self.model_manager = model_manager
         self.format = config.get("format", "text")
         self.requirements = config.get("requirements", "")
+        self.output_schema = config.get("output_schema")
         
-    def process(self, prompt: str, context: dict = None) -> str:
+    def process(self, prompt: str, context: dict = None, format: Optional[str] = None) -> str:
         """
         Processa o prompt final e gera a saída.
         
         Args:
             prompt: Prompt final com todas as contribuições
             context: Contexto adicional com dados para o guardrail (opcional)
+            format: Formato de saída solicitado (padrão: formato do guardrail)
             
         Returns:
             Resposta textual gerada
@@ -296,7 +353,9 @@ class OutputGuardrail:
                 {"role": "user", "content": prompt}
             ]
             
-            output = self.model_manager.generate_response(messages)
+            output = self.model_manager.generate_response(
+                messages, **generation_kwargs(format or self.format, self.output_schema)
+            )
             logger.debug(f"Saída do modelo: {output[:100]}...")
             
             # Limpa o output se estiver em formato de bloco de código
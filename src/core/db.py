@@ -1,106 +1,1116 @@
 """
 # src/core/db.py
 Módulo de gerenciamento do banco de dados.
+
+Cada thread lê pela sua própria conexão (aberta sob demanda), e todas as escritas
+passam por uma única conexão de gravação, serializada por um lock e iniciada com
+BEGIN IMMEDIATE: o lock de escrita do SQLite é obtido logo no início da transação,
+com nova tentativa se outro processo estiver gravando além do busy_timeout.
+
+O banco usa WAL com synchronous=NORMAL: commits não esperam fsync (apenas os
+checkpoints), e leitores não bloqueiam o gravador. Com write-behind (seção database
+do kernel.yaml), os registros de execução vão para uma fila drenada por uma thread
+que agrupa as inserções (executemany) em um único commit por lote; `flush()` aguarda
+a gravação do que já foi enfileirado e `close()` (também no encerramento do processo)
+esvazia a fila.
+
+A retenção (database.retention) remove em segundo plano os registros antigos de cada
+tabela, em lotes curtos que intercalam com as gravações, e devolve as páginas livres
+ao sistema com `incremental_vacuum`. Backups usam a API de backup do SQLite sobre
+uma conexão de leitura: a cópia é consistente e não bloqueia o gravador.
+
+Com particionamento (database.partitioning: monthly/daily), as execuções e seus
+registros vão para um arquivo por período (<partition_dir>/2024-05.db). O id da
+execução codifica a partição (chave do período * PARTITION_ID_SPAN + sequência local),
+de modo que os ids seguem crescentes entre partições e cada registro é roteado pelo
+id. As consultas anexam (ATTACH, somente leitura) apenas as partições necessárias;
+o banco principal mantém o cache e as execuções anteriores ao particionamento.
+
+Os textos de runs.prompt, run_items.content e raw_responses.content são indexados
+em tabelas FTS5 (conteúdo externo, mantidas por triggers na mesma transação da
+inserção ou remoção), consultadas por `search`.
+
+A telemetria de cada etapa da execução (guardrail, modelo, latência, tokens, cache)
+vai para run_stages, na partição da execução, e é somada na mesma transação aos
+agregados por hora, modelo e guardrail (stage_rollups, no banco principal), com um
+histograma de latência do qual saem p50/p95: os painéis consultam apenas os agregados.
 """
+import atexit
+import bisect
+import calendar
 import json
 import logging
 import os
+import queue
+import random
 import sqlite3
+import threading
 import time
-from typing import Any, Dict, List, Optional, Tuple, Union
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import date, timedelta
+from itertools import islice
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from src.core.kernel import CONFIG, get_env_var
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_DB_PATH = "logs/agent_logs.db"
+DEFAULT_SYNCHRONOUS = "NORMAL"
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_BUSY_TIMEOUT = 5000
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_PAGE_SIZE = 100
+# Novas tentativas de BEGIN IMMEDIATE quando o banco segue ocupado após o busy_timeout
+DEFAULT_BUSY_RETRIES = 3
+BUSY_RETRY_DELAY = 0.1
+DEFAULT_RETENTION_INTERVAL = 3600.0
+DEFAULT_PRUNE_BATCH_SIZE = 500
+DEFAULT_PRUNE_PAUSE = 0.05
+DEFAULT_VACUUM_PAGES = 1000
+DEFAULT_BACKUP_DIR = "backups"
+# Ids por partição: id = chave do período (202405 ou 20240517) * PARTITION_ID_SPAN + sequência.
+# Mantém os ids abaixo de 2^53 (seguros em JSON) mesmo com partições diárias
+PARTITION_ID_SPAN = 10 ** 8
+PARTITIONINGS = ("none", "monthly", "daily")
+# Limites superiores (ms) das faixas do histograma de latência de stage_rollups: progressão
+# geométrica de razão √2, de 10 ms a ~116 s, mais uma faixa final sem limite
+LATENCY_BUCKETS_MS = tuple(round(10 * 2 ** (i / 2)) for i in range(28))
+STAGE_ROLLUP_GROUPS = ("hour", "model", "guardrail")
+
+# {schema}: "main" ou a partição anexada (ver DatabaseManager._schema)
+_INSERT_RUN = "INSERT INTO {schema}.runs (session_id, prompt, format) VALUES (?, ?, ?)"
+_INSERT_RUN_ITEM = "INSERT INTO {schema}.run_items (run_id, type, content) VALUES (?, ?, ?)"
+_INSERT_GUARDRAIL = "INSERT INTO {schema}.guardrail_results (run_id, type, passed) VALUES (?, ?, ?)"
+_INSERT_RAW_RESPONSE = "INSERT INTO {schema}.raw_responses (run_id, response_id, content) VALUES (?, ?, ?)"
+_INSERT_RUN_STAGE = ("INSERT INTO {schema}.run_stages (run_id, stage, guardrail, model, latency_ms, tokens, cached, error) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+# Uma variante por faixa do histograma (lat_N)
+_UPSERT_STAGE_ROLLUP = [f"""
+    INSERT INTO main.stage_rollups (hour, model, guardrail, count, errors, cache_hits, tokens,
+                                    latency_ms_sum, latency_ms_min, latency_ms_max, lat_{bucket})
+    VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT (hour, model, guardrail) DO UPDATE SET
+        count = count + 1,
+        errors = errors + excluded.errors,
+        cache_hits = cache_hits + excluded.cache_hits,
+        tokens = tokens + excluded.tokens,
+        latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum,
+        latency_ms_min = MIN(latency_ms_min, excluded.latency_ms_min),
+        latency_ms_max = MAX(latency_ms_max, excluded.latency_ms_max),
+        lat_{bucket} = lat_{bucket} + 1
+""" for bucket in range(len(LATENCY_BUCKETS_MS) + 1)]
+# Ids por consulta "run_id IN (...)" (limite de parâmetros do SQLite)
+_MAX_QUERY_PARAMS = 500
+# Partições anexadas por conexão (o SQLite admite 10)
+_MAX_ATTACHED = 8
+# Coluna de data das tabelas com política de retenção
+_RETENTION_COLUMNS = {
+    "runs": "created_at",
+    "run_items": "created_at",
+    "guardrail_results": "created_at",
+    "raw_responses": "created_at",
+    "run_stages": "created_at",
+    "model_cache": "timestamp",
+    "stage_rollups": "hour",
+}
+# Removidas junto com a execução
+_RUN_CHILD_TABLES = ("run_items", "guardrail_results", "raw_responses", "run_stages")
+# Tabelas gravadas nas partições
+_RUN_TABLES = ("runs",) + _RUN_CHILD_TABLES
+# Índices de texto: (tabela FTS5, tabela indexada, coluna, origem informada em SearchHit)
+_SEARCH_INDEXES = (
+    ("runs_fts", "runs", "prompt", "prompt"),
+    ("run_items_fts", "run_items", "content", "item"),
+    ("raw_responses_fts", "raw_responses", "content", "response"),
+)
+# Marcadores dos termos encontrados em SearchHit.snippet
+SNIPPET_MARKERS = ("«", "»")
+
+def partition_key(partitioning: str, timestamp: Optional[float] = None) -> int:
+    """
+    Chave da partição de um instante.
+    
+    Args:
+        partitioning: "monthly" ou "daily"
+        timestamp: Instante (padrão: agora), em UTC como created_at
+        
+    Returns:
+        AAAAMM (mensal) ou AAAAMMDD (diária)
+    """
+    t = time.gmtime(timestamp)
+    if partitioning == "daily":
+        return t.tm_year * 10000 + t.tm_mon * 100 + t.tm_mday
+    return t.tm_year * 100 + t.tm_mon
+
+def _is_daily(key: int) -> bool:
+    return key >= 10 ** 6
+
+def partition_name(key: int) -> str:
+    """Nome do arquivo da partição, sem extensão (2024-05 ou 2024-05-17)."""
+    if _is_daily(key):
+        return f"{key // 10000:04d}-{key // 100 % 100:02d}-{key % 100:02d}"
+    return f"{key // 100:04d}-{key % 100:02d}"
+
+def _parse_partition_name(name: str) -> Optional[int]:
+    """Chave de um arquivo de partição, ou None se o nome não for de partição."""
+    stem, ext = os.path.splitext(name)
+    parts = stem.split("-")
+    if ext != ".db" or len(parts) not in (2, 3) or not all(p.isdigit() for p in parts):
+        return None
+    return int("".join(parts))
+
+def partition_range(key: int) -> Tuple[str, str]:
+    """
+    Intervalo de created_at de uma partição.
+    
+    Returns:
+        (início, fim exclusivo) no formato "YYYY-MM-DD HH:MM:SS" (UTC)
+    """
+    if _is_daily(key):
+        start = date(key // 10000, key // 100 % 100, key % 100)
+        end = start + timedelta(days=1)
+    else:
+        start = date(key // 100, key % 100, 1)
+        end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return f"{start.isoformat()} 00:00:00", f"{end.isoformat()} 00:00:00"
+
+def _is_busy_error(error: sqlite3.OperationalError) -> bool:
+    """Verifica se o erro indica banco ocupado por outra conexão."""
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+def _load_json(text: Optional[str]) -> Any:
+    """Decodifica um conteúdo gravado como JSON; textos simples são retornados como estão."""
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+@dataclass
+class RunItemRecord:
+    """Item registrado durante uma execução (tabela run_items)."""
+    id: int
+    run_id: int
+    type: str
+    content: Any
+    created_at: str
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "RunItemRecord":
+        return cls(row['id'], row['run_id'], row['type'], _load_json(row['content']), row['created_at'])
+
+@dataclass
+class GuardrailRecord:
+    """Resultado de guardrail de uma execução (tabela guardrail_results)."""
+    id: int
+    run_id: int
+    type: str
+    passed: bool
+    error: Optional[str]
+    created_at: str
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "GuardrailRecord":
+        return cls(row['id'], row['run_id'], row['type'], bool(row['passed']), row['error'], row['created_at'])
+
+@dataclass
+class RawResponseRecord:
+    """Resposta bruta registrada em uma execução (tabela raw_responses)."""
+    id: int
+    run_id: int
+    response_id: str
+    content: Any
+    created_at: str
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "RawResponseRecord":
+        return cls(row['id'], row['run_id'], row['response_id'], _load_json(row['content']), row['created_at'])
+
+@dataclass
+class StageRecord:
+    """Telemetria de uma etapa (guardrail) de uma execução (tabela run_stages)."""
+    id: int
+    run_id: int
+    stage: str
+    guardrail: str
+    model: Optional[str]
+    latency_ms: float
+    tokens: Optional[int]
+    cached: bool
+    error: Optional[str]
+    created_at: str
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "StageRecord":
+        return cls(row['id'], row['run_id'], row['stage'], row['guardrail'], row['model'], row['latency_ms'],
+                   row['tokens'], bool(row['cached']), row['error'], row['created_at'])
+
+@dataclass
+class RunRecord:
+    """Execução registrada, com seus itens, resultados de guardrails, respostas brutas e etapas."""
+    id: int
+    session_id: str
+    prompt: str
+    format: str
+    created_at: str
+    items: List[RunItemRecord] = field(default_factory=list)
+    guardrails: List[GuardrailRecord] = field(default_factory=list)
+    responses: List[RawResponseRecord] = field(default_factory=list)
+    stages: List[StageRecord] = field(default_factory=list)
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "RunRecord":
+        return cls(row['id'], row['session_id'], row['prompt'], row['format'], row['created_at'])
+
+    @property
+    def final_output(self) -> Optional[Any]:
+        """Saída final registrada por log_run (resposta "input"), se houver."""
+        for response in self.responses:
+            if response.response_id == "input":
+                return response.content or None
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representação serializável em JSON."""
+        return asdict(self)
+
+def _latency_percentile(buckets: List[int], q: float, min_ms: float, max_ms: float) -> Optional[float]:
+    """Estima um percentil de latência (ms) pelo histograma, interpolando dentro da faixa (limitado a min/max)."""
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for bucket, n in enumerate(buckets):
+        if n and seen + n >= rank:
+            lower = LATENCY_BUCKETS_MS[bucket - 1] if bucket else 0.0
+            upper = LATENCY_BUCKETS_MS[bucket] if bucket < len(LATENCY_BUCKETS_MS) else max(max_ms, lower)
+            return round(min(max(lower + (upper - lower) * (rank - seen) / n, min_ms), max_ms), 1)
+        seen += n
+    return round(max_ms, 1)
+
+@dataclass
+class StageRollup:
+    """Agregado das etapas por hora, modelo e/ou guardrail (tabela stage_rollups)."""
+    hour: Optional[str]
+    model: Optional[str]
+    guardrail: Optional[str]
+    count: int
+    errors: int
+    cache_hits: int
+    tokens: int
+    latency_ms_avg: Optional[float]
+    latency_ms_p50: Optional[float]
+    latency_ms_p95: Optional[float]
+    latency_ms_max: Optional[float]
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row, group_by: Iterable[str]) -> "StageRollup":
+        keys = {column: row[column] for column in group_by}
+        buckets = [row[f'lat_{bucket}'] for bucket in range(len(LATENCY_BUCKETS_MS) + 1)]
+        count, min_ms, max_ms = row['count'], row['latency_ms_min'], row['latency_ms_max']
+        return cls(
+            keys.get('hour'), keys.get('model'), keys.get('guardrail'), count, row['errors'], row['cache_hits'],
+            row['tokens'], round(row['latency_ms_sum'] / count, 1) if count else None,
+            _latency_percentile(buckets, 0.5, min_ms, max_ms), _latency_percentile(buckets, 0.95, min_ms, max_ms),
+            round(max_ms, 1) if count else None
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representação serializável em JSON."""
+        return asdict(self)
+
+@dataclass
+class SearchHit:
+    """Execução encontrada pela busca textual, com o trecho mais relevante."""
+    run_id: int
+    score: float
+    source: str
+    snippet: str
+    run: Optional[RunRecord] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representação serializável em JSON."""
+        return asdict(self)
+
+def fts_query(text: str) -> str:
+    """
+    Converte um texto livre em consulta FTS5: todos os termos, como literais.
+    
+    Termos terminados em * buscam por prefixo (ex: "autentic*").
+    
+    Args:
+        text: Texto digitado pelo usuário
+        
+    Returns:
+        Consulta para MATCH
+    """
+    terms = []
+    for term in text.split():
+        prefix = term.endswith("*") and len(term) > 1
+        term = term.rstrip("*").replace('"', '""')
+        if term:
+            terms.append(f'"{term}"{"*" if prefix else ""}')
+    return " ".join(terms)
+
+def get_database_config() -> Dict[str, Any]:
+    """
+    Obtém a seção database do kernel.yaml, com as sobreposições por variável de ambiente.
+    
+    Returns:
+        Dict com a configuração do banco
+    """
+    config = dict(CONFIG.get('database') or {})
+    env = config.get('env_vars') or {}
+    if env.get('write_behind'):
+        config['write_behind'] = get_env_var(env['write_behind'], str(config.get('write_behind', False))).lower() == 'true'
+    if env.get('retention'):
+        retention = dict(config.get('retention') or {})
+        retention['enabled'] = get_env_var(env['retention'], str(retention.get('enabled', False))).lower() == 'true'
+        config['retention'] = retention
+    if env.get('partitioning'):
+        config['partitioning'] = get_env_var(env['partitioning'], config.get('partitioning') or 'none').lower()
+    return config
+
+def _create_run_tables(conn: sqlite3.Connection) -> None:
+    """Tabelas de execução: runs, run_items, guardrail_results e raw_responses."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            format TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS run_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (run_id) REFERENCES runs (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS guardrail_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            passed BOOLEAN NOT NULL,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (run_id) REFERENCES runs (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS raw_responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL,
+            response_id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (run_id) REFERENCES runs (id)
+        )
+    """)
+
+def _create_run_stages(conn: sqlite3.Connection) -> None:
+    """Telemetria por etapa das execuções (tabela run_stages)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS run_stages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            guardrail TEXT NOT NULL,
+            model TEXT,
+            latency_ms REAL NOT NULL,
+            tokens INTEGER,
+            cached BOOLEAN NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (run_id) REFERENCES runs (id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_run_stages_run_id ON run_stages (run_id)")
+
+def _create_telemetry_tables(conn: sqlite3.Connection) -> None:
+    """run_stages e os agregados por hora, modelo e guardrail (stage_rollups), com o histograma de latência."""
+    _create_run_stages(conn)
+    buckets = ",\n".join(f"lat_{bucket} INTEGER NOT NULL DEFAULT 0" for bucket in range(len(LATENCY_BUCKETS_MS) + 1))
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS stage_rollups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hour TEXT NOT NULL,
+            model TEXT NOT NULL,
+            guardrail TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            cache_hits INTEGER NOT NULL DEFAULT 0,
+            tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms_sum REAL NOT NULL DEFAULT 0,
+            latency_ms_min REAL NOT NULL DEFAULT 0,
+            latency_ms_max REAL NOT NULL DEFAULT 0,
+            {buckets},
+            UNIQUE (hour, model, guardrail)
+        )
+    """)
+
+def _stage_rows(stages: Iterable[Dict[str, Any]], hour: str) -> Tuple[List[Tuple[Any, ...]], List[Tuple[str, Tuple[Any, ...]]]]:
+    """
+    Converte as etapas de AgentResult.raw_responses em registros de run_stages e atualizações de stage_rollups.
+    
+    Etapas sem latency_ms (sem telemetria) são ignoradas. Etapas com erro ou sem modelo
+    (nenhuma resposta do modelo) contam como erro nos agregados.
+    
+    Returns:
+        Tupla (parâmetros de run_stages sem o run_id, [(SQL, parâmetros) de stage_rollups])
+    """
+    rows, rollups = [], []
+    for stage in stages:
+        if not isinstance(stage, dict) or stage.get('latency_ms') is None:
+            continue
+        latency = float(stage['latency_ms'])
+        model, tokens, error = stage.get('model'), stage.get('tokens'), stage.get('error')
+        cached = bool(stage.get('cached'))
+        guardrail = str(stage.get('guardrail') or "")
+        rows.append((stage.get('stage') or "", guardrail, model, latency, tokens, cached, error))
+        rollups.append((_UPSERT_STAGE_ROLLUP[bisect.bisect_left(LATENCY_BUCKETS_MS, latency)],
+                        (hour, model or "", guardrail, int(error is not None or not model), int(cached),
+                         tokens or 0, latency, latency, latency)))
+    return rows, rollups
+
+def _create_base_tables(conn: sqlite3.Connection) -> None:
+    """Tabelas de execução e de cache (schema original, criado com IF NOT EXISTS)."""
+    _create_run_tables(conn)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS model_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(model, prompt)
+        )
+    """)
+
+def _create_run_indexes(conn: sqlite3.Connection) -> None:
+    """Índices das consultas de histórico: itens por execução e execuções por data e sessão."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_created_at ON runs (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_session_id ON runs (session_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_run_items_run_id ON run_items (run_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_guardrail_results_run_id ON guardrail_results (run_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_responses_run_id ON raw_responses (run_id)")
+
+def _rebuild_model_cache(conn: sqlite3.Connection) -> None:
+    """
+    Recria model_cache com as colunas usadas por get_cached_response/save_to_cache.
+    
+    O schema original (model, prompt) nunca foi compatível com as consultas por
+    cache_key, portanto a tabela antiga não contém entradas aproveitáveis.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(model_cache)")}
+    if {"cache_key", "response", "metadata", "timestamp"} <= columns:
+        return
+    conn.execute("DROP TABLE IF EXISTS model_cache")
+    conn.execute("""
+        CREATE TABLE model_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cache_key TEXT NOT NULL,
+            response TEXT NOT NULL,
+            metadata TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE UNIQUE INDEX idx_cache_key ON model_cache (cache_key)")
+
+def _create_search_index(conn: sqlite3.Connection) -> None:
+    """Tabelas FTS5 dos textos de execução, triggers que as mantêm e indexação dos registros existentes."""
+    for fts, table, column, _ in _SEARCH_INDEXES:
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {column}, content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {column}) VALUES (new.id, new.{column});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                INSERT INTO {fts} (rowid, {column}) VALUES (new.id, new.{column});
+            END
+        """)
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+# Migrações do schema, aplicadas em ordem: a versão do banco (PRAGMA user_version) é o
+# número de migrações já aplicadas. Novas alterações entram sempre no fim da lista.
+MIGRATIONS: List[Tuple[str, Callable[[sqlite3.Connection], None]]] = [
+    ("tabelas de execução e cache", _create_base_tables),
+    ("índices de runs, run_items, guardrail_results e raw_responses", _create_run_indexes),
+    ("model_cache com cache_key, metadata e timestamp", _rebuild_model_cache),
+    ("busca textual (FTS5) em runs, run_items e raw_responses", _create_search_index),
+    ("telemetria por etapa (run_stages) e agregados (stage_rollups)", _create_telemetry_tables),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def _partition_migrations(key: int) -> List[Tuple[str, Callable[[sqlite3.Connection], None]]]:
+    """
+    Migrações de um arquivo de partição (versionado pelo seu próprio user_version).
+    
+    A sequência de ids é iniciada na mesma transação que cria as tabelas, antes de
+    qualquer inserção: todos os ids da partição ficam no intervalo da sua chave.
+    """
+    def create_tables(conn: sqlite3.Connection) -> None:
+        _create_run_tables(conn)
+        conn.executemany("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                         [(table, key * PARTITION_ID_SPAN) for table in _RUN_TABLES])
+        
+    def create_stages(conn: sqlite3.Connection) -> None:
+        _create_run_stages(conn)
+        # Partições criadas depois desta migração já têm a sequência (create_tables)
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'run_stages', ? "
+                     "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'run_stages')",
+                     (key * PARTITION_ID_SPAN,))
+        
+    return [
+        ("tabelas de execução", create_tables),
+        ("índices de runs, run_items, guardrail_results e raw_responses", _create_run_indexes),
+        ("busca textual (FTS5) em runs, run_items e raw_responses", _create_search_index),
+        ("telemetria por etapa (run_stages)", create_stages),
+    ]
+
+class _WriteBehind:
+    """Fila de gravação com commit em grupo, drenada por uma thread."""
+    
+    def __init__(self, transaction: Callable[[Iterable[int]], ContextManager[sqlite3.Connection]],
+                 batch_size: int, flush_interval: float):
+        """
+        Inicializa a fila e inicia a thread de gravação.
+        
+        Args:
+            transaction: Abre uma transação na conexão de gravação do DatabaseManager,
+                         com as partições informadas anexadas
+            batch_size: Operações por commit
+            flush_interval: Espera máxima para completar um lote (s)
+        """
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._transaction = transaction
+        self._queue: "queue.Queue[Tuple[str, Any, Optional[Future]]]" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._thread.start()
+        
+    def insert(self, sql: str, params: Tuple[Any, ...], partition: int = 0) -> None:
+        """Enfileira uma inserção (partition: partição referenciada pelo SQL; 0 = banco principal)."""
+        self._submit("insert", (sql, params, partition))
+        
+    def insert_returning_id(self, sql: str, params: Tuple[Any, ...], partition: int = 0) -> int:
+        """Executa uma inserção na transação do lote atual e retorna o rowid após o commit do lote."""
+        return self._submit("insert_id", (sql, params, partition), Future()).result()
+        
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Aguarda o commit de tudo o que foi enfileirado até agora.
+        
+        Returns:
+            True se a gravação foi concluída dentro do tempo limite
+        """
+        future = Future()
+        self._submit("flush", None, future)
+        try:
+            future.result(timeout)
+            return True
+        except TimeoutError:
+            return False
+            
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Grava a fila pendente e encerra a thread."""
+        if self._closed:
+            return
+        self._queue.put(("stop", None, None))
+        self._closed = True
+        self._thread.join(timeout)
+        
+    def _submit(self, kind: str, payload: Any, future: Optional[Future] = None) -> Optional[Future]:
+        if self._closed:
+            raise sqlite3.ProgrammingError("Fila de gravação encerrada")
+        self._queue.put((kind, payload, future))
+        return future
+        
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # Quem aguarda (id de execução, flush) encerra o lote para não esperar o intervalo
+            while len(batch) < self.batch_size and batch[-1][0] not in ("insert_id", "flush", "stop"):
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = any(kind == "stop" for kind, _, _ in batch)
+            if stop:
+                # Drena o que chegou antes do encerramento
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+            self._write(batch)
+        
+    def _write(self, batch: List[Tuple[str, Any, Optional[Future]]]) -> None:
+        """Grava um lote em uma transação, agrupando inserções consecutivas com o mesmo SQL."""
+        waiting: List[Future] = []
+        # Ids inseridos: só são entregues depois do commit, para nunca referenciar uma linha desfeita
+        inserted: List[Tuple[Future, int]] = []
+        pending_sql, pending_rows = None, []
+        partitions = {payload[2] for kind, payload, _ in batch if kind in ("insert", "insert_id")}
+        try:
+            with self._transaction(partitions) as conn:
+                for kind, payload, future in batch:
+                    if kind == "insert" and payload[0] == pending_sql:
+                        pending_rows.append(payload[1])
+                        continue
+                    if pending_rows:
+                        conn.executemany(pending_sql, pending_rows)
+                        pending_sql, pending_rows = None, []
+                    if kind == "insert":
+                        pending_sql, pending_rows = payload[0], [payload[1]]
+                    elif kind == "insert_id":
+                        try:
+                            inserted.append((future, conn.execute(payload[0], payload[1]).lastrowid))
+                        except sqlite3.Error as e:
+                            future.set_exception(e)
+                    elif future is not None:
+                        waiting.append(future)
+                if pending_rows:
+                    conn.executemany(pending_sql, pending_rows)
+        except sqlite3.Error as e:
+            logger.error(f"FALHA - write-behind | {len(batch)} operações descartadas: {str(e)}")
+            for future, _ in inserted:
+                future.set_exception(e)
+            for future in waiting:
+                future.set_exception(e)
+            return
+        for future, rowid in inserted:
+            future.set_result(rowid)
+        for future in waiting:
+            future.set_result(None)
+
+class _Retention:
+    """Limpeza periódica do banco (prune e incremental_vacuum), executada por uma thread."""
+    
+    def __init__(self, db: "DatabaseManager", interval: float):
+        """
+        Inicializa e inicia a thread de limpeza.
+        
+        Args:
+            db: Gerenciador do banco
+            interval: Intervalo entre as limpezas (s)
+        """
+        self.db = db
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="db-retention", daemon=True)
+        self._thread.start()
+        
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Interrompe a limpeza (entre lotes) e encerra a thread."""
+        self._stop.set()
+        self._thread.join(timeout)
+        
+    def _run(self) -> None:
+        # Primeira limpeza com atraso aleatório, para que processos iniciados juntos não coincidam
+        delay = random.uniform(0, min(self.interval, 60.0))
+        while not self._stop.wait(delay):
+            try:
+                self.db.prune(stop=self._stop)
+                if not self._stop.is_set():
+                    self.db.incremental_vacuum()
+            except sqlite3.Error as e:
+                logger.error(f"FALHA - retenção em {self.db.db_path} | Erro: {str(e)}")
+            delay = self.interval
+
+# Uma thread de retenção por banco no processo
+_retention_threads: Dict[str, _Retention] = {}
+_retention_lock = threading.Lock()
+
+def _start_retention(db: "DatabaseManager") -> Optional[_Retention]:
+    """
+    Inicia a limpeza periódica de um banco, se ainda não houver uma no processo.
+    
+    Args:
+        db: Gerenciador do banco
+        
+    Returns:
+        Thread de retenção criada, ou None se o banco já tem uma
+    """
+    path = os.path.abspath(db.db_path)
+    with _retention_lock:
+        if path in _retention_threads:
+            return None
+        retention = db.config.get('retention') or {}
+        _retention_threads[path] = _Retention(db, retention.get('interval', DEFAULT_RETENTION_INTERVAL))
+        return _retention_threads[path]
+
 class DatabaseManager:
     """Gerenciador de banco de dados."""
     
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, write_behind: Optional[bool] = None,
+                 config: Optional[Dict[str, Any]] = None, retention: Optional[bool] = None):
         """
         Inicializa o gerenciador de banco de dados.
         
         Args:
             db_path: Caminho para o arquivo de banco de dados
+            write_behind: Se os registros de execução são gravados em segundo plano
+                          (padrão: database.write_behind do kernel.yaml)
+            config: Seção database do kernel.yaml (padrão: get_database_config())
+            retention: Se inicia a limpeza periódica em segundo plano
+                       (padrão: database.retention.enabled do kernel.yaml)
         """
-        self.db_path = db_path or "logs/agent_logs.db"
+        self.config = config if config is not None else get_database_config()
+        self.db_path = db_path or self.config.get('db_path') or DEFAULT_DB_PATH
+        
+        self.busy_timeout = self.config.get('busy_timeout', DEFAULT_BUSY_TIMEOUT)
+        self.busy_retries = self.config.get('busy_retries', DEFAULT_BUSY_RETRIES)
         
         # Cria diretório se não existir e não for banco em memória
-        if self.db_path != ":memory:":
+        self._memory = self.db_path == ":memory:"
+        if not self._memory:
             os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
             
-        # Inicializa conexão
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row
-        
-        # Cria tabelas
-        self._create_tables()
-        logger.info(f"Banco de dados inicializado em {self.db_path}")
+        # Partições por período (banco em memória não é particionado)
+        self.partitioning = self.config.get('partitioning') or "none"
+        if self.partitioning not in PARTITIONINGS:
+            raise ValueError(f"Particionamento inválido: {self.partitioning} (use {', '.join(PARTITIONINGS)})")
+        if self._memory:
+            self.partitioning = "none"
+        self.partition_dir = self.config.get('partition_dir') or os.path.splitext(self.db_path)[0]
+        self._partitions_ready: Set[int] = set()
+            
+        # Conexão única de gravação; as de leitura são abertas por thread (ver conn)
+        self._write_lock = threading.RLock()
+        self._write_conn = self._connect(isolation_level=None, check_same_thread=False)
+        self._write_attached: "OrderedDict[int, None]" = OrderedDict()
+        self._local = threading.local()
+        self._readers: List[Tuple[threading.Thread, sqlite3.Connection]] = []
+        self._readers_lock = threading.Lock()
+        # Incrementado ao fechar as conexões de leitura: as threads reabrem a sua
+        self._readers_epoch = 0
         
-    def _create_tables(self):
-        """Cria as tabelas do banco de dados."""
-        cursor = self.conn.cursor()
+        # Cria ou atualiza o schema
+        self._migrate()
         
-        # Tabela de execuções
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS runs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                prompt TEXT NOT NULL,
-                format TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        # Banco em memória grava sempre de forma síncrona
+        if write_behind is None:
+            write_behind = self.config.get('write_behind', False)
+        self._writer: Optional[_WriteBehind] = None
+        if write_behind and not self._memory:
+            self._writer = _WriteBehind(
+                self._transaction,
+                batch_size=self.config.get('batch_size', DEFAULT_BATCH_SIZE),
+                flush_interval=self.config.get('flush_interval', DEFAULT_FLUSH_INTERVAL)
             )
-        """)
+        if retention is None:
+            retention = (self.config.get('retention') or {}).get('enabled', False)
+        self._retention = _start_retention(self) if retention and not self._memory else None
+        if self._writer is not None or self._retention is not None:
+            atexit.register(self.close)
+        logger.info(f"Banco de dados inicializado em {self.db_path}"
+                    f"{' [write-behind]' if self._writer else ''}"
+                    f"{f' [partições {self.partitioning} em {self.partition_dir}]' if self.partitioning != 'none' else ''}")
         
-        # Tabela de itens de execução
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS run_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                run_id INTEGER NOT NULL,
-                type TEXT NOT NULL,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (run_id) REFERENCES runs (id)
-            )
-        """)
+    def _connect(self, path: Optional[str] = None, **kwargs) -> sqlite3.Connection:
+        """Abre uma conexão (padrão: banco principal) com WAL e os pragmas configurados."""
+        conn = sqlite3.connect(path or self.db_path, timeout=self.busy_timeout / 1000, **kwargs)
+        conn.row_factory = sqlite3.Row
+        if not self._memory:
+            # Só tem efeito em um banco novo, antes do WAL gravar o cabeçalho (ver vacuum)
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.config.get('synchronous', DEFAULT_SYNCHRONOUS)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.config.get('mmap_size', DEFAULT_MMAP_SIZE))}")
+        return conn
         
-        # Tabela de resultados de guardrails
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS guardrail_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                run_id INTEGER NOT NULL,
-                type TEXT NOT NULL,
-                passed BOOLEAN NOT NULL,
-                error TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (run_id) REFERENCES runs (id)
-            )
-        """)
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """
+        Conexão de leitura da thread atual.
         
-        # Tabela de respostas brutas
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS raw_responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                run_id INTEGER NOT NULL,
-                response_id TEXT NOT NULL,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (run_id) REFERENCES runs (id)
-            )
-        """)
+        Banco em memória existe apenas na conexão que o criou: usa a de gravação.
+        """
+        if self._memory:
+            return self._write_conn
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.epoch != self._readers_epoch:
+            # Conexão substituída (partição removida): fecha a antiga na própria thread
+            with self._readers_lock:
+                self._readers = [r for r in self._readers if r[1] is not conn]
+            conn.close()
+            conn = None
+        if conn is None:
+            # uri=True: as partições são anexadas com "file:...?mode=ro"
+            conn = self._connect(check_same_thread=False, uri=True)
+            conn.execute("PRAGMA query_only = 1")
+            self._local.conn = conn
+            self._local.epoch = self._readers_epoch
+            self._local.attached = OrderedDict()
+            with self._readers_lock:
+                # Fecha as conexões de threads já encerradas
+                for thread, reader in [r for r in self._readers if not r[0].is_alive()]:
+                    reader.close()
+                self._readers = [r for r in self._readers if r[0].is_alive()]
+                self._readers.append((threading.current_thread(), conn))
+        return conn
         
-        # Tabela de cache de modelos
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS model_cache (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                model TEXT NOT NULL,
-                prompt TEXT NOT NULL,
-                response TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(model, prompt)
-            )
-        """)
+    @contextmanager
+    def _transaction(self, partitions: Iterable[int] = ()) -> Iterator[sqlite3.Connection]:
+        """
+        Transação de escrita na conexão de gravação, serializada entre as threads.
+        
+        Args:
+            partitions: Partições usadas na transação (criadas e anexadas antes do BEGIN)
+        
+        Yields:
+            Conexão de gravação (commit ao sair do bloco, rollback em exceções)
+        """
+        with self._write_lock:
+            conn = self._write_conn
+            self._attach(conn, self._write_attached, partitions, readonly=False)
+            with self._immediate(conn):
+                yield conn
+                
+    @contextmanager
+    def _immediate(self, conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+        """Transação BEGIN IMMEDIATE em uma conexão em modo autocommit."""
+        self._begin(conn)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+            
+    def _begin(self, conn: sqlite3.Connection) -> None:
+        """Inicia a transação com o lock de escrita, repetindo se o banco seguir ocupado após o busy_timeout."""
+        for attempt in range(self.busy_retries + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == self.busy_retries or not _is_busy_error(e):
+                    raise
+                delay = BUSY_RETRY_DELAY * 2 ** attempt
+                logger.warning(f"Banco {self.db_path} ocupado; nova tentativa em {delay:.2f}s "
+                               f"[{attempt + 1}/{self.busy_retries}]")
+                time.sleep(delay)
+        
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Aguarda a gravação dos registros enfileirados (write-behind).
+        
+        Args:
+            timeout: Tempo máximo de espera em segundos (opcional)
+            
+        Returns:
+            True se os registros estão gravados
+        """
+        if self._writer is None:
+            return True
+        return self._writer.flush(timeout)
         
-        self.conn.commit()
-        logger.info("Tabelas criadas/verificadas")
+    def close(self) -> None:
+        """Grava os registros pendentes, encerra a limpeza periódica e fecha as conexões."""
+        atexit.unregister(self.close)
+        if self._retention is not None:
+            self._retention.close()
+            with _retention_lock:
+                _retention_threads.pop(os.path.abspath(self.db_path), None)
+            self._retention = None
+        if self._writer is not None:
+            self._writer.close()
+        self._close_readers()
+        with self._write_lock:
+            self._write_conn.close()
+        
+    def _close_readers(self) -> None:
+        """Fecha as conexões de leitura de todas as threads."""
+        with self._readers_lock:
+            self._readers_epoch += 1
+            for _, reader in self._readers:
+                reader.close()
+            self._readers = []
+        
+    def _insert(self, template: str, params: Tuple[Any, ...], partition: int = 0) -> None:
+        """Insere um registro de execução (na fila de gravação ou com commit imediato)."""
+        sql = template.format(schema=self._schema(partition))
+        if self._writer is not None:
+            self._writer.insert(sql, params, partition)
+            return
+        with self._transaction([partition]) as conn:
+            conn.execute(sql, params)
+        
+    def _migrate(self) -> None:
+        """Cria ou atualiza o schema do banco principal."""
+        with self._write_lock:
+            self._apply_migrations(self._write_conn, MIGRATIONS, self.db_path)
+            
+    def _apply_migrations(self, conn: sqlite3.Connection,
+                          migrations: List[Tuple[str, Callable[[sqlite3.Connection], None]]], path: str) -> None:
+        """
+        Aplica as migrações pendentes (PRAGMA user_version), uma transação por versão.
+        
+        A versão é relida dentro da transação (BEGIN IMMEDIATE), de modo que processos
+        iniciados ao mesmo tempo não aplicam a mesma migração duas vezes.
+        
+        Args:
+            conn: Conexão em modo autocommit com o banco
+            migrations: Migrações do banco, em ordem
+            path: Caminho do banco (para os logs)
+        """
+        for version, (description, migrate) in enumerate(migrations, start=1):
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            try:
+                with self._immediate(conn):
+                    if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                        migrate(conn)
+                        conn.execute(f"PRAGMA user_version = {version}")
+                        logger.info(f"Migração {version} aplicada em {path}: {description}")
+            except Exception:
+                logger.error(f"FALHA - migração {version} ({description}) em {path}")
+                raise
+                
+    @staticmethod
+    def _schema(partition: int) -> str:
+        """Nome do banco anexado de uma partição ("main" para o banco principal)."""
+        return f"p{partition}" if partition else "main"
+        
+    @staticmethod
+    def partition_of(run_id: int) -> int:
+        """Partição de uma execução, pelo id (0 = banco principal)."""
+        return run_id // PARTITION_ID_SPAN
+        
+    def partition_path(self, partition: int) -> str:
+        """Arquivo de uma partição (0 = banco principal)."""
+        if not partition:
+            return self.db_path
+        return os.path.join(self.partition_dir, f"{partition_name(partition)}.db")
+        
+    def partitions(self) -> List[int]:
+        """
+        Partições existentes, incluindo as criadas por outros processos.
+        
+        Returns:
+            Chaves em ordem crescente, começando pelo banco principal (0)
+        """
+        keys = [0]
+        if not self._memory and os.path.isdir(self.partition_dir):
+            keys += sorted(key for key in map(_parse_partition_name, os.listdir(self.partition_dir)) if key)
+        return keys
+        
+    def _write_partition(self) -> int:
+        """Partição que recebe novas execuções (0 sem particionamento)."""
+        if self.partitioning == "none":
+            return 0
+        return partition_key(self.partitioning)
+        
+    def _ensure_partition(self, partition: int) -> None:
+        """Cria o arquivo da partição, se necessário, e aplica as suas migrações."""
+        if partition in self._partitions_ready:
+            return
+        path = self.partition_path(partition)
+        os.makedirs(self.partition_dir, exist_ok=True)
+        conn = self._connect(path, isolation_level=None)
+        try:
+            self._apply_migrations(conn, _partition_migrations(partition), path)
+        finally:
+            conn.close()
+        self._partitions_ready.add(partition)
+        
+    def _attach(self, conn: sqlite3.Connection, attached: "OrderedDict[int, None]",
+                partitions: Iterable[int], readonly: bool) -> None:
+        """
+        Anexa partições a uma conexão, desanexando as usadas há mais tempo acima de _MAX_ATTACHED.
+        
+        Fora de transação: ATTACH/DETACH não são permitidos dentro de uma.
+        
+        Args:
+            conn: Conexão
+            attached: Partições já anexadas à conexão (ordem de uso)
+            partitions: Partições necessárias
+            readonly: Anexa somente para leitura (partições inexistentes são ignoradas);
+                      caso contrário cria as que faltam
+        """
+        partitions = [p for p in partitions if p]
+        for partition in partitions:
+            if partition in attached:
+                attached.move_to_end(partition)
+                continue
+            path = self.partition_path(partition)
+            if readonly:
+                if not os.path.exists(path):
+                    continue
+                if partition not in self._partitions_ready:
+                    # Atualiza o schema de partições antigas (ex: sem busca textual) antes da leitura
+                    try:
+                        with self._write_lock:
+                            self._ensure_partition(partition)
+                    except sqlite3.Error as e:
+                        logger.warning(f"Partição {path} sem migrações pendentes aplicadas: {str(e)}")
+                target = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+            else:
+                self._ensure_partition(partition)
+                target = path
+            while len(attached) >= _MAX_ATTACHED:
+                victim = next((p for p in attached if p not in partitions), None)
+                if victim is None:
+                    break
+                conn.execute(f"DETACH DATABASE {self._schema(victim)}")
+                del attached[victim]
+            schema = self._schema(partition)
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (target,))
+            if readonly and conn.execute(f"PRAGMA {schema}.user_version").fetchone()[0] < 1:
+                # Partição recém-criada por outro processo, ainda sem as tabelas
+                conn.execute(f"DETACH DATABASE {schema}")
+                continue
+            conn.execute(f"PRAGMA {schema}.synchronous={self.config.get('synchronous', DEFAULT_SYNCHRONOUS)}")
+            conn.execute(f"PRAGMA {schema}.mmap_size={int(self.config.get('mmap_size', DEFAULT_MMAP_SIZE))}")
+            attached[partition] = None
+            
+    def _read_schema(self, partition: int) -> Optional[str]:
+        """
+        Anexa uma partição à conexão de leitura da thread.
+        
+        Returns:
+            Nome do banco anexado, ou None se a partição não existe
+        """
+        if not partition:
+            return "main"
+        conn = self.conn
+        if self._memory:
+            return None
+        self._attach(conn, self._local.attached, [partition], readonly=True)
+        return self._schema(partition) if partition in self._local.attached else None
         
     def get_cached_response(self, cache_key: str, ttl: int) -> Optional[Tuple[str, Dict[str, Any]]]:
         """
@@ -127,11 +1137,12 @@ class DatabaseManager:
             return None
             
         # Verifica TTL
-        timestamp = time.mktime(time.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S'))
+        # CURRENT_TIMESTAMP é gravado em UTC
+        timestamp = calendar.timegm(time.strptime(row['timestamp'], '%Y-%m-%d %H:%M:%S'))
         if time.time() - timestamp > ttl:
             # Remove resposta expirada
-            cursor.execute("DELETE FROM model_cache WHERE cache_key = ?", (cache_key,))
-            self.conn.commit()
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM model_cache WHERE cache_key = ?", (cache_key,))
             return None
             
         return json.loads(row['response']), json.loads(row['metadata'])
@@ -145,21 +1156,19 @@ class DatabaseManager:
             response: Resposta do modelo
             metadata: Metadados da resposta
         """
-        cursor = self.conn.cursor()
-        
-        # Remove entrada anterior se existir
-        cursor.execute("DELETE FROM model_cache WHERE cache_key = ?", (cache_key,))
-        
-        # Insere nova entrada
-        cursor.execute("""
-        INSERT INTO model_cache (cache_key, response, metadata)
-        VALUES (?, ?, ?)
-        """, (cache_key, json.dumps(response), json.dumps(metadata)))
-        
-        self.conn.commit()
+        with self._transaction() as conn:
+            # Remove entrada anterior se existir
+            conn.execute("DELETE FROM model_cache WHERE cache_key = ?", (cache_key,))
+            
+            # Insere nova entrada
+            conn.execute("""
+            INSERT INTO model_cache (cache_key, response, metadata)
+            VALUES (?, ?, ?)
+            """, (cache_key, json.dumps(response), json.dumps(metadata)))
         
     def log_run(self, session_id: str, input: str, final_output: Optional[str] = None,
-                last_agent: Optional[str] = None, output_type: Optional[str] = None) -> int:
+                last_agent: Optional[str] = None, output_type: Optional[str] = None,
+                stages: Optional[List[Dict[str, Any]]] = None) -> int:
         """
         Registra uma execução do agente.
         
@@ -169,35 +1178,38 @@ class DatabaseManager:
             final_output: Saída final
             last_agent: Último agente executado
             output_type: Tipo de saída
+            stages: Telemetria por etapa (AgentResult.raw_responses), gravada em run_stages
+                    e somada aos agregados de stage_rollups (opcional)
             
         Returns:
             ID da execução registrada
         """
-        cursor = self.conn.cursor()
-        
-        cursor.execute("""
-        INSERT INTO runs (session_id, prompt, format)
-        VALUES (?, ?, ?)
-        """, (session_id, input, output_type))
-        
-        run_id = cursor.lastrowid
-        
-        cursor.execute("""
-        INSERT INTO run_items (run_id, type, content)
-        VALUES (?, ?, ?)
-        """, (run_id, "input", input))
+        partition = self._write_partition()
+        schema = self._schema(partition)
+        run_sql = _INSERT_RUN.format(schema=schema)
+        rows = [
+            (_INSERT_RUN_ITEM.format(schema=schema), ("input", input)),
+            (_INSERT_GUARDRAIL.format(schema=schema), ("input", final_output is not None)),
+            (_INSERT_RAW_RESPONSE.format(schema=schema), ("input", json.dumps(final_output if final_output else {}, ensure_ascii=False)))
+        ]
+        stage_rows, rollups = _stage_rows(stages or [], time.strftime("%Y-%m-%d %H:00:00", time.gmtime()))
+        rows.extend((_INSERT_RUN_STAGE.format(schema=schema), params) for params in stage_rows)
         
-        cursor.execute("""
-        INSERT INTO guardrail_results (run_id, type, passed)
-        VALUES (?, ?, ?)
-        """, (run_id, "input", final_output is not None))
+        if self._writer is not None:
+            # O id é atribuído na transação do lote; os demais registros seguem na fila
+            run_id = self._writer.insert_returning_id(run_sql, (session_id, input, output_type), partition)
+            for sql, params in rows:
+                self._writer.insert(sql, (run_id, *params), partition)
+            for sql, params in rollups:
+                self._writer.insert(sql, params)
+            return run_id
         
-        cursor.execute("""
-        INSERT INTO raw_responses (run_id, response_id, content)
-        VALUES (?, ?, ?)
-        """, (run_id, "input", json.dumps(final_output if final_output else {})))
-        
-        self.conn.commit()
+        with self._transaction([partition]) as conn:
+            run_id = conn.execute(run_sql, (session_id, input, output_type)).lastrowid
+            for sql, params in rows:
+                conn.execute(sql, (run_id, *params))
+            for sql, params in rollups:
+                conn.execute(sql, params)
         return run_id
         
     def log_run_item(self, run_id: int, item_type: str, raw_item: Dict[str, Any],
@@ -212,14 +1224,7 @@ class DatabaseManager:
             source_agent: Agente de origem
             target_agent: Agente de destino
         """
-        cursor = self.conn.cursor()
-        
-        cursor.execute("""
-        INSERT INTO run_items (run_id, type, content)
-        VALUES (?, ?, ?)
-        """, (run_id, item_type, json.dumps(raw_item)))
-        
-        self.conn.commit()
+        self._insert(_INSERT_RUN_ITEM, (run_id, item_type, json.dumps(raw_item, ensure_ascii=False)), self.partition_of(run_id))
         
     def log_guardrail_results(self, run_id: int, guardrail_type: str, results: Dict[str, Any]):
         """
@@ -230,19 +1235,20 @@ class DatabaseManager:
             guardrail_type: Tipo do guardrail (input/output)
             results: Resultados do guardrail
         """
-        cursor = self.conn.cursor()
+        partition = self.partition_of(run_id)
+        schema = self._schema(partition)
+        rows = [
+            (_INSERT_GUARDRAIL.format(schema=schema), (run_id, guardrail_type, results["passed"])),
+            (_INSERT_RAW_RESPONSE.format(schema=schema), (run_id, guardrail_type, json.dumps(results, ensure_ascii=False)))
+        ]
+        if self._writer is not None:
+            for sql, params in rows:
+                self._writer.insert(sql, params, partition)
+            return
         
-        cursor.execute("""
-        INSERT INTO guardrail_results (run_id, type, passed)
-        VALUES (?, ?, ?)
-        """, (run_id, guardrail_type, results["passed"]))
-        
-        cursor.execute("""
-        INSERT INTO raw_responses (run_id, response_id, content)
-        VALUES (?, ?, ?)
-        """, (run_id, guardrail_type, json.dumps(results)))
-        
-        self.conn.commit()
+        with self._transaction([partition]) as conn:
+            for sql, params in rows:
+                conn.execute(sql, params)
         
     def log_raw_response(self, run_id: int, response: Union[Dict[str, Any], str]):
         """
@@ -252,89 +1258,124 @@ class DatabaseManager:
             run_id: ID da execução
             response: Resposta do modelo (string ou dict)
         """
-        cursor = self.conn.cursor()
-        
         # Se a resposta for uma string, converte para dict
         if isinstance(response, str):
             response_dict = {"text": response}
         else:
             response_dict = response
             
-        cursor.execute("""
-        INSERT INTO raw_responses (run_id, response_id, content)
-        VALUES (?, ?, ?)
-        """, (run_id, "output", json.dumps(response_dict)))
+        self._insert(_INSERT_RAW_RESPONSE, (run_id, "output", json.dumps(response_dict, ensure_ascii=False)), self.partition_of(run_id))
         
-        self.conn.commit()
+    def get_run(self, run_id: int) -> Optional[RunRecord]:
+        """
+        Obtém uma execução com seus itens, guardrails e respostas.
+        
+        Args:
+            run_id: ID da execução
+            
+        Returns:
+            RunRecord ou None se não encontrada
+        """
+        schema = self._read_schema(self.partition_of(run_id))
+        if schema is None:
+            return None
+        runs = self._attach_children([RunRecord.from_row(row) for row in
+                                      self.conn.execute(f"SELECT * FROM {schema}.runs WHERE id = ?", (run_id,))])
+        return runs[0] if runs else None
         
-    def get_run_history(self, limit: int = 10) -> List[Dict[str, Any]]:
+    def iter_runs(self, session_id: Optional[str] = None, since: Optional[str] = None,
+                  until: Optional[str] = None, format: Optional[str] = None,
+                  passed: Optional[bool] = None, before_id: Optional[int] = None,
+                  after_id: Optional[int] = None, page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[RunRecord]:
+        """
+        Percorre as execuções em páginas, com paginação por chave (id) e filtros no SQL.
+        
+        Cada página é uma consulta "id < cursor LIMIT page_size" (ou "id > cursor" com
+        after_id): a primeira página sai imediatamente e a memória usada não depende
+        do tamanho do histórico. Com particionamento, as partições são percorridas em
+        ordem (os ids crescem entre elas), ignorando as fora de since/until e do cursor.
+        
+        Args:
+            session_id: Sessão exata, ou padrão com * e ? (GLOB)
+            since: Data/hora mínima de created_at (UTC, "YYYY-MM-DD[ HH:MM:SS]")
+            until: Data/hora limite de created_at, exclusiva (UTC)
+            format: Formato de saída da execução (ex: "json")
+            passed: True para execuções sem guardrail reprovado, False para as com alguma reprovação
+            before_id: Apenas execuções com id menor, das mais recentes para as mais antigas (padrão)
+            after_id: Apenas execuções com id maior, das mais antigas para as mais recentes
+            page_size: Execuções lidas por consulta
+            
+        Yields:
+            RunRecord com seus itens, guardrails e respostas
+        """
+        conditions, params = [], []
+        if session_id:
+            conditions.append("session_id GLOB ?" if any(c in session_id for c in "*?[") else "session_id = ?")
+            params.append(session_id)
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("created_at < ?")
+            params.append(until)
+        if format:
+            conditions.append("format = ?")
+            params.append(format)
+        if passed is not None:
+            conditions.append(f"{'NOT ' if passed else ''}EXISTS (SELECT 1 FROM {{schema}}.guardrail_results g "
+                              f"WHERE g.run_id = runs.id AND NOT g.passed)")
+        
+        ascending = after_id is not None
+        cursor = after_id if ascending else before_id
+        partitions = self.partitions()
+        if cursor is not None:
+            last = self.partition_of(cursor)
+            partitions = [p for p in partitions if (p >= last if ascending else p <= last)]
+        if not ascending:
+            partitions.reverse()
+        for partition in partitions:
+            if partition:
+                start, end = partition_range(partition)
+                if (since and end <= since) or (until and start >= until):
+                    continue
+            while True:
+                schema = self._read_schema(partition)
+                if schema is None:
+                    break
+                page_conditions, page_params = [c.format(schema=schema) for c in conditions], list(params)
+                if cursor is not None:
+                    page_conditions.append("id > ?" if ascending else "id < ?")
+                    page_params.append(cursor)
+                where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ""
+                rows = self.conn.execute(
+                    f"SELECT * FROM {schema}.runs AS runs {where} ORDER BY id {'ASC' if ascending else 'DESC'} LIMIT ?",
+                    (*page_params, page_size)
+                ).fetchall()
+                if not rows:
+                    break
+                yield from self._attach_children([RunRecord.from_row(row) for row in rows])
+                cursor = rows[-1]['id']
+                if len(rows) < page_size:
+                    break
+        
+    def get_run_history(self, limit: int = 10, **filters) -> List[RunRecord]:
         """
         Obtém o histórico de execuções.
         
         Args:
             limit: Limite de registros a retornar
+            **filters: Filtros e cursores de iter_runs (session_id, since, until, format, passed, before_id, after_id)
             
         Returns:
-            Lista de execuções com seus itens e resultados
+            Execuções mais recentes primeiro, com seus itens, guardrails e respostas
         """
         try:
-            cursor = self.conn.cursor()
-            
-            cursor.execute("""
-            SELECT 
-                r.id,
-                r.session_id,
-                r.prompt,
-                r.format,
-                r.created_at,
-                GROUP_CONCAT(DISTINCT i.content) as items,
-                GROUP_CONCAT(DISTINCT g.type || ':' || g.passed) as guardrails,
-                GROUP_CONCAT(DISTINCT rr.content) as responses
-            FROM runs r
-            LEFT JOIN run_items i ON i.run_id = r.id
-            LEFT JOIN guardrail_results g ON g.run_id = r.id
-            LEFT JOIN raw_responses rr ON rr.run_id = r.id
-            GROUP BY r.id
-            ORDER BY r.created_at DESC
-            LIMIT ?
-            """, (limit,))
-            
-            runs = []
-            for row in cursor.fetchall():
-                run = dict(row)
-                
-                # Processa itens
-                items = []
-                if run["items"]:
-                    items = [{"content": item} for item in run["items"].split(",")]
-                run["items"] = items
-                
-                # Processa guardrails
-                guardrails = []
-                if run["guardrails"]:
-                    for g in run["guardrails"].split(","):
-                        type_, passed = g.split(":")
-                        guardrails.append({
-                            "type": type_,
-                            "passed": passed == "1"
-                        })
-                run["guardrails"] = guardrails
-                
-                # Processa respostas
-                responses = []
-                if run["responses"]:
-                    responses = [json.loads(r) for r in run["responses"].split(",")]
-                run["responses"] = responses
-                
-                runs.append(run)
-                
-            return runs
-            
+            return list(islice(self.iter_runs(page_size=min(limit, DEFAULT_PAGE_SIZE) or 1, **filters), limit))
         except sqlite3.Error as e:
             logger.error(f"FALHA - get_run_history | Erro: {str(e)}")
             raise
 
-    def get_runs(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    def get_runs(self, limit: Optional[int] = None) -> List[RunRecord]:
         """
         Lista execuções registradas.
 
@@ -342,40 +1383,477 @@ class DatabaseManager:
             limit: Limite de registros
 
         Returns:
-            Lista de execuções
+            Execuções mais recentes primeiro, com seus itens, guardrails e respostas
         """
-        cursor = self.conn.cursor()
+        if limit is None:
+            return list(self.iter_runs())
+        return self.get_run_history(limit)
 
-        # Monta SQL base
-        sql = """
-        SELECT r.*, i.content as raw_item, g.content as guardrail_results, rr.content as raw_response
-        FROM runs r
-        LEFT JOIN run_items i ON r.id = i.run_id
-        LEFT JOIN guardrail_results g ON r.id = g.run_id
-        LEFT JOIN raw_responses rr ON r.id = rr.run_id
+    def search(self, query: str, limit: int = 20, offset: int = 0, session_id: Optional[str] = None,
+               since: Optional[str] = None, until: Optional[str] = None, raw: bool = False) -> List[SearchHit]:
         """
+        Busca execuções pelo texto do prompt, dos itens e das respostas brutas (FTS5).
+        
+        Cada execução aparece uma vez, com a pontuação (bm25, menor = mais relevante) e o
+        trecho do seu registro mais relevante. Com particionamento, cada partição no
+        intervalo since/until devolve os seus offset + limit melhores resultados, que são
+        então ordenados em conjunto.
+        
+        Args:
+            query: Termos buscados (todos obrigatórios; "termo*" busca por prefixo)
+            limit: Resultados por página
+            offset: Resultados ignorados (página * limit)
+            session_id: Sessão exata, ou padrão com * e ? (GLOB)
+            since: Data/hora mínima de created_at da execução (UTC)
+            until: Data/hora limite de created_at, exclusiva (UTC)
+            raw: Usa query como consulta FTS5 (operadores OR, NOT, NEAR, "frase", coluna:)
+            
+        Returns:
+            Resultados em ordem de relevância, com a execução (e seus registros) em SearchHit.run
+        """
+        match = query if raw else fts_query(query)
+        if not match or limit <= 0:
+            return []
+        conditions, params = [], []
+        if session_id:
+            conditions.append("r.session_id GLOB ?" if any(c in session_id for c in "*?[") else "r.session_id = ?")
+            params.append(session_id)
+        if since:
+            conditions.append("r.created_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("r.created_at < ?")
+            params.append(until)
+        filters = "".join(f" AND {condition}" for condition in conditions)
+        
+        hits: List[SearchHit] = []
+        for partition in self.partitions():
+            if partition:
+                start, end = partition_range(partition)
+                if (since and end <= since) or (until and start >= until):
+                    continue
+            schema = self._read_schema(partition)
+            if schema is None or not self.conn.execute(
+                    f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'runs_fts'").fetchone():
+                continue
+            selects = []
+            for fts, table, column, source in _SEARCH_INDEXES:
+                run_id = "r.id" if table == "runs" else "t.run_id"
+                join = "" if table == "runs" else f" JOIN {schema}.runs r ON r.id = t.run_id"
+                alias = "r" if table == "runs" else "t"
+                selects.append(
+                    f"SELECT {run_id} AS run_id, bm25({fts}) AS score, '{source}' AS source, "
+                    f"snippet({fts}, 0, ?, ?, '…', 16) AS snippet "
+                    f"FROM {schema}.{fts} JOIN {schema}.{table} {alias} ON {alias}.id = {fts}.rowid{join} "
+                    f"WHERE {fts} MATCH ?{filters}"
+                )
+            sql = (f"SELECT run_id, MIN(score) AS score, source, snippet FROM ({' UNION ALL '.join(selects)}) "
+                   f"GROUP BY run_id ORDER BY score LIMIT ?")
+            args = [*SNIPPET_MARKERS, match, *params] * len(_SEARCH_INDEXES) + [offset + limit]
+            try:
+                rows = self.conn.execute(sql, args).fetchall()
+            except sqlite3.OperationalError as e:
+                if "fts5" in str(e) or "syntax" in str(e):
+                    raise ValueError(f"Consulta de busca inválida: {query}") from e
+                raise
+            hits.extend(SearchHit(row['run_id'], row['score'], row['source'], row['snippet']) for row in rows)
+            
+        hits.sort(key=lambda hit: (hit.score, -hit.run_id))
+        hits = hits[offset:offset + limit]
+        runs = {run.id: run for run in self._load_runs([hit.run_id for hit in hits])}
+        for hit in hits:
+            hit.run = runs.get(hit.run_id)
+        return hits
+        
+    def _load_runs(self, run_ids: List[int]) -> List[RunRecord]:
+        """Carrega execuções pelo id (em qualquer partição), com seus registros filhos."""
+        by_partition: Dict[int, List[int]] = {}
+        for run_id in run_ids:
+            by_partition.setdefault(self.partition_of(run_id), []).append(run_id)
+        runs = []
+        for partition, ids in by_partition.items():
+            schema = self._read_schema(partition)
+            if schema is None:
+                continue
+            for start in range(0, len(ids), _MAX_QUERY_PARAMS):
+                chunk = ids[start:start + _MAX_QUERY_PARAMS]
+                marks = ", ".join("?" * len(chunk))
+                runs.extend(RunRecord.from_row(row) for row in
+                            self.conn.execute(f"SELECT * FROM {schema}.runs WHERE id IN ({marks})", chunk))
+        return self._attach_children(runs)
+        
+    def _attach_children(self, runs: List[RunRecord]) -> List[RunRecord]:
+        """
+        Carrega os itens, guardrails e respostas de um conjunto de execuções.
+        
+        Cada tabela filha é lida uma única vez, por run_id (índice), em vez de juntá-las
+        na mesma consulta: o custo cresce com o número de registros, não com o seu produto.
+        
+        Args:
+            runs: Execuções sem os registros filhos
+            
+        Returns:
+            As mesmas execuções, na mesma ordem
+        """
+        if not runs:
+            return runs
+        by_id = {run.id: run for run in runs}
+        by_partition: Dict[int, List[int]] = {}
+        for run_id in by_id:
+            by_partition.setdefault(self.partition_of(run_id), []).append(run_id)
+        for partition, ids in by_partition.items():
+            schema = self._read_schema(partition)
+            if schema is None:
+                continue
+            for start in range(0, len(ids), _MAX_QUERY_PARAMS):
+                chunk = ids[start:start + _MAX_QUERY_PARAMS]
+                marks = ", ".join("?" * len(chunk))
+                for row in self.conn.execute(
+                        f"SELECT * FROM {schema}.run_items WHERE run_id IN ({marks}) ORDER BY id", chunk):
+                    by_id[row['run_id']].items.append(RunItemRecord.from_row(row))
+                for row in self.conn.execute(
+                        f"SELECT * FROM {schema}.guardrail_results WHERE run_id IN ({marks}) ORDER BY id", chunk):
+                    by_id[row['run_id']].guardrails.append(GuardrailRecord.from_row(row))
+                for row in self.conn.execute(
+                        f"SELECT * FROM {schema}.raw_responses WHERE run_id IN ({marks}) ORDER BY id", chunk):
+                    by_id[row['run_id']].responses.append(RawResponseRecord.from_row(row))
+                for row in self.conn.execute(
+                        f"SELECT * FROM {schema}.run_stages WHERE run_id IN ({marks}) ORDER BY id", chunk):
+                    by_id[row['run_id']].stages.append(StageRecord.from_row(row))
+        return runs
 
-        # Adiciona ordenação e limite
-        sql += " ORDER BY r.created_at DESC"
-        if limit is not None:
-            sql += " LIMIT ?"
-            cursor.execute(sql, (limit,))
+    def get_stage_rollups(self, since: Optional[str] = None, until: Optional[str] = None,
+                          group_by: Iterable[str] = STAGE_ROLLUP_GROUPS, model: Optional[str] = None,
+                          guardrail: Optional[str] = None) -> List[StageRollup]:
+        """
+        Agregados da telemetria por etapa, sem consultar os registros de run_stages.
+        
+        As horas de stage_rollups são somadas pelas colunas de group_by (os histogramas
+        de latência também, de modo que p50/p95 valem para o grupo inteiro).
+        
+        Args:
+            since: Hora mínima (UTC, "YYYY-MM-DD HH:00:00"; comparada com o início da hora)
+            until: Hora limite, exclusiva (UTC)
+            group_by: Colunas de agrupamento, entre "hour", "model" e "guardrail"
+                      (vazio: um único total)
+            model: Modelo exato (opcional)
+            guardrail: Guardrail exato (opcional)
+            
+        Returns:
+            StageRollup por grupo, em ordem das colunas de group_by
+            
+        Raises:
+            ValueError: Coluna de agrupamento inválida
+        """
+        group_by = list(group_by)
+        invalid = [column for column in group_by if column not in STAGE_ROLLUP_GROUPS]
+        if invalid:
+            raise ValueError(f"Agrupamento inválido: {', '.join(invalid)} (use {', '.join(STAGE_ROLLUP_GROUPS)})")
+        conditions, params = [], []
+        for column, operator, value in (("hour", ">=", since), ("hour", "<", until),
+                                        ("model", "=", model), ("guardrail", "=", guardrail)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        groups = ", ".join(group_by)
+        buckets = ", ".join(f"SUM(lat_{bucket}) AS lat_{bucket}" for bucket in range(len(LATENCY_BUCKETS_MS) + 1))
+        rows = self.conn.execute(f"""
+            SELECT {groups + ',' if groups else ''}
+                   SUM(count) AS count, SUM(errors) AS errors, SUM(cache_hits) AS cache_hits,
+                   SUM(tokens) AS tokens, SUM(latency_ms_sum) AS latency_ms_sum,
+                   MIN(latency_ms_min) AS latency_ms_min, MAX(latency_ms_max) AS latency_ms_max, {buckets}
+            FROM main.stage_rollups {where}
+            {f'GROUP BY {groups} ORDER BY {groups}' if groups else ''}
+        """, params).fetchall()
+        return [StageRollup.from_row(row, group_by) for row in rows if row['count']]
+        
+    def prune(self, policies: Optional[Dict[str, Dict[str, Any]]] = None,
+              stop: Optional[threading.Event] = None) -> Dict[str, int]:
+        """
+        Remove os registros fora da política de retenção de cada tabela.
+        
+        A remoção segue a ordem de inserção (id), em lotes de uma transação curta cada,
+        com uma pausa entre eles para que as gravações de execução não aguardem a limpeza.
+        Execuções removidas levam junto seus itens, guardrails, respostas e etapas.
+        
+        Args:
+            policies: {tabela: {"max_age_days": N, "max_rows": N}}
+                      (padrão: database.retention.tables do kernel.yaml)
+            stop: Evento que interrompe a limpeza entre lotes (opcional)
+            
+        Returns:
+            Registros removidos por tabela
+        """
+        retention = self.config.get('retention') or {}
+        if policies is None:
+            policies = retention.get('tables') or {}
+        batch_size = min(max(1, retention.get('batch_size', DEFAULT_PRUNE_BATCH_SIZE)), _MAX_QUERY_PARAMS)
+        pause = retention.get('batch_pause', DEFAULT_PRUNE_PAUSE)
+        
+        removed = {}
+        for table, policy in policies.items():
+            if table not in _RETENTION_COLUMNS:
+                logger.warning(f"Política de retenção ignorada: tabela desconhecida {table}")
+                continue
+            if stop is not None and stop.is_set():
+                break
+            removed[table] = self._prune_table(table, policy or {}, batch_size, pause, stop)
+        if any(removed.values()):
+            logger.info(f"Retenção em {self.db_path}: " + ", ".join(f"{t}={n}" for t, n in removed.items()))
+        return removed
+        
+    def _prune_table(self, table: str, policy: Dict[str, Any], batch_size: int, pause: float,
+                     stop: Optional[threading.Event]) -> int:
+        """
+        Remove em lotes os registros mais antigos de uma tabela além de max_age_days ou max_rows.
+        
+        Com particionamento, a política de runs remove de uma vez os arquivos das partições
+        inteiramente fora dela; as demais partições são limpas registro a registro.
+        
+        Returns:
+            Registros removidos (sem contar os filhos de execuções)
+        """
+        max_age_days = policy.get('max_age_days')
+        max_rows = policy.get('max_rows')
+        if max_age_days is None and max_rows is None:
+            return 0
+        # Datas gravadas por CURRENT_TIMESTAMP (UTC), comparáveis como texto
+        cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - max_age_days * 86400)) if max_age_days is not None else None
+        partitions = self.partitions() if table in _RUN_TABLES else [0]
+        last_id = self._nth_newest_id(table, max_rows, partitions) if max_rows is not None else None
+        if cutoff is None and last_id is None:
+            return 0
+            
+        removed = 0
+        for partition in partitions:
+            if stop is not None and stop.is_set():
+                break
+            if partition and table == "runs":
+                start, end = partition_range(partition)
+                if ((cutoff is not None and end <= cutoff)
+                        or (last_id is not None and (partition + 1) * PARTITION_ID_SPAN <= last_id + 1)):
+                    removed += self.drop_partition(partition)
+                    continue
+            removed += self._prune_rows(table, partition, cutoff, last_id, batch_size, pause, stop)
+        return removed
+        
+    def _nth_newest_id(self, table: str, n: int, partitions: List[int]) -> Optional[int]:
+        """Id do registro seguinte aos n mais recentes da tabela (None se há até n registros)."""
+        remaining = n
+        for partition in reversed(partitions):
+            schema = self._read_schema(partition)
+            if schema is None:
+                continue
+            row = self.conn.execute(f"SELECT id FROM {schema}.{table} ORDER BY id DESC LIMIT 1 OFFSET ?",
+                                    (remaining,)).fetchone()
+            if row:
+                return row[0]
+            remaining -= self.conn.execute(f"SELECT COUNT(*) FROM {schema}.{table}").fetchone()[0]
+        return None
+        
+    def _prune_rows(self, table: str, partition: int, cutoff: Optional[str], last_id: Optional[int],
+                    batch_size: int, pause: float, stop: Optional[threading.Event]) -> int:
+        """Remove em lotes, na ordem de inserção, os registros de uma partição anteriores a cutoff ou last_id."""
+        schema = self._schema(partition)
+        column = _RETENTION_COLUMNS[table]
+        removed = 0
+        while stop is None or not stop.is_set():
+            with self._transaction([partition]) as conn:
+                ids = []
+                for row_id, created_at in conn.execute(f"SELECT id, {column} FROM {schema}.{table} ORDER BY id LIMIT ?",
+                                                       (batch_size,)):
+                    if not ((last_id is not None and row_id <= last_id)
+                            or (cutoff is not None and created_at is not None and created_at < cutoff)):
+                        break
+                    ids.append(row_id)
+                if ids:
+                    marks = ", ".join("?" * len(ids))
+                    if table == "runs":
+                        for child in _RUN_CHILD_TABLES:
+                            conn.execute(f"DELETE FROM {schema}.{child} WHERE run_id IN ({marks})", ids)
+                    conn.execute(f"DELETE FROM {schema}.{table} WHERE id IN ({marks})", ids)
+            removed += len(ids)
+            if len(ids) < batch_size:
+                break
+            if stop is not None:
+                stop.wait(pause)
+            else:
+                time.sleep(pause)
+        return removed
+        
+    def drop_partition(self, partition: int) -> int:
+        """
+        Remove o arquivo de uma partição.
+        
+        Processos que ainda tenham a partição anexada continuam lendo o arquivo até
+        desanexá-lo; gravações tardias nela são descartadas com o arquivo.
+        
+        Args:
+            partition: Chave da partição (o banco principal não pode ser removido)
+            
+        Returns:
+            Execuções removidas
+        """
+        if not partition:
+            raise ValueError("O banco principal não é uma partição")
+        schema = self._read_schema(partition)
+        if schema is None:
+            return 0
+        runs = self.conn.execute(f"SELECT COUNT(*) FROM {schema}.runs").fetchone()[0]
+        self.flush()
+        with self._write_lock:
+            if partition in self._write_attached:
+                self._write_conn.execute(f"DETACH DATABASE {schema}")
+                del self._write_attached[partition]
+            self._partitions_ready.discard(partition)
+            # Cada thread reabre a sua conexão de leitura (sem a partição) no próximo acesso
+            with self._readers_lock:
+                self._readers_epoch += 1
+            path = self.partition_path(partition)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        logger.info(f"Partição {partition_name(partition)} removida ({runs} execuções): {path}")
+        return runs
+        
+    def count(self, table: str, partition: Optional[int] = None) -> int:
+        """
+        Total de registros de uma tabela, somando as partições.
+        
+        Args:
+            table: Tabela (ex: "runs")
+            partition: Conta apenas uma partição (0 = banco principal; opcional)
+            
+        Returns:
+            Número de registros
+        """
+        if partition is not None:
+            partitions = [partition]
         else:
-            cursor.execute(sql)
-
-        # Processa resultados
-        runs = []
-        for row in cursor.fetchall():
-            run = dict(row)
+            partitions = self.partitions() if table in _RUN_TABLES else [0]
+        total = 0
+        for partition in partitions:
+            schema = self._read_schema(partition)
+            if schema is not None:
+                total += self.conn.execute(f"SELECT COUNT(*) FROM {schema}.{table}").fetchone()[0]
+        return total
+        
+    def incremental_vacuum(self, pages: Optional[int] = None) -> int:
+        """
+        Devolve ao sistema páginas livres deixadas pela remoção de registros.
+        
+        Requer auto_vacuum=INCREMENTAL, ativo em bancos criados a partir desta versão
+        (bancos anteriores precisam de um vacuum() completo).
+        
+        Args:
+            pages: Máximo de páginas liberadas por arquivo (padrão: database.retention.vacuum_pages)
             
-            # Converte strings JSON
-            if run["raw_item"]:
-                run["raw_item"] = json.loads(run["raw_item"])
-            if run["guardrail_results"]:
-                run["guardrail_results"] = json.loads(run["guardrail_results"])
-            if run["raw_response"]:
-                run["raw_response"] = json.loads(run["raw_response"])
+        Returns:
+            Páginas liberadas
+        """
+        if self._memory:
+            return 0
+        if pages is None:
+            pages = (self.config.get('retention') or {}).get('vacuum_pages', DEFAULT_VACUUM_PAGES)
+        freed = 0
+        for partition in self.partitions():
+            schema = self._schema(partition)
+            with self._write_lock:
+                conn = self._write_conn
+                self._attach(conn, self._write_attached, [partition], readonly=False)
+                if conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] != 2:
+                    continue
+                free = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+                if not free:
+                    continue
+                # execute() avança o pragma um único passo (uma página); executescript o executa até o fim
+                conn.executescript(f"PRAGMA {schema}.incremental_vacuum({int(pages)});")
+                freed += free - conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+                # O arquivo só diminui no checkpoint do WAL; PASSIVE não espera leitores nem gravadores
+                conn.execute(f"PRAGMA {schema}.wal_checkpoint(PASSIVE)").fetchall()
+        if freed:
+            logger.info(f"incremental_vacuum em {self.db_path}: {freed} páginas liberadas")
+        return freed
+        
+    def vacuum(self) -> None:
+        """
+        Reescreve o banco e as partições (VACUUM) e ativa o auto_vacuum incremental.
+        
+        Bloqueia as gravações durante a execução: use apenas em manutenção
+        (make db-prune ARGS="--full-vacuum").
+        """
+        self.flush()
+        with self._write_lock:
+            conn = self._write_conn
+            for partition in self.partitions():
+                schema = self._schema(partition)
+                self._attach(conn, self._write_attached, [partition], readonly=False)
+                if self._memory or conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] == 2:
+                    conn.execute(f"VACUUM {schema}")
+                    continue
+                # auto_vacuum só muda com VACUUM fora do modo WAL, o que exige
+                # que nenhuma outra conexão (inclusive as de leitura) esteja aberta
+                self._close_readers()
+                conn.execute(f"PRAGMA {schema}.journal_mode=DELETE")
+                try:
+                    conn.execute(f"PRAGMA {schema}.auto_vacuum=INCREMENTAL")
+                    conn.execute(f"VACUUM {schema}")
+                finally:
+                    conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+        logger.info(f"VACUUM concluído em {self.db_path}")
+        
+    def backup(self, dest_path: Optional[str] = None) -> str:
+        """
+        Copia o banco com a API de backup do SQLite.
+        
+        Cada arquivo é copiado em uma única transação de leitura (snapshot consistente,
+        sem bloquear o gravador no modo WAL), em um arquivo temporário renomeado ao final.
+        As partições vão para um diretório com o nome do backup (<destino sem .db>/2024-05.db).
+        
+        Args:
+            dest_path: Arquivo de destino (padrão: <backup_dir>/<nome>_<data>.db)
             
-            runs.append(run)
-
-        return runs
\ No newline at end of file
+        Returns:
+            Caminho do backup do banco principal
+        """
+        if dest_path is None:
+            stem = os.path.splitext(os.path.basename(self.db_path))[0] if not self._memory else "memory"
+            dest_path = os.path.join(self.config.get('backup_dir', DEFAULT_BACKUP_DIR),
+                                     f"{stem}_{time.strftime('%Y%m%d_%H%M%S')}.db")
+        
+        # Inclui os registros ainda na fila de gravação
+        self.flush()
+        for partition in self.partitions():
+            if not partition:
+                self._backup_file(self.db_path, dest_path)
+            else:
+                self._backup_file(self.partition_path(partition),
+                                  os.path.join(os.path.splitext(dest_path)[0], f"{partition_name(partition)}.db"))
+        logger.info(f"Backup de {self.db_path} criado em {dest_path}")
+        return dest_path
+        
+    def _backup_file(self, source_path: str, dest_path: str) -> None:
+        """Copia um arquivo do banco (principal ou partição) com a API de backup."""
+        if os.path.dirname(dest_path):
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = f"{dest_path}.tmp"
+        dest = sqlite3.connect(tmp_path)
+        try:
+            if self._memory:
+                with self._write_lock:
+                    self._write_conn.backup(dest)
+            else:
+                source = self._connect(source_path)
+                try:
+                    source.backup(dest)
+                finally:
+                    source.close()
+            # Arquivo único, sem -wal/-shm
+            dest.execute("PRAGMA journal_mode=DELETE")
+        except Exception:
+            dest.close()
+            os.remove(tmp_path)
+            raise
+        dest.close()
+        os.replace(tmp_path, dest_path)
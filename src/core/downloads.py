@@ -0,0 +1,409 @@
+"""
+# src/core/downloads.py
+Download de arquivos grandes (modelos GGUF) com múltiplas conexões HTTP Range,
+retomada a partir de arquivo .part e verificação SHA-256.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Valores padrão (sobrescritos pela seção models.downloads do kernel.yaml)
+DEFAULT_CONNECTIONS = 4
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+DEFAULT_MIN_SEGMENT_SIZE = 64 * 1024 * 1024
+# Intervalo mínimo entre gravações do estado de retomada (segundos)
+STATE_SAVE_INTERVAL = 2.0
+
+class DownloadError(Exception):
+    """Erro de download ou de verificação de integridade."""
+
+@dataclass
+class Segment:
+    """Faixa de bytes baixada por uma conexão."""
+    start: int
+    end: int  # inclusivo
+    done: int = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.start + self.done > self.end
+
+@dataclass
+class DownloadState:
+    """Estado persistido ao lado do arquivo .part para permitir retomada."""
+    url: str
+    size: Optional[int]
+    segments: List[Segment] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["DownloadState"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(
+                url=data["url"],
+                size=data["size"],
+                segments=[Segment(**segment) for segment in data["segments"]]
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+        os.replace(tmp_path, path)
+
+    @property
+    def downloaded(self) -> int:
+        return sum(segment.done for segment in self.segments)
+
+class OrderedHasher:
+    """
+    SHA-256 de um download em faixas, calculado em ordem enquanto as faixas chegam.
+
+    Os bytes gravados exatamente na posição do hash entram direto da memória; os de
+    faixas adiantadas (ou já presentes em uma retomada) são lidos do `.part` por uma
+    thread, assim que ficam contíguos ao que já foi processado. Ao fim do download
+    resta apenas o trecho que a thread ainda não alcançou, e não uma segunda leitura
+    do arquivo inteiro.
+    """
+
+    def __init__(self, part_path: str, segments: List[Segment], chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Inicializa o hash e inicia a thread de leitura.
+
+        Args:
+            part_path: Arquivo .part do download
+            segments: Faixas do download (contíguas, cobrindo o arquivo inteiro)
+            chunk_size: Tamanho das leituras do arquivo em bytes
+        """
+        self.part_path = part_path
+        self.segments = sorted(segments, key=lambda segment: segment.start)
+        self.chunk_size = chunk_size
+        self.position = 0
+        self._hasher = hashlib.sha256()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._drain = True
+        self._error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, name="download-hash", daemon=True)
+        self._thread.start()
+
+    def feed(self, offset: int, data: bytes) -> None:
+        """Informa um bloco já gravado no `.part` (e contabilizado em sua faixa)."""
+        with self._cond:
+            if offset == self.position:
+                self._hasher.update(data)
+                self.position += len(data)
+            else:
+                self._cond.notify()
+
+    def finish(self) -> str:
+        """
+        Aguarda o processamento dos bytes restantes.
+
+        Returns:
+            Digest SHA-256 em hexadecimal
+        """
+        self.close(drain=True)
+        if self._error:
+            raise DownloadError(f"Falha ao calcular o SHA-256 de {self.part_path}: {self._error}")
+        return self._hasher.hexdigest()
+
+    def close(self, drain: bool = False) -> None:
+        """
+        Encerra a thread.
+
+        Args:
+            drain: Se processa antes os bytes contíguos já disponíveis
+        """
+        with self._cond:
+            self._stopping = True
+            self._drain = drain
+            self._cond.notify()
+        self._thread.join()
+
+    def _available(self) -> int:
+        """Fim do trecho contíguo já gravado, a partir do início do arquivo."""
+        end = 0
+        for segment in self.segments:
+            end = segment.start + segment.done
+            if not segment.complete:
+                break
+        return end
+
+    def _run(self) -> None:
+        try:
+            with open(self.part_path, "rb") as f:
+                while True:
+                    with self._cond:
+                        while self.position >= self._available() and not self._stopping:
+                            self._cond.wait(STATE_SAVE_INTERVAL)
+                        start = self.position
+                        end = min(self._available(), start + self.chunk_size)
+                        if start >= end or (self._stopping and not self._drain):
+                            return
+                    f.seek(start)
+                    data = f.read(end - start)
+                    with self._cond:
+                        if self.position == start:
+                            self._hasher.update(data)
+                            self.position += len(data)
+        except OSError as e:
+            self._error = e
+
+class RangeDownloader:
+    """
+    Baixa um arquivo com conexões paralelas e retomada.
+
+    O conteúdo é gravado em `<destino>.part` e o progresso de cada faixa em
+    `<destino>.part.json`. O arquivo final só aparece (via rename atômico) depois
+    de verificado, então um download interrompido nunca é confundido com um modelo válido.
+    """
+
+    def __init__(self, connections: int = DEFAULT_CONNECTIONS, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 timeout: int = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 min_segment_size: int = DEFAULT_MIN_SEGMENT_SIZE, session: Optional[requests.Session] = None):
+        """
+        Inicializa o downloader.
+
+        Args:
+            connections: Número máximo de conexões simultâneas por arquivo
+            chunk_size: Tamanho do buffer de leitura/escrita em bytes
+            timeout: Timeout de conexão/leitura em segundos
+            retries: Tentativas por faixa antes de desistir
+            min_segment_size: Tamanho mínimo de cada faixa em bytes
+            session: Sessão HTTP (opcional)
+        """
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.retries = max(1, retries)
+        self.min_segment_size = max(1, min_segment_size)
+        self.session = session or requests.Session()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> "RangeDownloader":
+        """
+        Cria o downloader a partir da seção models.downloads do kernel.yaml.
+
+        Args:
+            config: Configuração de downloads (opcional)
+
+        Returns:
+            RangeDownloader configurado
+        """
+        config = config or {}
+        return cls(
+            connections=config.get('connections', DEFAULT_CONNECTIONS),
+            chunk_size=config.get('chunk_size', DEFAULT_CHUNK_SIZE),
+            timeout=config.get('timeout', DEFAULT_TIMEOUT),
+            retries=config.get('retries', DEFAULT_RETRIES),
+            min_segment_size=config.get('min_segment_size', DEFAULT_MIN_SEGMENT_SIZE)
+        )
+
+    def download(self, url: str, dest_path: str, sha256: Optional[str] = None) -> str:
+        """
+        Baixa `url` para `dest_path`, retomando um download anterior se possível.
+
+        Args:
+            url: URL do arquivo
+            dest_path: Caminho final do arquivo
+            sha256: Digest SHA-256 esperado (opcional)
+
+        Returns:
+            Digest SHA-256 do arquivo baixado
+
+        Raises:
+            DownloadError: Se o download falhar ou o digest não conferir
+        """
+        part_path = f"{dest_path}.part"
+        state_path = f"{part_path}.json"
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+
+        size, accepts_ranges = self._probe(url)
+        logger.info(f"INÍCIO - download | url={url}, tamanho={size}, ranges={accepts_ranges}")
+        start = time.perf_counter()
+
+        if size and accepts_ranges:
+            state = self._load_or_create_state(url, size, part_path, state_path)
+            hasher = OrderedHasher(part_path, state.segments, self.chunk_size)
+            try:
+                self._download_segments(url, part_path, state, state_path, hasher)
+            except BaseException:
+                hasher.close(drain=False)
+                raise
+            digest = hasher.finish()
+        else:
+            digest = self._download_stream(url, part_path, state_path, accepts_ranges)
+
+        if sha256 and digest.lower() != sha256.lower():
+            self._discard(part_path, state_path)
+            raise DownloadError(f"SHA-256 divergente para {url}: esperado {sha256}, obtido {digest}")
+
+        os.replace(part_path, dest_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"FIM - download | {dest_path} [{os.path.getsize(dest_path)} bytes em {elapsed:.1f}s, sha256={digest}]")
+        return digest
+
+    def _probe(self, url: str):
+        """Obtém o tamanho do arquivo e se o servidor aceita requisições Range."""
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            if response.status_code >= 400:
+                return None, False
+            size = response.headers.get("Content-Length")
+            accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            return (int(size) if size else None), accepts_ranges
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Falha ao consultar {url}: {str(e)}")
+            return None, False
+
+    def _load_or_create_state(self, url: str, size: int, part_path: str, state_path: str) -> DownloadState:
+        """Retoma o estado salvo ou divide o arquivo em faixas para um novo download."""
+        state = DownloadState.load(state_path)
+        if state and state.url == url and state.size == size and os.path.exists(part_path) \
+                and os.path.getsize(part_path) == size:
+            logger.info(f"Retomando download de {url} [{state.downloaded}/{size} bytes]")
+            return state
+
+        count = max(1, min(self.connections, size // self.min_segment_size))
+        segment_size = -(-size // count)
+        state = DownloadState(url=url, size=size, segments=[
+            Segment(start=offset, end=min(offset + segment_size, size) - 1)
+            for offset in range(0, size, segment_size)
+        ])
+
+        # Pré-aloca o arquivo para que cada conexão grave em sua própria faixa
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+        state.save(state_path)
+        return state
+
+    def _download_segments(self, url: str, part_path: str, state: DownloadState, state_path: str,
+                           hasher: OrderedHasher) -> None:
+        """Baixa as faixas pendentes em paralelo, alimentando o hash em ordem."""
+        lock = threading.Lock()
+        errors: List[Exception] = []
+        last_save = [time.monotonic()]
+
+        def checkpoint(force: bool = False) -> None:
+            with lock:
+                if force or time.monotonic() - last_save[0] >= STATE_SAVE_INTERVAL:
+                    state.save(state_path)
+                    last_save[0] = time.monotonic()
+
+        def worker(segment: Segment) -> None:
+            try:
+                self._download_segment(url, part_path, segment, checkpoint, hasher)
+            except Exception as e:
+                errors.append(e)
+
+        pending = [segment for segment in state.segments if not segment.complete]
+        threads = [
+            threading.Thread(target=worker, args=(segment,), name=f"download-{i}", daemon=True)
+            for i, segment in enumerate(pending)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        checkpoint(force=True)
+
+        if errors:
+            raise DownloadError(f"Falha ao baixar {url}: {errors[0]}") from errors[0]
+
+    def _download_segment(self, url: str, part_path: str, segment: Segment, checkpoint,
+                          hasher: OrderedHasher) -> None:
+        """Baixa uma faixa, retomando do último byte gravado a cada nova tentativa."""
+        for attempt in range(1, self.retries + 1):
+            offset = segment.start + segment.done
+            try:
+                headers = {"Range": f"bytes={offset}-{segment.end}"}
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        raise DownloadError(f"Servidor não respeitou Range (status {response.status_code})")
+                    with open(part_path, "r+b") as f:
+                        f.seek(offset)
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            remaining = segment.end - (segment.start + segment.done) + 1
+                            chunk = chunk[:remaining]
+                            position = segment.start + segment.done
+                            f.write(chunk)
+                            # Visível para a leitura do hash antes de contar como baixado
+                            f.flush()
+                            segment.done += len(chunk)
+                            hasher.feed(position, chunk)
+                            checkpoint()
+                if segment.complete:
+                    return
+                raise DownloadError(f"Conexão encerrada antes do fim da faixa {segment.start}-{segment.end}")
+            except (requests.RequestException, DownloadError, OSError) as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"Tentativa {attempt} da faixa {segment.start}-{segment.end} falhou: {str(e)}")
+                time.sleep(min(2 ** attempt, 30))
+
+    def _download_stream(self, url: str, part_path: str, state_path: str, accepts_ranges: bool) -> str:
+        """Baixa com uma única conexão, calculando o SHA-256 durante a transferência."""
+        hasher = hashlib.sha256()
+        offset = 0
+        state = DownloadState.load(state_path)
+        if accepts_ranges and state and state.url == url and os.path.exists(part_path):
+            # Retoma: o prefixo já baixado entra no hash antes dos novos bytes
+            offset = os.path.getsize(part_path)
+            self._update_hash(hasher, part_path)
+        else:
+            DownloadState(url=url, size=None).save(state_path)
+
+        for attempt in range(1, self.retries + 1):
+            try:
+                headers = {"Range": f"bytes={offset}-"} if offset else {}
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if offset and response.status_code != 206:
+                        # Servidor reenviou o arquivo inteiro: recomeça do zero
+                        offset = 0
+                        hasher = hashlib.sha256()
+                    if response.status_code not in (200, 206):
+                        raise DownloadError(f"Falha ao baixar {url}. Status: {response.status_code}")
+                    with open(part_path, "r+b" if offset else "wb") as f:
+                        f.seek(offset)
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            f.write(chunk)
+                            hasher.update(chunk)
+                            offset += len(chunk)
+                return hasher.hexdigest()
+            except (requests.RequestException, OSError) as e:
+                if attempt == self.retries or not accepts_ranges:
+                    raise DownloadError(f"Falha ao baixar {url}: {str(e)}") from e
+                logger.warning(f"Tentativa {attempt} de {url} falhou em {offset} bytes: {str(e)}")
+                time.sleep(min(2 ** attempt, 30))
+
+        raise DownloadError(f"Máximo de tentativas excedido para {url}")
+
+    def _update_hash(self, hasher, path: str) -> None:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                hasher.update(chunk)
+
+    @staticmethod
+    def _discard(part_path: str, state_path: str) -> None:
+        for path in (part_path, state_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,308 @@
+"""
+# src/core/gguf.py
+Leitura do cabeçalho de arquivos GGUF e índice persistente dos modelos locais.
+
+O cabeçalho (metadados e descrição dos tensores) é lido via mmap, sem carregar os
+pesos, o que permite listar modelos e validar parâmetros em milissegundos.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Any, Dict, List, Optional
+
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+GGUF_MAGIC = b"GGUF"
+INDEX_FILE = "gguf_index.json"
+# Diretórios internos do armazenamento de modelos (blobs já aparecem pelos caminhos dos provedores)
+IGNORED_DIRS = ("store",)
+# Arrays maiores que isso (ex: vocabulário) são resumidos pelo tamanho
+MAX_ARRAY_VALUES = 16
+
+# Tipos de valor dos metadados (gguf.h)
+UINT8, INT8, UINT16, INT16, UINT32, INT32, FLOAT32, BOOL, STRING, ARRAY, UINT64, INT64, FLOAT64 = range(13)
+SCALAR_FORMATS = {
+    UINT8: "<B", INT8: "<b", UINT16: "<H", INT16: "<h", UINT32: "<I", INT32: "<i",
+    FLOAT32: "<f", BOOL: "<?", UINT64: "<Q", INT64: "<q", FLOAT64: "<d"
+}
+
+# general.file_type (llama_ftype) -> nome da quantização
+FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1",
+    10: "Q2_K", 11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M",
+    16: "Q5_K_S", 17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS", 21: "Q2_K_S",
+    22: "IQ3_XS", 23: "IQ3_XXS", 24: "IQ1_S", 25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M",
+    28: "IQ2_S", 29: "IQ2_M", 30: "IQ4_XS", 31: "IQ1_M", 32: "BF16"
+}
+
+class GGUFError(ValueError):
+    """Arquivo ausente, truncado ou que não está no formato GGUF."""
+
+class _HeaderReader:
+    """Cursor sobre o buffer mapeado do arquivo."""
+
+    def __init__(self, buffer, version: int):
+        self.buffer = buffer
+        self.offset = 0
+        # GGUF v1 usa contadores de 32 bits; v2+ usa 64 bits
+        self.count_format = "<I" if version == 1 else "<Q"
+
+    def read(self, fmt: str):
+        try:
+            value = struct.unpack_from(fmt, self.buffer, self.offset)[0]
+        except struct.error as e:
+            raise GGUFError(f"Cabeçalho GGUF truncado em {self.offset}") from e
+        self.offset += struct.calcsize(fmt)
+        return value
+
+    def read_count(self) -> int:
+        return self.read(self.count_format)
+
+    def read_string(self) -> str:
+        length = self.read_count()
+        end = self.offset + length
+        if end > len(self.buffer):
+            raise GGUFError(f"Cabeçalho GGUF truncado em {self.offset}")
+        value = bytes(self.buffer[self.offset:end]).decode("utf-8", errors="replace")
+        self.offset = end
+        return value
+
+    def skip_string(self) -> None:
+        length = self.read_count()
+        self.offset += length
+
+    def read_value(self, value_type: int) -> Any:
+        if value_type == STRING:
+            return self.read_string()
+        if value_type == ARRAY:
+            item_type = self.read("<I")
+            count = self.read_count()
+            if count > MAX_ARRAY_VALUES:
+                self._skip_array(item_type, count)
+                return {"type": "array", "length": count}
+            return [self.read_value(item_type) for _ in range(count)]
+        if value_type in SCALAR_FORMATS:
+            return self.read(SCALAR_FORMATS[value_type])
+        raise GGUFError(f"Tipo de metadado GGUF desconhecido: {value_type}")
+
+    def _skip_array(self, item_type: int, count: int) -> None:
+        if item_type in SCALAR_FORMATS:
+            self.offset += struct.calcsize(SCALAR_FORMATS[item_type]) * count
+        elif item_type == STRING:
+            for _ in range(count):
+                self.skip_string()
+        else:
+            for _ in range(count):
+                self.read_value(item_type)
+
+def read_gguf_header(path: str) -> Dict[str, Any]:
+    """
+    Lê os metadados e a descrição dos tensores de um arquivo GGUF.
+
+    Args:
+        path: Caminho do arquivo
+
+    Returns:
+        Dict com version, tensor_count, metadata e parameters (total de pesos)
+
+    Raises:
+        GGUFError: Se o arquivo não for um GGUF válido
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < 24:
+            raise GGUFError(f"Arquivo muito pequeno para ser GGUF: {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if buffer[:4] != GGUF_MAGIC:
+                raise GGUFError(f"Arquivo não está no formato GGUF: {path}")
+            version = struct.unpack_from("<I", buffer, 4)[0]
+            reader = _HeaderReader(buffer, version)
+            reader.offset = 8
+            tensor_count = reader.read_count()
+            kv_count = reader.read_count()
+
+            metadata = {}
+            for _ in range(kv_count):
+                key = reader.read_string()
+                metadata[key] = reader.read_value(reader.read("<I"))
+
+            parameters = 0
+            for _ in range(tensor_count):
+                reader.skip_string()
+                n_dims = reader.read("<I")
+                elements = 1
+                for _ in range(n_dims):
+                    elements *= reader.read(reader.count_format)
+                reader.offset += 12  # tipo (uint32) + offset (uint64)
+                parameters += elements
+
+    return {
+        "version": version,
+        "tensor_count": tensor_count,
+        "metadata": metadata,
+        "parameters": parameters
+    }
+
+def summarize_header(header: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extrai os campos mais usados dos metadados GGUF.
+
+    Args:
+        header: Resultado de read_gguf_header
+
+    Returns:
+        Dict com arquitetura, contexto, quantização e contagem de parâmetros
+    """
+    metadata = header["metadata"]
+    arch = metadata.get("general.architecture", "")
+    file_type = metadata.get("general.file_type")
+    return {
+        "name": metadata.get("general.name"),
+        "architecture": arch,
+        "context_length": metadata.get(f"{arch}.context_length"),
+        "embedding_length": metadata.get(f"{arch}.embedding_length"),
+        "block_count": metadata.get(f"{arch}.block_count"),
+        "head_count": metadata.get(f"{arch}.attention.head_count"),
+        "quantization": FILE_TYPES.get(file_type, str(file_type) if file_type is not None else None),
+        "parameters": header["parameters"],
+        "tensor_count": header["tensor_count"],
+        "version": header["version"]
+    }
+
+class GGUFIndex:
+    """
+    Índice persistente dos cabeçalhos GGUF encontrados em models/.
+
+    Cada entrada guarda o resumo do cabeçalho e a identificação do arquivo
+    (inode, mtime e tamanho); o cabeçalho só é relido quando o arquivo muda.
+    """
+
+    def __init__(self, models_dir: str):
+        """
+        Inicializa o índice.
+
+        Args:
+            models_dir: Diretório raiz dos modelos
+        """
+        self.models_dir = models_dir
+        self.index_path = os.path.join(models_dir, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("files", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        os.makedirs(self.models_dir, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self._entries}, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.models_dir)
+
+    def _lookup(self, path: str) -> Optional[Dict[str, Any]]:
+        """Retorna a entrada atualizada de um arquivo (sem salvar o índice)."""
+        key = self._key(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._entries.pop(key, None)
+            return None
+
+        entry = self._entries.get(key)
+        if entry and entry["inode"] == stat.st_ino and entry["mtime_ns"] == stat.st_mtime_ns \
+                and entry["size"] == stat.st_size:
+            return entry
+
+        # Hardlinks do armazenamento compartilham o inode: reaproveita o cabeçalho já lido
+        for other in self._entries.values():
+            if other["inode"] == stat.st_ino and other["mtime_ns"] == stat.st_mtime_ns \
+                    and other["size"] == stat.st_size and other.get("info"):
+                entry = dict(other, path=key)
+                self._entries[key] = entry
+                return entry
+
+        try:
+            info = summarize_header(read_gguf_header(path))
+            error = None
+        except (GGUFError, OSError) as e:
+            info, error = None, str(e)
+            logger.warning(f"Falha ao ler cabeçalho GGUF de {path}: {error}")
+
+        entry = {
+            "path": key,
+            "inode": stat.st_ino,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "info": info,
+            "error": error
+        }
+        self._entries[key] = entry
+        return entry
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtém o resumo do cabeçalho de um arquivo de modelo.
+
+        Args:
+            path: Caminho do arquivo GGUF
+
+        Returns:
+            Resumo do cabeçalho ou None se o arquivo não existir ou for inválido
+        """
+        with self._lock:
+            before = self._entries.get(self._key(path))
+            entry = self._lookup(path)
+            if entry is not before:
+                self._save()
+        return entry["info"] if entry else None
+
+    def scan(self) -> List[Dict[str, Any]]:
+        """
+        Atualiza o índice com todos os arquivos .gguf de models/.
+
+        Returns:
+            Lista de entradas (path relativo, tamanho, info ou error)
+        """
+        found = []
+        for root, dirs, files in os.walk(self.models_dir):
+            if root == self.models_dir:
+                dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+            found.extend(os.path.join(root, name) for name in files if name.endswith(".gguf"))
+
+        with self._lock:
+            keys = {self._key(path) for path in found}
+            for key in list(self._entries):
+                if key not in keys:
+                    del self._entries[key]
+            entries = [self._lookup(path) for path in sorted(found)]
+            self._save()
+        return [entry for entry in entries if entry]
+
+_index: Optional[GGUFIndex] = None
+_index_lock = threading.Lock()
+
+def get_gguf_index(models_dir: str) -> GGUFIndex:
+    """
+    Obtém o índice GGUF do processo.
+
+    Args:
+        models_dir: Diretório raiz dos modelos
+
+    Returns:
+        GGUFIndex compartilhado
+    """
+    global _index
+    with _index_lock:
+        if _index is None or _index.models_dir != models_dir:
+            _index = GGUFIndex(models_dir)
+        return _index
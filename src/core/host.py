@@ -0,0 +1,152 @@
+"""
+# src/core/host.py
+Recursos do host (memória e CPU), considerando afinidade e limites de cgroup de contêineres.
+"""
+import math
+import os
+import socket
+from typing import Dict, Optional
+
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+MB = 1024 * 1024
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+def _read_int(path: str) -> Optional[int]:
+    """Lê um inteiro de um arquivo do /proc ou /sys ("max" = sem limite)."""
+    try:
+        with open(path, "r") as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    if not value or value == "max":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+def read_meminfo() -> Dict[str, int]:
+    """
+    Lê /proc/meminfo.
+
+    Returns:
+        Dict campo -> bytes (vazio se indisponível)
+    """
+    info = {}
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                parts = value.split()
+                if parts:
+                    info[key] = int(parts[0]) * 1024 if len(parts) > 1 and parts[1] == "kB" else int(parts[0])
+    except (OSError, ValueError):
+        pass
+    return info
+
+def get_cgroup_memory() -> Dict[str, Optional[int]]:
+    """
+    Obtém o limite e o uso de memória do cgroup do processo (v2 ou v1).
+
+    Returns:
+        Dict com limit e usage em bytes (None quando não há limite)
+    """
+    # cgroup v2
+    limit = _read_int(os.path.join(CGROUP_ROOT, "memory.max"))
+    usage = _read_int(os.path.join(CGROUP_ROOT, "memory.current"))
+    if limit is None and usage is None:
+        # cgroup v1 (limites muito altos significam "sem limite")
+        limit = _read_int(os.path.join(CGROUP_ROOT, "memory", "memory.limit_in_bytes"))
+        usage = _read_int(os.path.join(CGROUP_ROOT, "memory", "memory.usage_in_bytes"))
+        if limit is not None and limit >= 1 << 60:
+            limit = None
+    return {"limit": limit, "usage": usage}
+
+def get_total_memory() -> int:
+    """
+    Obtém a memória total utilizável pelo processo.
+
+    Returns:
+        Bytes (o menor entre a RAM física e o limite do cgroup)
+    """
+    total = read_meminfo().get("MemTotal")
+    if total is None:
+        try:
+            total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (ValueError, OSError):
+            total = 0
+    limit = get_cgroup_memory()["limit"]
+    return min(total, limit) if limit else total
+
+def get_available_memory() -> int:
+    """
+    Obtém a memória livre para novas alocações.
+
+    Returns:
+        Bytes (o menor entre MemAvailable e a folga do cgroup)
+    """
+    meminfo = read_meminfo()
+    available = meminfo.get("MemAvailable", meminfo.get("MemFree"))
+    if available is None:
+        # Sem /proc/meminfo (ex: macOS): usa a memória total como aproximação
+        available = get_total_memory()
+    cgroup = get_cgroup_memory()
+    if cgroup["limit"]:
+        available = min(available, max(0, cgroup["limit"] - (cgroup["usage"] or 0)))
+    return available
+
+def get_host_name() -> str:
+    """Nome do host usado para identificar perfis de ajuste."""
+    return socket.gethostname().split(".")[0] or "localhost"
+
+def get_affinity_cpus() -> int:
+    """
+    Obtém a quantidade de CPUs em que o processo pode executar.
+
+    Returns:
+        CPUs permitidas por sched_getaffinity (ou os.cpu_count quando indisponível)
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+def get_cgroup_cpu_quota() -> Optional[float]:
+    """
+    Obtém a cota de CPU do cgroup do processo (v2 ou v1).
+
+    Returns:
+        Quantidade de CPUs equivalente à cota ou None se não houver limite
+    """
+    # cgroup v2: "<quota> <period>" ou "max <period>"
+    try:
+        with open(os.path.join(CGROUP_ROOT, "cpu.max"), "r") as f:
+            quota, _, period = f.read().strip().partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1
+    quota = _read_int(os.path.join(CGROUP_ROOT, "cpu", "cpu.cfs_quota_us"))
+    period = _read_int(os.path.join(CGROUP_ROOT, "cpu", "cpu.cfs_period_us"))
+    if quota and quota > 0 and period:
+        return quota / period
+    return None
+
+def get_cpu_limit() -> int:
+    """
+    Obtém o número de threads de CPU que o processo pode usar efetivamente.
+
+    Returns:
+        O menor entre as CPUs da afinidade e a cota do cgroup (arredondada para cima)
+    """
+    cpus = get_affinity_cpus()
+    quota = get_cgroup_cpu_quota()
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
@@ -0,0 +1,681 @@
+"""
+# src/core/http_server.py
+Servidor HTTP assíncrono do modo `prompt_tdd serve`.
+
+Implementado sobre asyncio (streams da biblioteca padrão, HTTP/1.1 com keep-alive).
+As execuções rodam em orquestradores aquecidos e reaproveitados entre requisições;
+cada orquestrador fica preso a uma thread própria, pois as conexões SQLite e o
+estado dos modelos não podem ser compartilhados entre threads.
+
+Endpoints:
+    POST /v1/execute  Executa um prompt e retorna o resultado em JSON
+    POST /v1/batch    Executa uma lista de prompts concorrentemente
+    POST /v1/stream   Executa um prompt e envia os eventos dos guardrails em NDJSON
+    GET  /healthz     Processo vivo
+    GET  /readyz      Orquestradores aquecidos, modelos prontos e servidor aceitando requisições
+
+As vagas de execução são distribuídas pelo escalonador (src/core/scheduler.py): cada
+requisição entra na fila da sua classe de prioridade e, com a fila cheia, recebe 503
+com Retry-After imediatamente.
+"""
+import asyncio
+import itertools
+import json
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.core.kernel import get_env_var
+from src.core.logger import get_logger
+from src.core.scheduler import FairScheduler, SchedulerSaturated, SchedulingPolicy, Ticket
+
+logger = get_logger(__name__)
+
+FORMATS = ("json", "markdown", "text")
+# Limite de tamanho da linha de requisição e de cada cabeçalho
+MAX_LINE_BYTES = 64 * 1024
+MAX_HEADERS = 100
+
+class HTTPError(Exception):
+    """Erro convertido em resposta HTTP com corpo JSON."""
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+@dataclass
+class ServerSettings:
+    """Configuração do servidor (seção server do kernel.yaml)."""
+    host: str = "127.0.0.1"
+    port: int = 8080
+    concurrency: int = 2
+    request_timeout: float = 300
+    drain_timeout: float = 30
+    keepalive_timeout: float = 15
+    max_body_bytes: int = 1024 * 1024
+    max_batch_items: int = 32
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None,
+                    overrides: Optional[Dict[str, Any]] = None) -> "ServerSettings":
+        """
+        Cria a configuração a partir do kernel.yaml.
+
+        Prioridade: argumentos de linha de comando, variáveis de ambiente
+        (mapeadas em env_vars) e valores do arquivo.
+
+        Args:
+            config: Seção server do kernel.yaml (opcional)
+            overrides: Valores passados na linha de comando (opcional)
+
+        Returns:
+            ServerSettings configurado
+        """
+        config = config or {}
+        env_vars = config.get('env_vars') or {}
+        overrides = overrides or {}
+        settings = cls()
+        for item in fields(cls):
+            value = config.get(item.name, getattr(settings, item.name))
+            env_value = get_env_var(env_vars[item.name]) if env_vars.get(item.name) else None
+            if overrides.get(item.name) is not None:
+                value = overrides[item.name]
+            elif env_value:
+                value = env_value
+            try:
+                setattr(settings, item.name, item.type(value))
+            except (TypeError, ValueError):
+                logger.warning(f"Valor inválido para server.{item.name}: {value}")
+        settings.concurrency = max(1, settings.concurrency)
+        return settings
+
+@dataclass
+class HTTPRequest:
+    """Requisição HTTP já lida do socket."""
+    method: str
+    path: str
+    version: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def json(self) -> Dict[str, Any]:
+        """Decodifica o corpo JSON (objeto)."""
+        try:
+            payload = json.loads(self.body or b"{}")
+        except ValueError as e:
+            raise HTTPError(400, f"JSON inválido: {str(e)}")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "O corpo deve ser um objeto JSON")
+        return payload
+
+@dataclass
+class ExecuteJob:
+    """Parâmetros de uma execução do orquestrador."""
+    prompt: str
+    format: str = "json"
+    model: Optional[str] = None
+    session_id: str = "api"
+
+class OrchestratorWorker:
+    """Orquestrador aquecido e a thread em que ele sempre executa."""
+
+    def __init__(self, model_name: Optional[str], index: int):
+        self.model_name = model_name
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"orchestrator-{index}")
+        self.orchestrator = None
+        # Momento em que voltou a ficar ocioso (escolha do orquestrador a descartar)
+        self.last_used = time.monotonic()
+
+    def submit(self, fn: Callable, *args) -> asyncio.Future:
+        """Executa uma função na thread do orquestrador."""
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def start(self, factory: Callable[[Optional[str]], Any]) -> None:
+        """Cria o orquestrador na própria thread."""
+        self.orchestrator = await self.submit(factory, self.model_name)
+
+    def close(self) -> None:
+        """Fecha o banco do orquestrador na própria thread e encerra a thread sem aguardar."""
+        if self.orchestrator is not None:
+            self.executor.submit(self._close_orchestrator, self.orchestrator)
+            self.orchestrator = None
+        self.executor.shutdown(wait=False)
+
+    @staticmethod
+    def _close_orchestrator(orchestrator) -> None:
+        db = getattr(orchestrator, "db", None)
+        if db is not None:
+            try:
+                db.close()
+            except Exception as e:
+                logger.error(f"Erro ao fechar o banco do orquestrador: {str(e)}")
+
+class APIServer:
+    """Servidor HTTP com pool de orquestradores, escalonamento por prioridade e drenagem no encerramento."""
+
+    def __init__(self, settings: ServerSettings, orchestrator_factory: Callable[[Optional[str]], Any],
+                 default_model: Optional[str] = None, policy: Optional[SchedulingPolicy] = None,
+                 models: Optional[Iterable[str]] = None):
+        """
+        Inicializa o servidor.
+
+        Args:
+            settings: Configuração do servidor
+            orchestrator_factory: Função que cria um orquestrador para um modelo (ex: get_orchestrator)
+            default_model: Modelo usado quando a requisição não informa um (opcional)
+            policy: Classes de prioridade do escalonador (opcional)
+            models: Modelos aceitos no campo "model" das requisições (padrão: qualquer um)
+        """
+        self.settings = settings
+        self.orchestrator_factory = orchestrator_factory
+        self.default_model = default_model
+        self.models = frozenset(models) if models is not None else None
+        self.draining = False
+        self.warm = False
+        self.started_at = time.time()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.scheduler = FairScheduler(policy, slots=settings.concurrency)
+        self._idle: Dict[Optional[str], List[OrchestratorWorker]] = {}
+        self._workers: List[OrchestratorWorker] = []
+        self._worker_ids = itertools.count(1)
+        self._connections = set()
+        # Requisições admitidas (na fila ou executando) e em execução
+        self._pending = 0
+        self._in_flight = 0
+
+    # ----- Ciclo de vida -----
+
+    async def serve(self) -> None:
+        """Inicia o servidor e aguarda SIGTERM/SIGINT para drenar e encerrar."""
+        loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.settings.host, self.settings.port, limit=MAX_LINE_BYTES
+        )
+        logger.info(
+            f"Servidor HTTP em http://{self.settings.host}:{self.settings.port} "
+            f"[concorrência={self.settings.concurrency}, "
+            f"classes={', '.join(self.scheduler.policy.classes)}]"
+        )
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        warm_task = asyncio.ensure_future(self._warm_up())
+        await stop.wait()
+        warm_task.cancel()
+        await self.shutdown()
+
+    async def _warm_up(self) -> None:
+        """Cria um orquestrador do modelo padrão por vaga de concorrência."""
+        start = time.perf_counter()
+
+        async def warm_one() -> None:
+            ticket, granted = self._submit(None, "warmup", enforce_limit=False)
+            try:
+                await granted
+                worker = await self._create_worker(self.default_model)
+                self._release_worker(worker)
+            finally:
+                self._withdraw(ticket)
+
+        results = await asyncio.gather(*(warm_one() for _ in range(self.settings.concurrency)),
+                                       return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            logger.error(f"Falha ao aquecer orquestradores: {errors[0]}")
+        self.warm = len(errors) < len(results)
+        logger.info(f"Orquestradores aquecidos: {len(results) - len(errors)} "
+                    f"[{(time.perf_counter() - start) * 1000:.0f}ms]")
+
+    async def shutdown(self) -> None:
+        """Para de aceitar conexões, aguarda as execuções em andamento e libera os orquestradores."""
+        self.draining = True
+        logger.info(f"Drenando servidor [{self._pending} requisições pendentes]")
+        if self._server:
+            self._server.close()
+
+        deadline = time.monotonic() + self.settings.drain_timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._pending:
+            logger.warning(f"Tempo de drenagem esgotado com {self._pending} requisições pendentes")
+
+        # Conexões ociosas em keep-alive são encerradas
+        for writer in list(self._connections):
+            writer.close()
+        if self._server:
+            await self._server.wait_closed()
+        for worker in self._workers:
+            worker.close()
+        logger.info("Servidor HTTP encerrado")
+
+    # ----- Pool de orquestradores -----
+
+    async def _create_worker(self, model_name: Optional[str]) -> OrchestratorWorker:
+        worker = OrchestratorWorker(model_name, next(self._worker_ids))
+        # Contado desde já, para que criações simultâneas respeitem o limite
+        self._workers.append(worker)
+        try:
+            await worker.start(self.orchestrator_factory)
+        except Exception:
+            self._workers.remove(worker)
+            worker.close()
+            raise
+        return worker
+
+    def _release_worker(self, worker: OrchestratorWorker) -> None:
+        """Devolve um orquestrador ao pool de ociosos do seu modelo."""
+        worker.last_used = time.monotonic()
+        self._idle.setdefault(worker.model_name, []).append(worker)
+
+    def _evict_idle_worker(self) -> bool:
+        """
+        Fecha o orquestrador ocioso usado há mais tempo, de qualquer modelo.
+
+        Returns:
+            True se algum orquestrador foi fechado
+        """
+        candidates = [worker for workers in self._idle.values() for worker in workers]
+        if not candidates:
+            return False
+        worker = min(candidates, key=lambda candidate: candidate.last_used)
+        self._idle[worker.model_name].remove(worker)
+        self._workers.remove(worker)
+        worker.close()
+        logger.info(f"Orquestrador de {worker.model_name or 'modelo padrão'} fechado para liberar espaço no pool")
+        return True
+
+    async def _acquire_worker(self, model_name: Optional[str]) -> OrchestratorWorker:
+        """
+        Obtém um orquestrador ocioso do modelo ou cria um novo.
+
+        O pool tem no máximo `concurrency` orquestradores. Cheio, o ocioso usado há mais
+        tempo (de outro modelo, pois não há ocioso deste) é fechado antes da criação.
+        Como cada execução ocupa uma vaga do escalonador, há sempre um ocioso nesse caso.
+        """
+        idle = self._idle.get(model_name)
+        if idle:
+            return idle.pop()
+        if len(self._workers) >= self.settings.concurrency and not self._evict_idle_worker():
+            raise HTTPError(503, "Nenhum orquestrador disponível, tente novamente", {"Retry-After": "1"})
+        try:
+            return await self._create_worker(model_name)
+        except Exception as e:
+            logger.error(f"Erro ao criar orquestrador para {model_name or 'modelo padrão'}: {str(e)}")
+            raise HTTPError(500, f"Falha ao criar orquestrador: {str(e)}")
+
+    # ----- Controle de admissão -----
+
+    def _submit(self, session_id: Optional[str], caller: str,
+                enforce_limit: bool = True) -> Tuple[Ticket, asyncio.Future]:
+        """Registra uma execução no escalonador; o future é resolvido quando a vaga é concedida."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def on_grant(_: Ticket) -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        return self.scheduler.submit(session_id, caller, on_grant=on_grant, enforce_limit=enforce_limit), granted
+
+    def _withdraw(self, ticket: Ticket) -> None:
+        """Retira a requisição da fila ou devolve a vaga já concedida."""
+        if not self.scheduler.cancel(ticket):
+            self.scheduler.release(ticket)
+
+    def _admit(self, jobs: List[ExecuteJob], caller: str) -> List[Tuple[Ticket, asyncio.Future]]:
+        """
+        Registra as execuções no escalonador ou rejeita com 503.
+
+        Um lote é admitido por inteiro ou rejeitado por inteiro.
+
+        Args:
+            jobs: Execuções da requisição
+            caller: Origem usada na classificação (ex: "api", "api-batch")
+
+        Returns:
+            Lista de (ticket, future da vaga), na ordem das execuções
+
+        Raises:
+            HTTPError: Servidor drenando ou fila da classe de prioridade cheia
+        """
+        if self.draining:
+            raise HTTPError(503, "Servidor em encerramento", {"Connection": "close"})
+        admissions = []
+        try:
+            for job in jobs:
+                admissions.append(self._submit(job.session_id, caller))
+        except SchedulerSaturated as e:
+            for ticket, _ in admissions:
+                self._withdraw(ticket)
+            raise HTTPError(503, f"Servidor sobrecarregado (fila '{e.priority}' cheia), tente novamente",
+                            {"Retry-After": str(e.retry_after)})
+        self._pending += len(admissions)
+        return admissions
+
+    async def _execute(self, job: ExecuteJob, admission: Tuple[Ticket, asyncio.Future],
+                       on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Executa uma requisição já admitida em um orquestrador do pool, quando o escalonador conceder a vaga.
+
+        Em caso de timeout a vaga só é liberada quando a execução termina, pois a
+        thread do orquestrador continua ocupada.
+        """
+        ticket, granted = admission
+        try:
+            await granted
+        except BaseException:
+            self._pending -= 1
+            self._withdraw(ticket)
+            raise
+        self._in_flight += 1
+        model_name = job.model or self.default_model
+        worker = None
+        future = None
+
+        def release(done: Optional[asyncio.Future] = None) -> None:
+            if done is not None and not done.cancelled():
+                done.exception()
+            if worker is not None:
+                self._release_worker(worker)
+            self._in_flight -= 1
+            self._pending -= 1
+            self.scheduler.release(ticket)
+
+        try:
+            worker = await self._acquire_worker(model_name)
+            future = worker.submit(self._execute_sync, worker.orchestrator, job, on_event)
+            return await asyncio.wait_for(asyncio.shield(future), self.settings.request_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPError(504, f"Tempo limite de {self.settings.request_timeout:.0f}s excedido")
+        except HTTPError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro na execução: {str(e)}")
+            raise HTTPError(500, str(e))
+        finally:
+            if future is not None and not future.done():
+                future.add_done_callback(release)
+            else:
+                release()
+
+    @staticmethod
+    def _execute_sync(orchestrator, job: ExecuteJob, on_event) -> Dict[str, Any]:
+        """Executa o orquestrador e registra a execução (na thread do orquestrador)."""
+        start = time.perf_counter()
+        result = orchestrator.execute(prompt=job.prompt, format=job.format, on_event=on_event)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        run_id = None
+        try:
+            run_id = orchestrator.db.log_run(
+                job.session_id,
+                input=job.prompt,
+                final_output=result.output,
+                output_type=job.format,
+                stages=result.raw_responses
+            )
+        except Exception as e:
+            logger.warning(f"Falha ao registrar execução: {str(e)}")
+
+        return {
+            "output": result.output,
+            "prompt_final": result.prompt_final,
+            "guardrails": result.guardrails,
+            "raw_responses": result.raw_responses,
+            "model": orchestrator.model_manager.model_name,
+            "run_id": run_id,
+            "elapsed_ms": round(elapsed_ms, 1)
+        }
+
+    def _parse_job(self, payload: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None) -> ExecuteJob:
+        """Valida os parâmetros de uma execução."""
+        defaults = defaults or {}
+        prompt = payload.get("prompt")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise HTTPError(400, "Campo 'prompt' obrigatório")
+        format = payload.get("format", defaults.get("format", "json"))
+        if format not in FORMATS:
+            raise HTTPError(400, f"Formato inválido: {format} (use {', '.join(FORMATS)})")
+        # Validado antes da admissão: cada modelo distinto ocupa um orquestrador no pool
+        model = payload.get("model", defaults.get("model"))
+        if model is not None and (not isinstance(model, str) or
+                                  (self.models is not None and model not in self.models)):
+            raise HTTPError(400, f"Modelo desconhecido: {model}")
+        return ExecuteJob(
+            prompt=prompt,
+            format=format,
+            model=model,
+            session_id=str(payload.get("session_id", defaults.get("session_id", "api")))
+        )
+
+    # ----- Endpoints -----
+
+    async def _handle_execute(self, request: HTTPRequest, writer, keep_alive: bool) -> int:
+        job = self._parse_job(request.json())
+        admission, = self._admit([job], "api")
+        result = await self._execute(job, admission)
+        return await self._send_json(writer, 200, result, keep_alive)
+
+    async def _handle_batch(self, request: HTTPRequest, writer, keep_alive: bool) -> int:
+        payload = request.json()
+        items = payload.get("items")
+        if not isinstance(items, list) or not items:
+            raise HTTPError(400, "Campo 'items' deve ser uma lista não vazia")
+        if len(items) > self.settings.max_batch_items:
+            raise HTTPError(413, f"Lote excede {self.settings.max_batch_items} itens")
+        jobs = [self._parse_job(item if isinstance(item, dict) else {}, payload) for item in items]
+        admissions = self._admit(jobs, "api-batch")
+
+        async def run(index: int, job: ExecuteJob) -> Dict[str, Any]:
+            try:
+                return dict(await self._execute(job, admissions[index]), index=index, status="success")
+            except HTTPError as e:
+                return {"index": index, "status": "error", "code": e.status, "error": e.message}
+
+        results = await asyncio.gather(*(run(i, job) for i, job in enumerate(jobs)))
+        return await self._send_json(writer, 200, {"results": results}, keep_alive)
+
+    async def _handle_stream(self, request: HTTPRequest, writer, keep_alive: bool) -> int:
+        job = self._parse_job(request.json())
+        admission, = self._admit([job], "api")
+
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(
+            self._execute(job, admission, on_event=lambda event: loop.call_soon_threadsafe(events.put_nowait, event))
+        )
+
+        await self._send_head(writer, 200, {"Content-Type": "application/x-ndjson",
+                                            "Transfer-Encoding": "chunked"}, keep_alive)
+        try:
+            await self._write_chunk(writer, {"event": "accepted"})
+            while True:
+                getter = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    break
+                await self._write_chunk(writer, getter.result())
+            while not events.empty():
+                await self._write_chunk(writer, events.get_nowait())
+
+            try:
+                await self._write_chunk(writer, {"event": "result", **task.result()})
+            except HTTPError as e:
+                await self._write_chunk(writer, {"event": "error", "code": e.status, "error": e.message})
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError:
+            # Cliente desconectou: a execução continua até o fim para liberar a vaga
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            raise
+        return 200
+
+    async def _handle_readyz(self, writer, keep_alive: bool) -> int:
+        # Orquestradores ainda em criação (aquecimento ou novo modelo) não têm estado a consultar
+        started = [worker.orchestrator for worker in self._workers if worker.orchestrator is not None]
+        readiness = started[0].model_manager.get_readiness() if started else {}
+        # Apenas os modelos principais dos orquestradores contam; falhas dos modelos de fallback não
+        # tiram o servidor do balanceamento (sem aquecimento, o modelo não aparece no estado)
+        models = readiness.get("models", {})
+        primary = {orchestrator.model_manager.model_name for orchestrator in started}
+        ready = self.warm and bool(started) and not self.draining and all(
+            models.get(name, {}).get("state", "ready") == "ready" for name in primary
+        )
+        return await self._send_json(writer, 200 if ready else 503, {
+            "ready": ready,
+            "warm": self.warm,
+            "draining": self.draining,
+            "in_flight": self._in_flight,
+            "queued": self._pending - self._in_flight,
+            "workers": len(started),
+            "starting": len(self._workers) - len(started),
+            "scheduler": self.scheduler.status(),
+            "models": models,
+            "local_models": readiness.get("local_models", {})
+        }, keep_alive)
+
+    async def _dispatch(self, request: HTTPRequest, writer, keep_alive: bool) -> int:
+        routes = {
+            "/v1/execute": ("POST", self._handle_execute),
+            "/v1/batch": ("POST", self._handle_batch),
+            "/v1/stream": ("POST", self._handle_stream)
+        }
+        path = request.path.split("?", 1)[0]
+        if path == "/healthz":
+            return await self._send_json(writer, 200, {
+                "status": "ok",
+                "uptime_s": round(time.time() - self.started_at, 1)
+            }, keep_alive)
+        if path == "/readyz":
+            return await self._handle_readyz(writer, keep_alive)
+        if path not in routes:
+            raise HTTPError(404, f"Rota não encontrada: {path}")
+        method, handler = routes[path]
+        if request.method != method:
+            raise HTTPError(405, f"Método {request.method} não permitido", {"Allow": method})
+        return await handler(request, writer, keep_alive)
+
+    # ----- Protocolo HTTP -----
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while not self.draining:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.settings.keepalive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+
+                start = time.perf_counter()
+                keep_alive = request.keep_alive
+                try:
+                    status = await self._dispatch(request, writer, keep_alive and not self.draining)
+                except HTTPError as e:
+                    keep_alive = keep_alive and e.headers.get("Connection") != "close"
+                    status = await self._send_json(writer, e.status, {"error": e.message},
+                                                   keep_alive and not self.draining, e.headers)
+                logger.debug(f"{request.method} {request.path} {status} [{(time.perf_counter() - start) * 1000:.0f}ms]")
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception as e:
+            logger.error(f"Erro na conexão HTTP: {str(e)}")
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[HTTPRequest]:
+        """Lê a linha de requisição, os cabeçalhos e o corpo (Content-Length)."""
+        try:
+            line = await reader.readline()
+            if not line:
+                return None
+            parts = line.decode("latin-1").strip().split()
+            if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+                raise HTTPError(400, "Linha de requisição inválida")
+            method, path, version = parts
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                if len(headers) >= MAX_HEADERS:
+                    raise HTTPError(431, "Cabeçalhos em excesso")
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise HTTPError(431, "Linha de requisição ou cabeçalho muito longo")
+
+        if "transfer-encoding" in headers:
+            raise HTTPError(411, "Envie o corpo com Content-Length")
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Content-Length inválido")
+        if length > self.settings.max_body_bytes:
+            raise HTTPError(413, f"Corpo excede {self.settings.max_body_bytes} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return HTTPRequest(method=method, path=path, version=version, headers=headers, body=body)
+
+    async def _send_head(self, writer: asyncio.StreamWriter, status: int, headers: Dict[str, str],
+                         keep_alive: bool) -> None:
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        headers = dict(headers, Connection="keep-alive" if keep_alive else "close")
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool,
+                         headers: Optional[Dict[str, str]] = None) -> int:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        headers = {name: value for name, value in (headers or {}).items() if name != "Connection"}
+        await self._send_head(writer, status, dict(headers, **{
+            "Content-Type": "application/json; charset=utf-8",
+            "Content-Length": str(len(body))
+        }), keep_alive)
+        writer.write(body)
+        await writer.drain()
+        return status
+
+    async def _write_chunk(self, writer: asyncio.StreamWriter, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+def run_server(settings: ServerSettings, orchestrator_factory: Callable[[Optional[str]], Any],
+               default_model: Optional[str] = None, policy: Optional[SchedulingPolicy] = None,
+               models: Optional[Iterable[str]] = None) -> None:
+    """
+    Executa o servidor até receber SIGTERM/SIGINT.
+
+    Args:
+        settings: Configuração do servidor
+        orchestrator_factory: Função que cria um orquestrador para um modelo
+        default_model: Modelo padrão (opcional)
+        policy: Classes de prioridade do escalonador (opcional)
+        models: Modelos aceitos nas requisições (padrão: qualquer um)
+    """
+    asyncio.run(APIServer(settings, orchestrator_factory, default_model, policy, models).serve())
@@ -0,0 +1,447 @@
+"""
+# src/core/jobs.py
+Fila de jobs persistente (SQLite) para execuções em segundo plano.
+
+`prompt_tdd submit` grava o job e retorna imediatamente; `prompt_tdd worker` mantém
+um pool de processos que reservam jobs com prazo de visibilidade (lease). Enquanto
+executa, o worker renova o lease; se o processo morrer, o lease expira e o job volta
+a ser entregue a outro worker, até o limite de tentativas. Chaves de idempotência
+garantem que um cliente que repete o envio não gere uma nova chamada ao modelo.
+"""
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Dict, List, Optional
+
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINAL_STATES = (SUCCEEDED, FAILED)
+
+DEFAULT_DB_PATH = "logs/jobs.db"
+DEFAULT_VISIBILITY_TIMEOUT = 300
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 10
+DEFAULT_POLL_INTERVAL = 1.0
+
+@dataclass
+class Job:
+    """Job da fila."""
+    id: str
+    session_id: str
+    prompt: str
+    format: str
+    status: str
+    attempts: int
+    max_attempts: int
+    created_at: float
+    available_at: float
+    model: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    run_id: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        data = {item.name: row[item.name] for item in fields(cls)}
+        if data["result"]:
+            data["result"] = json.loads(data["result"])
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {item.name: getattr(self, item.name) for item in fields(self)}
+
+class JobQueue:
+    """Fila de jobs em SQLite, segura para vários processos."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, retry_backoff: float = DEFAULT_RETRY_BACKOFF):
+        """
+        Inicializa a fila.
+
+        Args:
+            db_path: Caminho do banco da fila
+            visibility_timeout: Duração do lease em segundos (renovado enquanto o job executa)
+            max_attempts: Tentativas padrão por job
+            retry_backoff: Espera base (exponencial) antes de repetir um job que falhou
+        """
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # Transações explícitas (BEGIN IMMEDIATE) e espera por locks de outros processos
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> "JobQueue":
+        """
+        Cria a fila a partir da seção jobs do kernel.yaml.
+
+        Args:
+            config: Configuração da fila (opcional)
+
+        Returns:
+            JobQueue configurada
+        """
+        config = config or {}
+        return cls(
+            db_path=config.get('db_path', DEFAULT_DB_PATH),
+            visibility_timeout=config.get('visibility_timeout', DEFAULT_VISIBILITY_TIMEOUT),
+            max_attempts=config.get('max_attempts', DEFAULT_MAX_ATTEMPTS),
+            retry_backoff=config.get('retry_backoff', DEFAULT_RETRY_BACKOFF)
+        )
+
+    def _create_tables(self) -> None:
+        with self._lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    idempotency_key TEXT UNIQUE,
+                    session_id TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    model TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    available_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    result TEXT,
+                    error TEXT,
+                    run_id INTEGER
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, available_at)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at)")
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def submit(self, prompt: str, format: str = "json", session_id: str = "jobs", model: Optional[str] = None,
+               idempotency_key: Optional[str] = None, max_attempts: Optional[int] = None) -> Job:
+        """
+        Enfileira um job.
+
+        Args:
+            prompt: Prompt do usuário
+            format: Formato de saída
+            session_id: ID da sessão
+            model: Modelo (opcional; padrão do worker)
+            idempotency_key: Chave de idempotência; um envio repetido retorna o job existente
+            max_attempts: Tentativas (padrão: configuração da fila)
+
+        Returns:
+            Job criado ou o job já existente com a mesma chave
+        """
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            cursor = self.conn.execute("""
+                INSERT INTO jobs (id, idempotency_key, session_id, prompt, format, model, status,
+                                  max_attempts, available_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (idempotency_key) DO NOTHING
+            """, (job_id, idempotency_key, session_id, prompt, format, model, QUEUED,
+                  max_attempts or self.max_attempts, now, now))
+            if cursor.rowcount == 0:
+                row = self.conn.execute("SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+                logger.info(f"Job existente para a chave de idempotência {idempotency_key}: {row['id']}")
+                return Job.from_row(row)
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        logger.info(f"Job enfileirado: {job_id}")
+        return Job.from_row(row)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Obtém um job pelo ID (ou pelo prefixo do ID)."""
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None and len(job_id) >= 6:
+                rows = self.conn.execute("SELECT * FROM jobs WHERE id LIKE ? LIMIT 2", (f"{job_id}%",)).fetchall()
+                row = rows[0] if len(rows) == 1 else None
+        return Job.from_row(row) if row else None
+
+    def list(self, limit: int = 20, status: Optional[str] = None) -> List[Job]:
+        """Lista os jobs mais recentes."""
+        query = "SELECT * FROM jobs"
+        params: list = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Quantidade de jobs por estado."""
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) AS total FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["total"] for row in rows}
+
+    def lease(self, owner: str) -> Optional[Job]:
+        """
+        Reserva o próximo job disponível.
+
+        Jobs em execução cujo lease expirou (worker encerrado) voltam a ser entregues;
+        os que já esgotaram as tentativas são marcados como falhos.
+
+        Args:
+            owner: Identificação do worker
+
+        Returns:
+            Job reservado ou None se a fila estiver vazia
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("""
+                    UPDATE jobs SET status = ?, finished_at = ?, lease_owner = NULL,
+                        error = 'Lease expirado na última tentativa (worker encerrado)'
+                    WHERE status = ? AND lease_expires_at < ? AND attempts >= max_attempts
+                """, (FAILED, now, RUNNING, now))
+                row = self.conn.execute("""
+                    UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?,
+                        lease_expires_at = ?, started_at = ?, error = NULL
+                    WHERE id = (
+                        SELECT id FROM jobs
+                        WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?)
+                        ORDER BY available_at, created_at
+                        LIMIT 1
+                    )
+                    RETURNING *
+                """, (RUNNING, owner, now + self.visibility_timeout, now, QUEUED, now, RUNNING, now)).fetchone()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = Job.from_row(row)
+        if job.attempts > 1:
+            logger.info(f"Job {job.id} entregue novamente (tentativa {job.attempts}/{job.max_attempts})")
+        return job
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """
+        Renova o lease de um job em execução.
+
+        Returns:
+            False se o lease foi perdido (expirou e o job foi entregue a outro worker)
+        """
+        with self._lock:
+            cursor = self.conn.execute("""
+                UPDATE jobs SET lease_expires_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = ?
+            """, (time.time() + self.visibility_timeout, job_id, owner, RUNNING))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, owner: str, result: Dict[str, Any], run_id: Optional[int] = None) -> bool:
+        """
+        Registra o resultado de um job.
+
+        Returns:
+            False se o lease foi perdido (o resultado é descartado)
+        """
+        with self._lock:
+            cursor = self.conn.execute("""
+                UPDATE jobs SET status = ?, result = ?, run_id = ?, finished_at = ?,
+                    lease_owner = NULL, lease_expires_at = NULL
+                WHERE id = ? AND lease_owner = ? AND status = ?
+            """, (SUCCEEDED, json.dumps(result, ensure_ascii=False, default=str), run_id, time.time(),
+                  job_id, owner, RUNNING))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, owner: str, error: str) -> bool:
+        """
+        Registra a falha de uma tentativa; o job é repetido com espera exponencial até o limite.
+
+        Returns:
+            False se o lease foi perdido
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute("""
+                UPDATE jobs SET
+                    status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,
+                    finished_at = CASE WHEN attempts >= max_attempts THEN ? ELSE NULL END,
+                    available_at = ? + ? * (1 << (attempts - 1)),
+                    error = ?, lease_owner = NULL, lease_expires_at = NULL
+                WHERE id = ? AND lease_owner = ? AND status = ?
+            """, (FAILED, QUEUED, now, now, self.retry_backoff, error, job_id, owner, RUNNING))
+        return cursor.rowcount == 1
+
+class JobWorker:
+    """Processo de trabalho: reserva jobs, executa no orquestrador e registra o resultado."""
+
+    def __init__(self, queue: JobQueue, orchestrator_factory: Callable[[Optional[str]], Any],
+                 default_model: Optional[str] = None, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        """
+        Inicializa o worker.
+
+        Args:
+            queue: Fila de jobs
+            orchestrator_factory: Função que cria um orquestrador para um modelo
+            default_model: Modelo dos jobs que não informam um (opcional)
+            poll_interval: Espera entre consultas com a fila vazia (segundos)
+        """
+        self.queue = queue
+        self.orchestrator_factory = orchestrator_factory
+        self.default_model = default_model
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._orchestrators: Dict[Optional[str], Any] = {}
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Solicita o encerramento após o job atual."""
+        self._stop.set()
+
+    def run(self) -> None:
+        """Processa jobs até stop() ser chamado."""
+        logger.info(f"Worker de jobs iniciado: {self.owner}")
+        # Aquece o modelo padrão antes do primeiro job
+        self._get_orchestrator(self.default_model)
+        while not self._stop.is_set():
+            job = self.queue.lease(self.owner)
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            self.process(job)
+        logger.info(f"Worker de jobs encerrado: {self.owner}")
+
+    def _get_orchestrator(self, model: Optional[str]):
+        if model not in self._orchestrators:
+            self._orchestrators[model] = self.orchestrator_factory(model)
+        return self._orchestrators[model]
+
+    def process(self, job: Job) -> None:
+        """Executa um job reservado, renovando o lease durante a execução."""
+        done = threading.Event()
+        interval = max(1.0, self.queue.visibility_timeout / 3)
+
+        def keep_alive() -> None:
+            while not done.wait(interval):
+                if not self.queue.heartbeat(job.id, self.owner):
+                    logger.warning(f"Lease do job {job.id} perdido")
+                    return
+
+        heartbeat = threading.Thread(target=keep_alive, name=f"lease-{job.id[:8]}", daemon=True)
+        heartbeat.start()
+        start = time.perf_counter()
+        logger.info(f"INÍCIO - job {job.id} (tentativa {job.attempts}/{job.max_attempts})")
+        try:
+            orchestrator = self._get_orchestrator(job.model or self.default_model)
+            result = orchestrator.execute(prompt=job.prompt, format=job.format)
+            run_id = None
+            try:
+                run_id = orchestrator.db.log_run(
+                    job.session_id,
+                    input=job.prompt,
+                    final_output=result.output,
+                    output_type=job.format,
+                    stages=result.raw_responses
+                )
+            except Exception as e:
+                logger.warning(f"Falha ao registrar execução do job {job.id}: {str(e)}")
+            done.set()
+            stored = self.queue.complete(job.id, self.owner, {
+                "output": result.output,
+                "guardrails": result.guardrails,
+                "model": orchestrator.model_manager.model_name,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+            }, run_id)
+            if stored:
+                logger.info(f"FIM - job {job.id} [{(time.perf_counter() - start):.1f}s]")
+            else:
+                logger.warning(f"Resultado do job {job.id} descartado: lease perdido")
+        except Exception as e:
+            done.set()
+            logger.error(f"FALHA - job {job.id} | Erro: {str(e)}")
+            self.queue.fail(job.id, self.owner, str(e))
+        finally:
+            done.set()
+
+def _worker_main(queue_config: Dict[str, Any], orchestrator_factory: Callable[[Optional[str]], Any],
+                 default_model: Optional[str], poll_interval: float) -> None:
+    """Ponto de entrada de cada processo do pool."""
+    queue = JobQueue.from_config(queue_config)
+    worker = JobWorker(queue, orchestrator_factory, default_model, poll_interval)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: worker.stop())
+    try:
+        worker.run()
+    finally:
+        queue.close()
+
+def run_worker_pool(queue_config: Dict[str, Any], orchestrator_factory: Callable[[Optional[str]], Any],
+                    processes: int = 1, default_model: Optional[str] = None,
+                    poll_interval: float = DEFAULT_POLL_INTERVAL) -> int:
+    """
+    Executa um pool de processos de trabalho até SIGTERM/SIGINT.
+
+    Cada processo mantém seu próprio orquestrador aquecido; o encerramento aguarda o
+    job atual de cada processo (jobs interrompidos à força voltam à fila quando o lease expira).
+
+    Args:
+        queue_config: Seção jobs do kernel.yaml
+        orchestrator_factory: Função (importável) que cria um orquestrador para um modelo
+        processes: Número de processos
+        default_model: Modelo padrão (opcional)
+        poll_interval: Espera entre consultas com a fila vazia (segundos)
+
+    Returns:
+        Código de saída (1 se algum processo terminou com erro)
+    """
+    # spawn: processos novos, sem herdar threads e estado nativo dos modelos do processo pai
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=_worker_main, name=f"job-worker-{i + 1}",
+                        args=(queue_config, orchestrator_factory, default_model, poll_interval))
+        for i in range(max(1, processes))
+    ]
+    for process in workers:
+        process.start()
+    logger.info(f"Pool de workers iniciado: {len(workers)} processos")
+
+    def forward(signum, _frame) -> None:
+        for process in workers:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in workers:
+        process.join()
+    logger.info("Pool de workers encerrado")
+    return 0 if all(process.exitcode == 0 for process in workers) else 1
@@ -0,0 +1,200 @@
+"""
+# src/core/keypool.py
+Várias chaves de API por provedor, com balanceamento e ejeção temporária.
+
+As chaves vêm da variável de ambiente do provedor (separadas por vírgula) e das
+variáveis numeradas `<VAR>_1`, `<VAR>_2`, ... Cada chave é identificada por uma
+impressão digital (prefixo do SHA-256), usada nos logs e no nome dos baldes de
+limite de taxa, de modo que o orçamento de cada chave é acompanhado separadamente
+e compartilhado entre processos.
+
+A cada chamada o pool escolhe, entre as chaves não ejetadas, a de menor espera
+estimada pelo orçamento e, em seguida, a com menos chamadas em andamento. Erros de
+cota (429) ejetam a chave pelo Retry-After; erros de autenticação, por mais tempo.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.core.logger import get_logger
+from src.core.ratelimit import RateLimitExceeded, get_retry_after, is_rate_limit_error
+
+logger = get_logger(__name__)
+
+DEFAULT_EJECT_SECONDS = 60.0
+DEFAULT_AUTH_EJECT_SECONDS = 600.0
+
+def get_api_keys(env_var: Optional[str]) -> List[str]:
+    """
+    Obtém as chaves de API de um provedor.
+
+    Args:
+        env_var: Variável de ambiente do provedor (ex: OPENAI_API_KEY)
+
+    Returns:
+        Chaves na ordem de declaração, sem duplicatas
+    """
+    if not env_var:
+        return []
+    values = [os.environ.get(env_var, "")]
+    index = 1
+    while os.environ.get(f"{env_var}_{index}"):
+        values.append(os.environ[f"{env_var}_{index}"])
+        index += 1
+
+    keys = []
+    for value in values:
+        for key in re.split(r"[,\s]+", value.strip()):
+            if key and key not in keys:
+                keys.append(key)
+    return keys
+
+def key_fingerprint(api_key: str) -> str:
+    """Identificador estável e não sensível de uma chave."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+def is_auth_error(error: Exception) -> bool:
+    """Verifica se um erro dos clientes remotos indica chave inválida ou sem permissão (401/403)."""
+    if getattr(error, "status_code", None) in (401, 403) or getattr(error, "code", None) in (401, 403):
+        return True
+    return type(error).__name__ in ("AuthenticationError", "PermissionDeniedError", "PermissionDenied",
+                                    "Unauthenticated")
+
+class ApiKey:
+    """Chave de um provedor, com seu cliente e estado de uso."""
+
+    def __init__(self, provider: str, fingerprint: str, client: Any):
+        self.provider = provider
+        self.fingerprint = fingerprint
+        self.client = client
+        self.in_flight = 0
+        self.ejected_until = 0.0
+        self.last_used = 0.0
+        self.failures = 0
+
+    @property
+    def bucket(self) -> str:
+        """Nome do balde de limite de taxa da chave."""
+        return f"{self.provider}:{self.fingerprint}"
+
+class KeyPool:
+    """Chaves de um provedor com escolha balanceada e ejeção temporária."""
+
+    def __init__(self, provider: str, keys: List[Tuple[str, Any]],
+                 eject_seconds: float = DEFAULT_EJECT_SECONDS,
+                 auth_eject_seconds: float = DEFAULT_AUTH_EJECT_SECONDS):
+        """
+        Inicializa o pool.
+
+        Args:
+            provider: Provedor (ex: "openai")
+            keys: Lista de (impressão digital, cliente)
+            eject_seconds: Ejeção padrão após erro de cota sem Retry-After (s)
+            auth_eject_seconds: Ejeção após erro de autenticação (s)
+        """
+        self.provider = provider
+        self.keys = [ApiKey(provider, fingerprint, client) for fingerprint, client in keys]
+        self.eject_seconds = eject_seconds
+        self.auth_eject_seconds = auth_eject_seconds
+        self._lock = threading.Lock()
+
+    def acquire(self, estimate_wait: Optional[Callable[[str], float]] = None) -> ApiKey:
+        """
+        Escolhe a chave da próxima chamada.
+
+        Args:
+            estimate_wait: Função que estima a espera (s) pelo orçamento de um balde (opcional)
+
+        Returns:
+            Chave reservada (devolver com release)
+
+        Raises:
+            RateLimitExceeded: Todas as chaves estão ejetadas
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = [key for key in self.keys if key.ejected_until <= now]
+        if not available:
+            retry_after = min(key.ejected_until for key in self.keys) - now
+            raise RateLimitExceeded(self.provider, retry_after)
+
+        # A estimativa consulta o banco compartilhado; fica fora do lock
+        waits = {key.fingerprint: estimate_wait(key.bucket) for key in available} if estimate_wait else {}
+        with self._lock:
+            key = min(available, key=lambda k: (round(waits.get(k.fingerprint, 0.0), 1), k.in_flight, k.last_used))
+            key.in_flight += 1
+            key.last_used = now
+            return key
+
+    def release(self, key: ApiKey, error: Optional[Exception] = None) -> None:
+        """
+        Devolve a chave; erros de cota ou autenticação a ejetam temporariamente.
+
+        Args:
+            key: Chave reservada
+            error: Erro da chamada (opcional)
+        """
+        seconds = None
+        if error is not None and is_rate_limit_error(error):
+            seconds = get_retry_after(error) or self.eject_seconds
+        elif error is not None and is_auth_error(error):
+            seconds = self.auth_eject_seconds
+
+        with self._lock:
+            key.in_flight -= 1
+            if seconds is None:
+                if error is None:
+                    key.failures = 0
+                return
+            key.failures += 1
+            key.ejected_until = time.monotonic() + seconds
+        logger.warning(f"Chave {key.fingerprint} de {self.provider} ejetada por {seconds:.0f}s "
+                       f"({type(error).__name__})")
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Estado das chaves (sem expor os valores)."""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "key": key.fingerprint,
+                "in_flight": key.in_flight,
+                "ejected_for_s": round(max(0.0, key.ejected_until - now), 1),
+                "failures": key.failures
+            } for key in self.keys]
+
+_pools: Dict[Tuple[str, Tuple[str, ...]], KeyPool] = {}
+_pools_lock = threading.Lock()
+
+def get_key_pool(provider: str, api_keys: List[str], client_factory: Callable[[str], Any],
+                 config: Optional[Dict[str, Any]] = None) -> KeyPool:
+    """
+    Obtém o pool do processo para um conjunto de chaves, criando os clientes uma única vez.
+
+    O pool (e o estado de ejeção) é compartilhado por todas as instâncias de ModelManager.
+
+    Args:
+        provider: Provedor (ex: "openai")
+        api_keys: Chaves do provedor
+        client_factory: Cria o cliente de uma chave
+        config: Seção models.rate_limits do kernel.yaml (opcional)
+
+    Returns:
+        KeyPool
+    """
+    config = config or {}
+    fingerprints = tuple(key_fingerprint(api_key) for api_key in api_keys)
+    with _pools_lock:
+        pool = _pools.get((provider, fingerprints))
+        if pool is None:
+            pool = KeyPool(
+                provider,
+                [(fingerprint, client_factory(api_key)) for fingerprint, api_key in zip(fingerprints, api_keys)],
+                eject_seconds=config.get('key_eject_seconds', DEFAULT_EJECT_SECONDS),
+                auth_eject_seconds=config.get('key_auth_eject_seconds', DEFAULT_AUTH_EJECT_SECONDS)
+            )
+            _pools[(provider, fingerprints)] = pool
+            logger.info(f"{len(api_keys)} chave(s) de API para {provider}: {', '.join(fingerprints)}")
+        return pool
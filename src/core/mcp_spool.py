@@ -0,0 +1,261 @@
+"""
+# src/core/mcp_spool.py
+Worker MCP baseado em diretório de spool.
+
+Layout do spool:
+    incoming/    Mensagens novas (*.json); o cliente grava em um nome temporário
+                 (iniciado por "." ou terminado em ".tmp") e renomeia ao concluir
+    processing/  Mensagens em execução, reivindicadas por rename atômico
+                 (`<id>.<pid>.json`), o que permite vários workers no mesmo spool
+    outgoing/    Respostas (`<id>.json`), gravadas em arquivo temporário e renomeadas
+    failed/      Mensagens que não puderam ser processadas
+
+Os arquivos são detectados via watchdog; uma varredura periódica cobre eventos
+perdidos e as mensagens que já estavam no spool ao iniciar.
+
+Com um escalonador, cada mensagem aguarda a vaga da classe de prioridade da sua
+sessão (metadata.session_id) antes de ser reivindicada; com a fila cheia ela
+permanece em incoming/ e é reagendada na próxima varredura.
+"""
+import json
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Set
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from src.core.logger import get_logger
+from src.core.scheduler import FairScheduler, SchedulerSaturated, Ticket
+
+logger = get_logger(__name__)
+
+DEFAULT_RESCAN_INTERVAL = 5.0
+
+def is_message_file(name: str) -> bool:
+    """Verifica se um nome de arquivo é uma mensagem pronta (não temporária)."""
+    return name.endswith(".json") and not name.startswith(".")
+
+def read_session_id(path: str) -> Optional[str]:
+    """
+    Obtém o metadata.session_id de uma mensagem do spool.
+
+    Args:
+        path: Caminho da mensagem
+
+    Returns:
+        Sessão ou None (texto puro, JSON inválido ou sem sessão)
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            metadata = json.load(f).get("metadata") or {}
+        session_id = metadata.get("session_id")
+        return str(session_id) if session_id else None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def write_atomic(path: str, data: str) -> None:
+    """
+    Grava um arquivo via arquivo temporário e rename, para que leitores nunca vejam conteúdo parcial.
+
+    Args:
+        path: Caminho final
+        data: Conteúdo
+    """
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class _SpoolEventHandler(FileSystemEventHandler):
+    """Encaminha ao worker os arquivos criados ou renomeados em incoming/."""
+
+    def __init__(self, worker: "SpoolWorker"):
+        super().__init__()
+        self.worker = worker
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.worker.enqueue(os.path.basename(event.src_path))
+
+    def on_moved(self, event):
+        if not event.is_directory and os.path.dirname(event.dest_path) == self.worker.incoming_dir:
+            self.worker.enqueue(os.path.basename(event.dest_path))
+
+class SpoolWorker:
+    """Observa o spool e processa cada mensagem em um pool de threads."""
+
+    def __init__(self, spool_dir: str, handle: Callable[[str, str], None], workers: int = 2,
+                 warm_up: Optional[Callable[[], Any]] = None,
+                 rescan_interval: float = DEFAULT_RESCAN_INTERVAL,
+                 scheduler: Optional[FairScheduler] = None):
+        """
+        Inicializa o worker.
+
+        Args:
+            spool_dir: Diretório do spool
+            handle: Processa uma mensagem: recebe o caminho da entrada e o da resposta
+                    (executada nas threads do pool)
+            workers: Número de mensagens processadas simultaneamente
+            warm_up: Função executada em cada thread do pool ao iniciar (opcional)
+            rescan_interval: Intervalo da varredura de segurança em segundos
+            scheduler: Escalonador por prioridade das mensagens (opcional; deve ter `workers` vagas)
+        """
+        self.spool_dir = os.path.abspath(spool_dir)
+        self.incoming_dir = os.path.join(self.spool_dir, "incoming")
+        self.processing_dir = os.path.join(self.spool_dir, "processing")
+        self.outgoing_dir = os.path.join(self.spool_dir, "outgoing")
+        self.failed_dir = os.path.join(self.spool_dir, "failed")
+        self.handle = handle
+        self.workers = max(1, workers)
+        self.warm_up = warm_up
+        self.rescan_interval = rescan_interval
+        self.scheduler = scheduler
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mcp-spool")
+        self._scheduled: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def serve(self) -> int:
+        """
+        Processa mensagens até receber SIGTERM/SIGINT e conclui as que estão em execução.
+
+        Returns:
+            Código de saída
+        """
+        for path in (self.incoming_dir, self.processing_dir, self.outgoing_dir, self.failed_dir):
+            os.makedirs(path, exist_ok=True)
+        self.recover()
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: self._stop.set())
+
+        if self.warm_up:
+            for _ in range(self.workers):
+                self._executor.submit(self._run_warm_up)
+
+        observer = Observer()
+        observer.schedule(_SpoolEventHandler(self), self.incoming_dir, recursive=False)
+        observer.start()
+        logger.info(f"MCP spool iniciado em {self.spool_dir} [workers={self.workers}]")
+
+        try:
+            while not self._stop.is_set():
+                self.rescan()
+                self._stop.wait(self.rescan_interval)
+        finally:
+            logger.info("Encerrando MCP spool; aguardando mensagens em execução")
+            observer.stop()
+            observer.join()
+            # Mensagens ainda não iniciadas não foram reivindicadas e continuam em incoming/
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            logger.info("MCP spool encerrado")
+        return 0
+
+    def _run_warm_up(self) -> None:
+        try:
+            self.warm_up()
+        except Exception as e:
+            logger.error(f"Falha no aquecimento do MCP spool: {str(e)}")
+
+    def rescan(self) -> None:
+        """Agenda as mensagens presentes em incoming/ (ordem de nome)."""
+        try:
+            names = sorted(os.listdir(self.incoming_dir))
+        except OSError as e:
+            logger.warning(f"Falha ao listar {self.incoming_dir}: {str(e)}")
+            return
+        for name in names:
+            self.enqueue(name)
+
+    def recover(self) -> None:
+        """Devolve a incoming/ as mensagens reivindicadas por processos que não existem mais."""
+        for name in os.listdir(self.processing_dir):
+            stem, _, suffix = name.rpartition(".json")[0].rpartition(".")
+            try:
+                pid = int(suffix)
+            except ValueError:
+                continue
+            if pid != os.getpid() and self._process_alive(pid):
+                continue
+            try:
+                os.rename(os.path.join(self.processing_dir, name), os.path.join(self.incoming_dir, f"{stem}.json"))
+                logger.info(f"Mensagem {stem} devolvida ao spool (worker {pid} encerrado)")
+            except OSError as e:
+                logger.warning(f"Falha ao recuperar {name}: {str(e)}")
+
+    @staticmethod
+    def _process_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def enqueue(self, name: str) -> None:
+        """
+        Agenda uma mensagem de incoming/ (ignora temporários e duplicatas).
+
+        Args:
+            name: Nome do arquivo em incoming/
+        """
+        if self._stop.is_set() or not is_message_file(name):
+            return
+        with self._lock:
+            if name in self._scheduled:
+                return
+            self._scheduled.add(name)
+
+        if self.scheduler is None:
+            self._start(name)
+            return
+        session_id = read_session_id(os.path.join(self.incoming_dir, name))
+        try:
+            self.scheduler.submit(session_id, "mcp", on_grant=lambda ticket: self._start(name, ticket))
+        except SchedulerSaturated as e:
+            # A mensagem continua em incoming/ e volta na próxima varredura
+            logger.debug(f"Mensagem {name} adiada: {str(e)}")
+            with self._lock:
+                self._scheduled.discard(name)
+
+    def _start(self, name: str, ticket: Optional[Ticket] = None) -> None:
+        try:
+            self._executor.submit(self._process, name, ticket)
+        except RuntimeError:
+            # Pool já encerrado
+            with self._lock:
+                self._scheduled.discard(name)
+            if ticket is not None:
+                self.scheduler.release(ticket)
+
+    def _process(self, name: str, ticket: Optional[Ticket] = None) -> None:
+        """Reivindica, processa e responde uma mensagem."""
+        stem = name[:-len(".json")]
+        claimed = os.path.join(self.processing_dir, f"{stem}.{os.getpid()}.json")
+        try:
+            try:
+                os.rename(os.path.join(self.incoming_dir, name), claimed)
+            except FileNotFoundError:
+                # Já processada ou reivindicada por outro worker
+                return
+
+            output_path = os.path.join(self.outgoing_dir, f"{stem}.json")
+            logger.info(f"INÍCIO - mensagem {stem}")
+            try:
+                self.handle(claimed, output_path)
+                os.remove(claimed)
+                logger.info(f"FIM - mensagem {stem} | resposta em {output_path}")
+            except Exception as e:
+                logger.error(f"Falha ao processar mensagem {stem}: {str(e)}")
+                os.replace(claimed, os.path.join(self.failed_dir, name))
+        finally:
+            with self._lock:
+                self._scheduled.discard(name)
+            if ticket is not None:
+                self.scheduler.release(ticket)
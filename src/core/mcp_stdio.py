@@ -0,0 +1,319 @@
+"""
+# src/core/mcp_stdio.py
+Transporte MCP persistente sobre stdin/stdout (JSON-RPC 2.0, uma mensagem por linha).
+
+O processo permanece ativo até o fim do stdin, mantendo os modelos aquecidos entre
+as requisições. Chamadas de ferramenta executam concorrentemente em um pool de
+threads e cada resposta é escrita assim que fica pronta, identificada pelo `id` da
+requisição (a ordem de saída pode diferir da ordem de entrada).
+
+Métodos suportados:
+    initialize, ping, tools/list, tools/call    Subconjunto do Model Context Protocol
+    execute                                     Mensagem no formato do modo MCP por arquivo
+                                                ({"content", "metadata"}) e resposta idem
+    notifications/cancelled                     Descarta uma requisição ainda não iniciada
+
+Com um escalonador, as execuções entram na fila da classe de prioridade da sessão
+(metadata.session_id) e iniciam na ordem de divisão justa; com a fila cheia a
+requisição é respondida na hora com o erro SERVER_BUSY e data.retry_after.
+"""
+import json
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Set, TextIO
+
+from src.core.kernel import BASE_DIR
+from src.core.logger import get_logger
+from src.core.scheduler import FairScheduler, SchedulerSaturated, Ticket
+
+logger = get_logger(__name__)
+
+PROTOCOL_VERSION = "2024-11-05"
+SERVER_NAME = "prompt-tdd"
+TOOL_NAME = "prompt_tdd"
+FORMATS = ["json", "markdown", "text"]
+
+# Códigos de erro do JSON-RPC 2.0
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+# Erro do servidor (faixa reservada -32000 a -32099): fila da classe de prioridade cheia
+SERVER_BUSY = -32000
+
+TOOL = {
+    "name": TOOL_NAME,
+    "description": "Gera um prompt TDD estruturado (requisitos, campos e critérios) a partir de uma descrição.",
+    "inputSchema": {
+        "type": "object",
+        "properties": {
+            "prompt": {"type": "string", "description": "Descrição da funcionalidade"},
+            "format": {"type": "string", "enum": FORMATS, "default": "json"},
+            "session_id": {"type": "string", "description": "Sessão usada na prioridade e na divisão justa"}
+        },
+        "required": ["prompt"]
+    }
+}
+
+class JsonRpcError(Exception):
+    """Erro retornado ao cliente no campo error da resposta."""
+
+    def __init__(self, code: int, message: str, data: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+def get_server_version() -> str:
+    """Versão do pacote (arquivo .version.json)."""
+    try:
+        with open(os.path.join(BASE_DIR, ".version.json"), "r", encoding="utf-8") as f:
+            return json.load(f)["current"]
+    except (OSError, ValueError, KeyError):
+        return "0.0.0"
+
+class StdioServer:
+    """Laço JSON-RPC sobre stdin/stdout com execução concorrente das mensagens."""
+
+    def __init__(self, process: Callable[[Dict[str, Any]], Dict[str, Any]], workers: int = 2,
+                 warm_up: Optional[Callable[[], Any]] = None,
+                 stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None,
+                 scheduler: Optional[FairScheduler] = None):
+        """
+        Inicializa o servidor.
+
+        Args:
+            process: Processa uma mensagem {"content", "metadata"} e retorna {"content", "metadata"}
+                     (executada nas threads do pool)
+            workers: Número de mensagens processadas simultaneamente
+            warm_up: Função executada em cada thread do pool ao iniciar (opcional)
+            stdin: Entrada (padrão: sys.stdin)
+            stdout: Saída do protocolo (padrão: sys.stdout, isolado do restante do processo)
+            scheduler: Escalonador por prioridade das execuções (opcional; deve ter `workers` vagas)
+        """
+        self.process = process
+        self.workers = max(1, workers)
+        self.warm_up = warm_up
+        self.stdin = stdin
+        self.stdout = stdout
+        self.scheduler = scheduler
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mcp")
+        self._write_lock = threading.Lock()
+        self._pending: Dict[Any, Future] = {}
+        self._pending_lock = threading.Lock()
+        # Todas as execuções não concluídas (inclusive notificações e as que aguardam o escalonador)
+        self._outstanding: Set[Future] = set()
+
+    def serve(self) -> int:
+        """
+        Processa requisições até o fim do stdin e aguarda as execuções pendentes.
+
+        Returns:
+            Código de saída
+        """
+        if self.stdout is None:
+            self.stdout = self._isolate_stdout()
+        stdin = self.stdin or sys.stdin
+        logger.info(f"MCP stdio iniciado [workers={self.workers}]")
+
+        if self.warm_up:
+            for _ in range(self.workers):
+                self._executor.submit(self._run_warm_up)
+
+        for line in stdin:
+            line = line.strip()
+            if line:
+                self._handle_line(line)
+
+        logger.info("Fim da entrada; aguardando requisições pendentes")
+        with self._pending_lock:
+            outstanding = list(self._outstanding)
+        wait(outstanding)
+        self._executor.shutdown(wait=True)
+        logger.info("MCP stdio encerrado")
+        return 0
+
+    @staticmethod
+    def _isolate_stdout() -> TextIO:
+        """
+        Reserva o stdout para o protocolo.
+
+        Qualquer outra escrita no descritor 1 (prints, bibliotecas nativas) passa a ir
+        para o stderr, para não corromper as mensagens JSON-RPC.
+        """
+        sys.stdout.flush()
+        protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8", buffering=1)
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        sys.stdout = sys.stderr
+        return protocol
+
+    def _run_warm_up(self) -> None:
+        try:
+            self.warm_up()
+        except Exception as e:
+            logger.error(f"Falha no aquecimento do MCP: {str(e)}")
+
+    def _write(self, message: Dict[str, Any]) -> None:
+        data = json.dumps(message, ensure_ascii=False, default=str)
+        with self._write_lock:
+            self.stdout.write(data + "\n")
+            self.stdout.flush()
+
+    def _reply(self, request_id: Any, result: Any = None, error: Optional[JsonRpcError] = None) -> None:
+        message = {"jsonrpc": "2.0", "id": request_id}
+        if error:
+            message["error"] = {"code": error.code, "message": error.message}
+            if error.data:
+                message["error"]["data"] = error.data
+        else:
+            message["result"] = result
+        self._write(message)
+
+    def _handle_line(self, line: str) -> None:
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            self._reply(None, error=JsonRpcError(PARSE_ERROR, f"JSON inválido: {str(e)}"))
+            return
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            self._reply(request.get("id") if isinstance(request, dict) else None,
+                        error=JsonRpcError(INVALID_REQUEST, "Requisição JSON-RPC inválida"))
+            return
+
+        method = request["method"]
+        params = request.get("params")
+        if params is None:
+            params = {}
+        # Notificações (sem id) não têm resposta
+        is_notification = "id" not in request
+        request_id = request.get("id")
+
+        try:
+            # Apenas parâmetros nomeados; listas (parâmetros posicionais) não são aceitas
+            if not isinstance(params, dict):
+                raise JsonRpcError(INVALID_PARAMS, "Parâmetros devem ser um objeto")
+            if method == "notifications/cancelled":
+                self._cancel(params.get("requestId"))
+            elif method.startswith("notifications/"):
+                pass
+            elif method in ("tools/call", "execute"):
+                self._submit(request_id, method, params, is_notification)
+            elif not is_notification:
+                self._reply(request_id, self._handle_sync(method, params))
+        except JsonRpcError as e:
+            if not is_notification:
+                self._reply(request_id, error=e)
+        except Exception as e:
+            # Um erro inesperado não pode encerrar o laço de leitura nem as respostas pendentes
+            logger.error(f"FALHA - {method} | Erro ao processar requisição {request_id}: {str(e)}", exc_info=True)
+            if not is_notification:
+                self._reply(request_id, error=JsonRpcError(INTERNAL_ERROR, str(e)))
+
+    def _handle_sync(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Métodos respondidos imediatamente na thread de leitura."""
+        if method == "initialize":
+            return {
+                "protocolVersion": params.get("protocolVersion", PROTOCOL_VERSION),
+                "capabilities": {"tools": {}},
+                "serverInfo": {"name": SERVER_NAME, "version": get_server_version()}
+            }
+        if method == "ping":
+            return {}
+        if method == "tools/list":
+            return {"tools": [TOOL]}
+        raise JsonRpcError(METHOD_NOT_FOUND, f"Método não suportado: {method}")
+
+    def _submit(self, request_id: Any, method: str, params: Dict[str, Any], is_notification: bool) -> None:
+        """Agenda uma execução no pool; a resposta é escrita quando ela termina."""
+        message = self._to_message(method, params)
+        if self.scheduler is None:
+            future = self._executor.submit(self.process, message)
+        else:
+            future = self._schedule(message)
+        with self._pending_lock:
+            self._outstanding.add(future)
+            if not is_notification:
+                self._pending[request_id] = future
+        future.add_done_callback(lambda done: self._complete(request_id, method, done, is_notification))
+
+    def _schedule(self, message: Dict[str, Any]) -> Future:
+        """Registra a execução no escalonador; ela vai para o pool quando a vaga for concedida."""
+        future: Future = Future()
+
+        def run(ticket: Ticket) -> None:
+            try:
+                future.set_result(self.process(message))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self.scheduler.release(ticket)
+
+        def on_grant(ticket: Ticket) -> None:
+            # Requisição cancelada enquanto aguardava: devolve a vaga sem executar
+            if not future.set_running_or_notify_cancel():
+                self.scheduler.release(ticket)
+                return
+            self._executor.submit(run, ticket)
+
+        session_id = (message.get("metadata") or {}).get("session_id")
+        try:
+            self.scheduler.submit(session_id, "mcp", on_grant=on_grant)
+        except SchedulerSaturated as e:
+            raise JsonRpcError(SERVER_BUSY, str(e), {"retry_after": e.retry_after, "priority": e.priority})
+        return future
+
+    def _complete(self, request_id: Any, method: str, future: Future, is_notification: bool) -> None:
+        with self._pending_lock:
+            self._outstanding.discard(future)
+            if not is_notification:
+                self._pending.pop(request_id, None)
+        if is_notification or future.cancelled():
+            return
+        try:
+            response = future.result()
+        except Exception as e:
+            logger.error(f"Erro ao processar requisição {request_id}: {str(e)}")
+            self._reply(request_id, error=JsonRpcError(INTERNAL_ERROR, str(e)))
+            return
+
+        if method == "execute":
+            self._reply(request_id, response)
+            return
+        content = response.get("content")
+        text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False, default=str)
+        self._reply(request_id, {
+            "content": [{"type": "text", "text": text}],
+            "isError": (response.get("metadata") or {}).get("status") != "success"
+        })
+
+    def _cancel(self, request_id: Any) -> None:
+        with self._pending_lock:
+            future = self._pending.get(request_id)
+        if future is not None and future.cancel():
+            logger.info(f"Requisição {request_id} cancelada antes de iniciar")
+
+    @staticmethod
+    def _to_message(method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Converte os parâmetros para o formato de mensagem do modo MCP."""
+        if method == "execute":
+            if not isinstance(params.get("content"), str):
+                raise JsonRpcError(INVALID_PARAMS, "Campo 'content' obrigatório")
+            return {"content": params["content"], "metadata": params.get("metadata") or {}}
+
+        if params.get("name") != TOOL_NAME:
+            raise JsonRpcError(INVALID_PARAMS, f"Ferramenta desconhecida: {params.get('name')}")
+        arguments = params.get("arguments") or {}
+        if not isinstance(arguments, dict):
+            raise JsonRpcError(INVALID_PARAMS, "Argumentos devem ser um objeto")
+        if not isinstance(arguments.get("prompt"), str) or not arguments["prompt"].strip():
+            raise JsonRpcError(INVALID_PARAMS, "Argumento 'prompt' obrigatório")
+        format = arguments.get("format", "json")
+        if format not in FORMATS:
+            raise JsonRpcError(INVALID_PARAMS, f"Formato inválido: {format}")
+        metadata = {"options": {"format": format}}
+        if arguments.get("session_id"):
+            metadata["session_id"] = str(arguments["session_id"])
+        return {"content": arguments["prompt"], "metadata": metadata}
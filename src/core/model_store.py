@@ -0,0 +1,498 @@
+"""
+# src/core/model_store.py
+Armazenamento de modelos endereçado por conteúdo.
+
+Cada arquivo GGUF é guardado uma única vez em `blobs/sha256-<digest>.gguf` e os
+caminhos dos provedores (`dir`/`model`.gguf) apontam para o blob via hardlink
+(ou symlink quando o hardlink não é possível). Provedores que usam os mesmos
+pesos ou a mesma URL compartilham o blob, e blobs sem uso recente são removidos
+(LRU) quando o espaço ocupado excede a cota configurada.
+
+Vários processos podem usar o mesmo armazenamento: as alterações do índice são
+feitas sob um `flock` em `index.lock`, sobre a versão mais recente do arquivo, e
+cada processo mantém um lock compartilhado em `in_use/sha256-<digest>.lock` para
+os modelos que carregou, o que impede a remoção deles por qualquer processo.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas exclusão entre threads do processo
+    fcntl = None
+
+from src.core.kernel import get_env_var
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+IN_USE_DIR = "in_use"
+HASH_CHUNK_SIZE = 1024 * 1024
+# Intervalo mínimo entre gravações do último uso de um mesmo blob (segundos)
+TOUCH_INTERVAL = 600
+
+class ModelStore:
+    """Blobs de modelos por digest SHA-256, com cache de digests e cota de disco."""
+
+    def __init__(self, root: str, quota_bytes: Optional[int] = None):
+        """
+        Inicializa o armazenamento.
+
+        Args:
+            root: Diretório do armazenamento
+            quota_bytes: Espaço máximo ocupado pelos blobs (None = sem limite)
+        """
+        self.root = root
+        self.blobs_dir = os.path.join(root, "blobs")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self.in_use_dir = os.path.join(root, IN_USE_DIR)
+        self.quota_bytes = quota_bytes
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        # Digest -> descritor com o lock compartilhado dos modelos em uso neste processo
+        self._held: Dict[str, int] = {}
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        os.makedirs(self.in_use_dir, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(root, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        self._index_stat = None
+        self._index = self._load_index()
+
+    @classmethod
+    def from_config(cls, base_dir: str, config: Optional[Dict[str, Any]] = None,
+                    env_vars: Optional[Dict[str, str]] = None) -> "ModelStore":
+        """
+        Cria o armazenamento a partir da seção models.store do kernel.yaml.
+
+        A cota pode ser sobreposta pela variável de ambiente configurada em
+        env_vars.store_quota_gb.
+
+        Args:
+            base_dir: Diretório raiz do projeto
+            config: Configuração do armazenamento (opcional)
+            env_vars: Mapeamento de variáveis de ambiente (opcional)
+
+        Returns:
+            ModelStore configurado
+        """
+        config = config or {}
+        env_vars = env_vars or {}
+        root = os.path.join(base_dir, os.path.normpath(config.get('dir', './models/store')))
+
+        quota_gb = config.get('quota_gb')
+        env_quota = get_env_var(env_vars['store_quota_gb']) if env_vars.get('store_quota_gb') else None
+        if env_quota:
+            try:
+                quota_gb = float(env_quota)
+            except ValueError:
+                logger.warning(f"Cota inválida em {env_vars['store_quota_gb']}: {env_quota}")
+
+        quota_bytes = int(float(quota_gb) * 1024 ** 3) if quota_gb else None
+        return cls(root, quota_bytes=quota_bytes)
+
+    def _load_index(self) -> Dict[str, Any]:
+        self._index_stat = self._stat_index()
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("blobs", {})
+        index.setdefault("digests", {})
+        return index
+
+    def _stat_index(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.index_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh_index(self) -> None:
+        """Relê o índice se outro processo o gravou (o arquivo é sempre substituído por inteiro)."""
+        with self._lock:
+            if self._stat_index() != self._index_stat:
+                self._index = self._load_index()
+
+    def _save_index(self) -> None:
+        tmp_path = f"{self.index_path}.tmp.{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+        self._index_stat = self._stat_index()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """
+        Exclusão mútua entre threads e processos para alterar o índice.
+
+        Ao obter o lock o índice é relido, então cada alteração é aplicada sobre a
+        versão mais recente e as gravações dos demais processos são preservadas.
+        """
+        with self._lock:
+            if self._lock_depth == 0:
+                if fcntl:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+                self._refresh_index()
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def blob_path(self, digest: str) -> str:
+        """Caminho do blob de um digest."""
+        return os.path.join(self.blobs_dir, f"sha256-{digest}.gguf")
+
+    def temp_path(self, name: str) -> str:
+        """Caminho temporário (no mesmo sistema de arquivos dos blobs) para um download."""
+        return os.path.join(self.tmp_dir, name)
+
+    def has_blob(self, digest: Optional[str]) -> bool:
+        """Verifica se o blob de um digest está presente."""
+        return bool(digest) and os.path.exists(self.blob_path(digest.lower()))
+
+    def find_by_url(self, url: str) -> Optional[str]:
+        """
+        Obtém o digest de um blob já baixado de uma URL.
+
+        Args:
+            url: URL de download
+
+        Returns:
+            Digest ou None se a URL nunca foi baixada
+        """
+        self._refresh_index()
+        with self._lock:
+            for digest, blob in self._index["blobs"].items():
+                if url in blob.get("urls", []) and self.has_blob(digest):
+                    return digest
+        return None
+
+    def digest_for(self, path: str) -> str:
+        """
+        Obtém o SHA-256 de um arquivo, usando o cache por inode, mtime e tamanho.
+
+        Args:
+            path: Caminho do arquivo
+
+        Returns:
+            Digest SHA-256 em hexadecimal
+        """
+        cached = self.cached_digest(path)
+        if cached:
+            return cached
+
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        self.remember_digest(path, digest)
+        return digest
+
+    def cached_digest(self, path: str) -> Optional[str]:
+        """
+        Obtém o digest de um arquivo apenas se estiver no cache (sem ler o conteúdo).
+
+        Args:
+            path: Caminho do arquivo
+
+        Returns:
+            Digest SHA-256 ou None se ausente do cache ou se o arquivo mudou
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        self._refresh_index()
+        with self._lock:
+            cached = self._index["digests"].get(f"{stat.st_dev}:{stat.st_ino}")
+        if cached and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            return cached["digest"]
+        return None
+
+    def remember_digest(self, path: str, digest: str) -> None:
+        """
+        Registra o digest de um arquivo já verificado (ex: calculado durante o download).
+
+        Args:
+            path: Caminho do arquivo
+            digest: Digest SHA-256
+        """
+        stat = os.stat(path)
+        with self._locked():
+            self._index["digests"][f"{stat.st_dev}:{stat.st_ino}"] = {
+                "digest": digest.lower(),
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size
+            }
+            self._save_index()
+
+    def add(self, path: str, digest: Optional[str] = None, url: Optional[str] = None) -> str:
+        """
+        Move um arquivo para o armazenamento (ou descarta se o blob já existir).
+
+        Args:
+            path: Arquivo a ser armazenado
+            digest: Digest SHA-256 já conhecido (opcional)
+            url: URL de origem (opcional)
+
+        Returns:
+            Digest do blob
+        """
+        digest = (digest or self.digest_for(path)).lower()
+        blob = self.blob_path(digest)
+        with self._locked():
+            if os.path.exists(blob):
+                if not os.path.samefile(path, blob):
+                    os.remove(path)
+            else:
+                os.replace(path, blob)
+                os.chmod(blob, 0o444)
+            self._index["blobs"].setdefault(digest, {"urls": [], "links": [], "last_used": time.time()})
+            entry = self._index["blobs"][digest]
+            entry["size"] = os.path.getsize(blob)
+            if url and url not in entry["urls"]:
+                entry["urls"].append(url)
+            self._save_index()
+        self.remember_digest(blob, digest)
+        return digest
+
+    def link(self, digest: str, dest_path: str) -> str:
+        """
+        Faz um caminho de provedor apontar para o blob.
+
+        Args:
+            digest: Digest do blob
+            dest_path: Caminho esperado pelo provedor
+
+        Returns:
+            Caminho do link criado
+        """
+        digest = digest.lower()
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_link = f"{dest_path}.link"
+        # Sob o lock do índice: outro processo não remove o blob entre a verificação e o link
+        with self._locked():
+            if os.path.lexists(tmp_link):
+                os.remove(tmp_link)
+            try:
+                os.link(blob, tmp_link)
+            except OSError:
+                if not os.path.exists(blob):
+                    raise
+                # Sistemas de arquivos diferentes ou sem suporte a hardlink
+                os.symlink(os.path.relpath(blob, os.path.dirname(dest_path)), tmp_link)
+            os.replace(tmp_link, dest_path)
+
+            entry = self._index["blobs"].setdefault(
+                digest, {"urls": [], "links": [], "size": os.path.getsize(blob)}
+            )
+            if dest_path not in entry["links"]:
+                entry["links"].append(dest_path)
+            entry["last_used"] = time.time()
+            self._save_index()
+        logger.debug(f"Link {dest_path} -> {blob}")
+        return dest_path
+
+    def adopt(self, path: str, url: Optional[str] = None) -> str:
+        """
+        Passa um arquivo de modelo existente para o armazenamento, mantendo o caminho.
+
+        Args:
+            path: Caminho do modelo (arquivo comum ou link para um blob)
+            url: URL de origem (opcional)
+
+        Returns:
+            Digest do modelo
+        """
+        digest = self.digest_for(path)
+        if self._is_linked(path, digest):
+            with self._locked():
+                entry = self._index["blobs"].get(digest)
+                if entry is not None and url and url not in entry["urls"]:
+                    entry["urls"].append(url)
+                    self._save_index()
+            if entry is not None:
+                return digest
+        self.add(path, digest=digest, url=url)
+        self.link(digest, path)
+        return digest
+
+    def _is_linked(self, path: str, digest: str) -> bool:
+        blob = self.blob_path(digest)
+        return os.path.exists(blob) and os.path.samefile(path, blob)
+
+    def touch(self, path: str) -> Optional[str]:
+        """
+        Marca o blob de um caminho de provedor como usado agora (para o LRU).
+
+        O índice só é regravado se o último uso registrado tiver mais de
+        TOUCH_INTERVAL segundos, então cargas sucessivas não reescrevem o arquivo.
+
+        Args:
+            path: Caminho do modelo
+
+        Returns:
+            Digest do blob ou None se o caminho não pertence ao armazenamento
+        """
+        digest = self.cached_digest(path)
+        if digest is None:
+            return None
+        with self._lock:
+            entry = self._index["blobs"].get(digest)
+            if entry is None:
+                return None
+            if time.time() - entry.get("last_used", 0) < TOUCH_INTERVAL:
+                return digest
+        with self._locked():
+            entry = self._index["blobs"].get(digest)
+            if entry is None:
+                return None
+            entry["last_used"] = time.time()
+            self._save_index()
+        return digest
+
+    def hold(self, path: str) -> Optional[str]:
+        """
+        Protege o blob de um caminho de provedor da remoção enquanto o processo existir.
+
+        O lock compartilhado em `in_use/` é visto por todos os processos e liberado
+        pelo sistema quando o processo termina, mesmo sem encerramento normal.
+
+        Args:
+            path: Caminho do modelo
+
+        Returns:
+            Digest do blob ou None se o caminho não pertence ao armazenamento
+        """
+        digest = self.cached_digest(path)
+        if digest is None:
+            return None
+        with self._lock:
+            if digest in self._held:
+                return digest
+            fd = os.open(self._in_use_path(digest), os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl:
+                # Aguarda uma remoção em andamento e confere se o blob ainda existe
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            if not self.has_blob(digest):
+                os.close(fd)
+                return None
+            self._held[digest] = fd
+        return digest
+
+    def release(self, digest: str) -> None:
+        """
+        Libera a proteção obtida com hold().
+
+        Args:
+            digest: Digest do blob
+        """
+        with self._lock:
+            fd = self._held.pop(digest.lower(), None)
+        if fd is not None:
+            os.close(fd)
+
+    def _in_use_path(self, digest: str) -> str:
+        return os.path.join(self.in_use_dir, f"sha256-{digest}.lock")
+
+    @contextmanager
+    def _exclusive_use(self, digest: str) -> Iterator[bool]:
+        """
+        Impede que outros processos passem a usar o blob durante a remoção.
+
+        Yields:
+            False se o blob está em uso (por este ou por outro processo)
+        """
+        if digest in self._held:
+            yield False
+            return
+        if not fcntl:
+            yield True
+            return
+        fd = os.open(self._in_use_path(digest), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                available = True
+            except BlockingIOError:
+                available = False
+            yield available
+        finally:
+            os.close(fd)
+
+    def usage_bytes(self) -> int:
+        """Espaço ocupado pelos blobs presentes."""
+        with self._lock:
+            return sum(
+                entry.get("size", 0) for digest, entry in self._index["blobs"].items()
+                if self.has_blob(digest)
+            )
+
+    def evict(self, keep: Iterable[str] = (), quota_bytes: Optional[int] = None) -> List[str]:
+        """
+        Remove os blobs usados há mais tempo até que o total caiba na cota.
+
+        Os links dos provedores também são removidos, pois um hardlink manteria o
+        espaço ocupado. Blobs protegidos com hold() por qualquer processo são mantidos.
+
+        Args:
+            keep: Digests que não podem ser removidos (ex: modelo recém-baixado)
+            quota_bytes: Cota em bytes (padrão: cota do armazenamento)
+
+        Returns:
+            Lista de digests removidos
+        """
+        quota_bytes = self.quota_bytes if quota_bytes is None else quota_bytes
+        if not quota_bytes:
+            return []
+
+        keep = {digest.lower() for digest in keep if digest}
+        evicted = []
+        with self._locked():
+            used = self.usage_bytes()
+            candidates = sorted(
+                (item for item in self._index["blobs"].items() if item[0] not in keep),
+                key=lambda item: item[1].get("last_used", 0)
+            )
+            for digest, entry in candidates:
+                if used <= quota_bytes:
+                    break
+                with self._exclusive_use(digest) as available:
+                    if not available:
+                        logger.debug(f"Modelo em uso mantido no armazenamento: sha256-{digest}")
+                        continue
+                    for link in entry.get("links", []):
+                        if os.path.lexists(link) and (os.path.islink(link) or self._is_linked(link, digest)):
+                            os.remove(link)
+                    blob = self.blob_path(digest)
+                    if os.path.exists(blob):
+                        os.remove(blob)
+                used -= entry.get("size", 0)
+                del self._index["blobs"][digest]
+                evicted.append(digest)
+                logger.info(f"Modelo removido do armazenamento (LRU): sha256-{digest} [{entry.get('size', 0)} bytes]")
+
+            if evicted:
+                self._index["digests"] = {
+                    key: value for key, value in self._index["digests"].items()
+                    if value["digest"] not in evicted
+                }
+                self._save_index()
+
+        if used > quota_bytes:
+            logger.warning(f"Armazenamento de modelos acima da cota [{used}/{quota_bytes} bytes]")
+        return evicted
@@ -2,13 +2,16 @@
 # src/core/models.py
 Gerenciador de modelos de IA com suporte a múltiplos provedores e fallback automático.
 """
-from typing import Any, Dict, Optional, Tuple, List, Callable
+from typing import Any, Dict, Iterator, Optional, Tuple, List, Callable
 import os
 import json
+import threading
+import time
 import yaml
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from dataclasses import dataclass
-import requests
+from dataclasses import dataclass, replace
 
 import google.generativeai as genai
 from pydantic import BaseModel
@@ -18,6 +21,13 @@ from anthropic import Anthropic
 from src.core.kernel import get_env_var
 from src.core.logger import get_logger
 from src.core.db import DatabaseManager
+from src.core.downloads import RangeDownloader
+from src.core.gguf import GGUFIndex, get_gguf_index
+from src.core.host import MB, get_available_memory
+from src.core.tuning import apply_host_profile, load_host_profile
+from src.core.model_store import ModelStore
+from src.core.keypool import KeyPool, get_api_keys, get_key_pool
+from src.core.ratelimit import RateLimitedCall, estimate_tokens, get_rate_limiter
 
 logger = get_logger(__name__)
 
@@ -31,6 +41,31 @@ class AgentResult:
     prompt: Optional[str] = None
     updated_at: Optional[str] = None
 
+@dataclass(frozen=True)
+class RequestContext:
+    """
+    Parâmetros de uma chamada ao ModelManager: modelo, temperatura, tokens e fallback.
+    
+    O contexto é imutável; a nova tentativa com o modelo de elevação usa um novo
+    contexto (fallback()), de modo que chamadas simultâneas no mesmo gerenciador
+    não interferem entre si.
+    """
+    model: str
+    temperature: float
+    max_tokens: Optional[int]
+    elevation_model: Optional[str] = None
+    fallback_enabled: bool = True
+    is_fallback: bool = False
+
+    @property
+    def can_fallback(self) -> bool:
+        """Se a chamada ainda pode ser repetida com o modelo de elevação."""
+        return self.fallback_enabled and not self.is_fallback and bool(self.elevation_model)
+
+    def fallback(self) -> "RequestContext":
+        """Contexto da nova tentativa com o modelo de elevação."""
+        return replace(self, model=self.elevation_model, is_fallback=True)
+
 def load_config() -> Dict[str, Any]:
     """
     Carrega as configurações do model manager do arquivo YAML.
@@ -44,6 +79,199 @@ def load_config() -> Dict[str, Any]:
         config = yaml.safe_load(f)
         return config["models"]
 
+class LocalModelEntry:
+    """Modelo local carregado (ou em carregamento) no pool de processo."""
+    
+    def __init__(self, provider_name: str):
+        """
+        Inicializa a entrada.
+        
+        Args:
+            provider_name: Nome do provedor local
+        """
+        self.provider_name = provider_name
+        self.state = "pending"
+        self.model: Any = None
+        self.draft: Any = None
+        self.error: Optional[str] = None
+        self.load_ms: Optional[float] = None
+        # Variante (quantização) escolhida e memória estimada, definidas no carregamento
+        self.model_file: Optional[str] = None
+        self.variant: Optional[str] = None
+        self.memory_mb: Optional[int] = None
+        # Instâncias Llama não são reentrantes: gerações no mesmo modelo são serializadas
+        self.lock = threading.Lock()
+        self._loaded = threading.Event()
+        
+    def to_dict(self) -> Dict[str, Any]:
+        """Retorna o estado da entrada em formato serializável."""
+        return {
+            "state": self.state,
+            "error": self.error,
+            "load_ms": self.load_ms,
+            "speculative": self.draft.mode if self.draft else None,
+            "variant": self.variant,
+            "memory_mb": self.memory_mb,
+            "model_file": self.model_file
+        }
+
+class LocalModelPool:
+    """
+    Pool de modelos locais compartilhado por todas as instâncias de ModelManager do processo.
+    
+    Cada modelo é carregado uma única vez; chamadas concorrentes para o mesmo provedor
+    aguardam o carregamento em andamento, sem bloquear os demais provedores.
+    """
+    
+    def __init__(self):
+        """Inicializa o pool vazio."""
+        self._lock = threading.Lock()
+        self._entries: Dict[str, LocalModelEntry] = {}
+        
+    def get_entry(self, provider_name: str) -> LocalModelEntry:
+        """
+        Obtém (ou cria) a entrada de um provedor.
+        
+        Args:
+            provider_name: Nome do provedor local
+            
+        Returns:
+            Entrada do pool
+        """
+        with self._lock:
+            entry = self._entries.get(provider_name)
+            if entry is None:
+                entry = LocalModelEntry(provider_name)
+                self._entries[provider_name] = entry
+            return entry
+            
+    def acquire(self, provider_name: str, loader: Callable[[], Tuple[Any, Any]]) -> LocalModelEntry:
+        """
+        Obtém a entrada de um provedor, carregando o modelo se ainda não estiver carregado.
+        
+        Args:
+            provider_name: Nome do provedor local
+            loader: Função que carrega e retorna (modelo, rascunho especulativo)
+            
+        Returns:
+            Entrada do pool (state "ready" ou "error")
+        """
+        entry = self.get_entry(provider_name)
+        
+        with self._lock:
+            should_load = entry.state == "pending"
+            if should_load:
+                entry.state = "loading"
+                
+        if not should_load:
+            entry._loaded.wait()
+            return entry
+            
+        start = time.perf_counter()
+        try:
+            entry.model, entry.draft = loader()
+            entry.state = "ready"
+            logger.info(f"Modelo local {provider_name} pronto [{(time.perf_counter() - start) * 1000:.0f}ms]")
+        except Exception as e:
+            entry.state = "error"
+            entry.error = str(e)
+            logger.warning(f"Falha ao carregar modelo local {provider_name}: {str(e)}")
+        finally:
+            entry.load_ms = round((time.perf_counter() - start) * 1000, 1)
+            entry._loaded.set()
+        return entry
+        
+    def memory_in_use_mb(self, exclude: Optional[str] = None) -> int:
+        """
+        Soma a memória estimada dos modelos carregados (ou em carregamento).
+        
+        Args:
+            exclude: Provedor a ser desconsiderado (ex: o que está sendo carregado)
+            
+        Returns:
+            Memória em MB
+        """
+        with self._lock:
+            return sum(
+                entry.memory_mb or 0 for name, entry in self._entries.items()
+                if name != exclude and entry.state in ("loading", "ready")
+            )
+            
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Obtém o estado de todos os modelos locais conhecidos pelo pool.
+        
+        Returns:
+            Dict provedor -> estado
+        """
+        with self._lock:
+            return {name: entry.to_dict() for name, entry in self._entries.items()}
+
+class ModelWarmup:
+    """Estado de prontidão dos modelos aquecidos em segundo plano."""
+    
+    def __init__(self):
+        """Inicializa o rastreador vazio."""
+        self._condition = threading.Condition()
+        self._models: Dict[str, Dict[str, Any]] = {}
+        
+    def set_state(self, model_name: str, provider: str, state: str, error: Optional[str] = None,
+                  elapsed_ms: Optional[float] = None) -> None:
+        """
+        Atualiza o estado de um modelo.
+        
+        Args:
+            model_name: Nome do modelo
+            provider: Nome do provedor
+            state: pending, loading, ready ou error
+            error: Mensagem de erro (opcional)
+            elapsed_ms: Tempo de carregamento e priming em ms (opcional)
+        """
+        with self._condition:
+            self._models[model_name] = {
+                "provider": provider,
+                "state": state,
+                "error": error,
+                "elapsed_ms": elapsed_ms
+            }
+            self._condition.notify_all()
+            
+    def wait(self, model_name: str, timeout: Optional[float] = None) -> bool:
+        """
+        Aguarda o fim do aquecimento de um modelo.
+        
+        Args:
+            model_name: Nome do modelo
+            timeout: Tempo máximo de espera em segundos (opcional)
+            
+        Returns:
+            True se o modelo está pronto, False se falhou, expirou ou não está em aquecimento
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._models.get(model_name, {}).get("state") not in ("pending", "loading"),
+                timeout=timeout
+            )
+            return self._models.get(model_name, {}).get("state") == "ready"
+            
+    def status(self) -> Dict[str, Any]:
+        """
+        Obtém o estado de prontidão.
+        
+        Returns:
+            Dict com a flag geral "ready" e o estado por modelo
+        """
+        with self._condition:
+            models = {name: dict(state) for name, state in self._models.items()}
+        return {
+            "ready": bool(models) and all(m["state"] == "ready" for m in models.values()),
+            "models": models
+        }
+
+# Estado compartilhado pelo processo: modelos locais carregados e prontidão do aquecimento
+LOCAL_MODELS = LocalModelPool()
+WARMUP = ModelWarmup()
+
 class ModelConfig(BaseModel):
     """Configuração de um modelo."""
     provider: str  # Alterado de ModelProvider para str para compatibilidade com nomes dinâmicos
@@ -73,7 +301,6 @@ class ModelManager:
         defaults = self.registry.get_defaults()
         
         # Usa parâmetros explícitos se fornecidos, senão usa os valores padrão do arquivo de configuração
-        self.model_name = model_name or defaults["model"]
         self.elevation_model = elevation_model or defaults["elevation_model"]
         self.fallback_model = fallback_model or defaults["fallback_model"]
         self.timeout = defaults["timeout"]
@@ -82,56 +309,122 @@ class ModelManager:
         # Configuração de fallback - mantém a variável de ambiente aqui por ser útil em tempo de execução
         self.fallback_enabled = get_env_var(env['fallback_enabled'], str(self.config['fallback']['enabled'])).lower() == 'true'
         
+        # Contexto padrão das chamadas; configure() o substitui por inteiro, sob o lock
+        self._config_lock = threading.Lock()
+        self._context = RequestContext(
+            model=model_name or defaults["model"],
+            temperature=defaults['temperature'],
+            max_tokens=defaults['max_tokens'],
+            elevation_model=self.elevation_model,
+            fallback_enabled=self.fallback_enabled
+        )
+        
         # Cache de respostas - mantém as variáveis de ambiente aqui por serem úteis em tempo de execução
         self.cache_enabled = get_env_var(env['cache_enabled'], str(self.config['cache']['enabled'])).lower() == 'true'
         self.cache_ttl = int(get_env_var(env['cache_ttl'], str(self.config['cache']['ttl'])))
         
-        # Inicializa banco de dados
-        self.db = DatabaseManager()
+        # Cache de gramáticas para decodificação JSON restrita (modelos locais)
+        self._grammar_cache: Dict[str, Any] = {}
+        self._grammar_lock = threading.Lock()
+        
+        # Uso das chamadas em andamento em cada thread (ver track_usage)
+        self._usage = threading.local()
+        
+        # Orçamentos e concorrência dos provedores remotos, compartilhados entre processos
+        rate_limits = self.config.get('rate_limits') or {}
+        rate_limits_enabled = get_env_var(env['rate_limits_enabled'], str(rate_limits.get('enabled', True))).lower() == 'true'
+        self.rate_limiter = get_rate_limiter(rate_limits) if rate_limits_enabled else None
+        
+        # Banco de dados do cache de respostas (seguro entre threads)
+        self.db = DatabaseManager(write_behind=False)
         
         # Tenta inicializar clientes com o modelo solicitado
         try:
             # Inicializa clientes
             self._setup_clients()
             
-            # Configurações padrão
-            self.temperature = defaults['temperature']
-            self.max_tokens = defaults['max_tokens']
-            
             logger.info(f"ModelManager inicializado com modelo {self.model_name}")
         except Exception as e:
             # Se fallback estiver habilitado e ocorrer erro ao inicializar, tenta com modelo de fallback
             if self.fallback_enabled and self.model_name != self.fallback_model:
                 logger.warning(f"Erro ao inicializar modelo {self.model_name}: {str(e)}. Tentando com modelo de fallback {self.fallback_model}")
-                self.model_name = self.fallback_model
+                self._context = replace(self._context, model=self.fallback_model)
                 
                 # Tenta novamente com o modelo de fallback
                 self._setup_clients()
-                self.temperature = defaults['temperature']
-                self.max_tokens = defaults['max_tokens']
                 logger.info(f"ModelManager inicializado com modelo de fallback {self.model_name}")
             else:
                 # Se fallback estiver desabilitado ou também falhar, propaga a exceção
                 logger.error(f"Erro ao inicializar modelo {self.model_name} e fallback está desabilitado ou falhou")
                 raise
 
+    @property
+    def model_name(self) -> str:
+        """Modelo padrão das chamadas sem contexto explícito."""
+        return self._context.model
+
+    @property
+    def temperature(self) -> float:
+        """Temperatura padrão das chamadas sem contexto explícito."""
+        return self._context.temperature
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        """Tokens máximos padrão das chamadas sem contexto explícito."""
+        return self._context.max_tokens
+
     def configure(self, model: Optional[str] = None, temperature: float = None, max_tokens: Optional[int] = None) -> None:
         """
-        Configura parâmetros do modelo.
+        Configura os parâmetros padrão do modelo.
+        
+        Chamadas já em andamento mantêm o contexto com que começaram.
         
         Args:
             model: Nome do modelo a ser usado
             temperature: Temperatura para geração (0.0 a 1.0)
             max_tokens: Número máximo de tokens na resposta
         """
-        if model:
-            self.model_name = model
-        if temperature is not None:
-            self.temperature = temperature
-        if max_tokens is not None:
-            self.max_tokens = max_tokens
+        with self._config_lock:
+            self._context = self.request_context(model, temperature, max_tokens)
+            context = self._context
         
-        logger.info(f"ModelManager configurado: model={self.model_name}, temperature={self.temperature}, max_tokens={self.max_tokens}")
+        logger.info(f"ModelManager configurado: model={context.model}, temperature={context.temperature}, max_tokens={context.max_tokens}")
+
+    def request_context(self, model: Optional[str] = None, temperature: Optional[float] = None,
+                        max_tokens: Optional[int] = None) -> RequestContext:
+        """
+        Cria o contexto de uma chamada a partir dos parâmetros padrão.
+        
+        Args:
+            model: Nome do modelo (padrão: modelo configurado)
+            temperature: Temperatura (padrão: temperatura configurada)
+            max_tokens: Tokens máximos (padrão: valor configurado)
+            
+        Returns:
+            RequestContext imutável
+        """
+        context = self._context
+        overrides = {
+            name: value for name, value in (("model", model), ("temperature", temperature), ("max_tokens", max_tokens))
+            if value is not None and value != ""
+        }
+        return replace(context, **overrides) if overrides else context
+
+    def _resolve_context(self, context: Optional[RequestContext], kwargs: Dict[str, Any]) -> RequestContext:
+        """
+        Obtém o contexto de uma chamada; temperature e max_tokens em kwargs têm precedência.
+        
+        Args:
+            context: Contexto recebido (padrão: contexto configurado)
+            kwargs: Argumentos da chamada (temperature e max_tokens são removidos)
+            
+        Returns:
+            RequestContext da chamada
+        """
+        context = context or self._context
+        overrides = {name: kwargs.pop(name) for name in ("temperature", "max_tokens") if name in kwargs}
+        overrides = {name: value for name, value in overrides.items() if value is not None}
+        return replace(context, **overrides) if overrides else context
 
     def _setup_cache(self) -> None:
         """Configura diretório de cache"""
@@ -148,6 +441,9 @@ class ModelManager:
         self.openrouter_client = None
         self.gemini_model = None
         self.anthropic_client = None
+        # Pools de chaves por provedor (várias chaves com balanceamento)
+        self.key_pools: Dict[str, KeyPool] = {}
+        rate_limits = self.config.get('rate_limits') or {}
 
         # Obtém os provedores de modelos do arquivo de configuração
         config = load_config()
@@ -174,18 +470,21 @@ class ModelManager:
                         logger.warning(f"Provedor {provider_name} não tem key_name definido no kernel.yaml")
                         continue
                     
-                    # Obtém a chave de API
-                    api_key = get_env_var(env.get(key_name))
-                    if not api_key:
+                    # Obtém as chaves de API (lista separada por vírgula e variáveis <VAR>_1, <VAR>_2, ...)
+                    api_keys = get_api_keys(env.get(key_name))
+                    if not api_keys:
                         logger.warning(f"Chave de API não encontrada para o provedor {provider_name} (variável: {key_name})")
                         continue
+                    api_key = api_keys[0]
                     
                     # Configura cliente com base no tipo de provedor
                     if 'openai' in provider_name.lower():
-                        self.openai_client = OpenAI(
-                            api_key=api_key,
+                        pool = get_key_pool('openai', api_keys, lambda key: OpenAI(
+                            api_key=key,
                             timeout=self.timeout
-                        )
+                        ), rate_limits)
+                        self.key_pools['openai'] = pool
+                        self.openai_client = pool.keys[0].client
                         logger.info(f"Cliente OpenAI configurado com sucesso")
                         
                     elif 'openrouter' in provider_name.lower():
@@ -194,11 +493,13 @@ class ModelManager:
                             logger.warning(f"Provedor {provider_name} não tem api_url definido no kernel.yaml")
                             continue
                             
-                        self.openrouter_client = OpenAI(
+                        pool = get_key_pool('openrouter', api_keys, lambda key: OpenAI(
                             base_url=base_url,
-                            api_key=api_key,
+                            api_key=key,
                             timeout=self.timeout
-                        )
+                        ), rate_limits)
+                        self.key_pools['openrouter'] = pool
+                        self.openrouter_client = pool.keys[0].client
                         logger.info(f"Cliente OpenRouter configurado com sucesso")
                         
                     elif 'gemini' in provider_name.lower():
@@ -207,12 +508,18 @@ class ModelManager:
                             logger.warning(f"Provedor {provider_name} não tem default_model definido no kernel.yaml")
                             continue
                             
+                        # O SDK do Gemini usa uma chave global por processo: apenas a primeira é usada
+                        if len(api_keys) > 1:
+                            logger.warning(f"Provedor {provider_name} aceita uma única chave por processo; "
+                                           f"{len(api_keys) - 1} chave(s) adicional(is) ignorada(s)")
                         genai.configure(api_key=api_key)
                         self.gemini_model = genai.GenerativeModel(default_model)
                         logger.info(f"Modelo Gemini configurado com sucesso: {default_model}")
                         
                     elif 'anthropic' in provider_name.lower():
-                        self.anthropic_client = Anthropic(api_key=api_key)
+                        pool = get_key_pool('anthropic', api_keys, lambda key: Anthropic(api_key=key), rate_limits)
+                        self.key_pools['anthropic'] = pool
+                        self.anthropic_client = pool.keys[0].client
                         logger.info(f"Cliente Anthropic configurado com sucesso")
                         
                     else:
@@ -228,88 +535,302 @@ class ModelManager:
         self._setup_local_models()
 
     def _setup_local_models(self) -> None:
-        """Inicializa os modelos locais via llama.cpp"""
+        """
+        Registra os modelos locais (llama.cpp).
+        
+        Os modelos não são carregados aqui: o carregamento ocorre sob demanda no pool de
+        processo (LOCAL_MODELS) ou antecipadamente por warm_up(). Os parâmetros de CPU
+        vêm do perfil de ajuste do host (prompt_tdd tune), quando existir.
+        """
+        config = load_config()
+        profile = load_host_profile(config)
+        self.local_providers = {
+            provider['name']: apply_host_profile(provider, profile)
+            for provider in config['providers']
+            if provider.get('remote', True) == False
+        }
+        logger.info(f"Modelos locais registrados: {', '.join(self.local_providers)}")
+
+    def _load_local_model(self, provider: Dict[str, Any]) -> Tuple[Any, Any]:
+        """
+        Carrega um modelo local via llama.cpp.
+        
+        Args:
+            provider: Configuração do provedor
+            
+        Returns:
+            Tupla (instância Llama, rascunho especulativo ou None)
+            
+        Raises:
+            FileNotFoundError: Se o arquivo do modelo não existir ou estiver incompleto
+        """
+        from llama_cpp import Llama
+        from src.core.speculative import LlamaDraftModelDecoding
+        
+        provider_name = provider.get('name')
+        model_dir = provider.get('dir', './models')
+        n_ctx = provider.get('n_ctx', 2048)
+        n_threads = provider.get('n_threads', 4)
+        
+        # Escolhe a maior variante baixada que cabe na memória livre e no orçamento
+        variant = ModelDownloader.resolve_variant(provider, available_only=True)
+        model_file = ModelDownloader.get_model_path(variant['file'], model_dir)
+        if not ModelDownloader.is_model_available(variant['file'], model_dir):
+            raise FileNotFoundError(f"Arquivo de modelo {provider_name} não encontrado ou muito pequeno: {model_file}")
+        ModelDownloader.touch_model(model_file)
+        
+        entry = LOCAL_MODELS.get_entry(provider_name)
+        entry.model_file = model_file
+        entry.variant = variant['quant']
+        entry.memory_mb = variant['memory_mb']
+        
+        # Valida o contexto pelo cabeçalho GGUF (sem carregar os pesos)
+        info = ModelDownloader.get_gguf_index().get(model_file)
+        if info is None:
+            raise FileNotFoundError(f"Arquivo de modelo {provider_name} não é um GGUF válido: {model_file}")
+        if info.get('context_length') and n_ctx > info['context_length']:
+            logger.warning(f"n_ctx={n_ctx} excede o contexto de treino de {provider_name} ({info['context_length']}); usando {info['context_length']}")
+            n_ctx = info['context_length']
+            
+        # Decodificação especulativa (opt-in por provedor)
+        draft = self._setup_speculative(provider)
+        load_params = {"draft_model": draft} if draft else {}
+        if provider.get('n_threads_batch'):
+            load_params['n_threads_batch'] = provider['n_threads_batch']
+        if provider.get('n_batch'):
+            load_params['n_batch'] = provider['n_batch']
+            load_params['n_ubatch'] = provider['n_batch']
+        
         try:
-            from llama_cpp import Llama
+            # Primeira tentativa - API mais recente
+            model = Llama(
+                model_path=model_file,
+                n_ctx=n_ctx,
+                n_threads=n_threads,
+                **load_params
+            )
+            logger.info(f"Modelo {provider_name} carregado com sucesso: {model_file} [variante={variant['quant'] or 'única'}]")
+        except TypeError as e:
+            if "positional arguments but 3 were given" not in str(e):
+                raise
+            # Segunda tentativa - API mais antiga
+            model = Llama(model_file)
+            draft = None
+            logger.info(f"Modelo {provider_name} carregado com API legada: {model_file}")
+            
+        if draft and isinstance(draft.proposer, LlamaDraftModelDecoding):
+            draft.proposer.bind_target(model)
+        return model, draft
+
+    def _get_local_model(self, provider_name: str) -> Optional[LocalModelEntry]:
+        """
+        Obtém um modelo local do pool, carregando-o se necessário.
+        
+        Se o modelo estiver sendo carregado pelo aquecimento, aguarda apenas por ele.
+        
+        Args:
+            provider_name: Nome do provedor local
             
-            # Obtém os provedores de modelos do arquivo de configuração
-            config = load_config()
+        Returns:
+            Entrada do pool pronta ou None se o modelo não estiver disponível
+        """
+        provider = self.local_providers.get(provider_name)
+        if provider is None:
+            return None
             
-            # Itera sobre todos os provedores definidos na configuração
-            for provider in config['providers']:
-                try:
-                    provider_name = provider.get('name')
-                    # Verifica se o modelo é local (não remoto)
-                    if provider.get('remote', True) == False:
-                        model_name = provider.get('model')
-                        model_dir = provider.get('dir', './models')
-                        n_ctx = provider.get('n_ctx', 2048)
-                        n_threads = provider.get('n_threads', 4)
-                        
-                        # Verifica se o modelo existe
-                        full_model_dir = os.path.join(ModelDownloader.BASE_DIR, os.path.normpath(model_dir.lstrip('./')))
-                        model_file = os.path.join(full_model_dir, f"{model_name}.gguf")
-                        
-                        if os.path.exists(model_file) and os.path.getsize(model_file) > 1000000:  # Tamanho mínimo de 1MB
-                            try:
-                                # Primeira tentativa - API mais recente
-                                model = Llama(
-                                    model_path=model_file,
-                                    n_ctx=n_ctx,
-                                    n_threads=n_threads
-                                )
-                                logger.info(f"Modelo {provider_name} carregado com sucesso: {model_file}")
-                                
-                                # Armazena o modelo carregado
-                                attr_name = f"{provider_name.replace('-', '_')}_model".replace('tinyllama_1.1b', 'tinyllama')
-                                setattr(self, attr_name, model)
-                                
-                            except TypeError as e:
-                                if "positional arguments but 3 were given" in str(e):
-                                    # Segunda tentativa - API mais antiga
-                                    model = Llama(model_file)
-                                    logger.info(f"Modelo {provider_name} carregado com API legada: {model_file}")
-                                    
-                                    # Armazena o modelo carregado
-                                    attr_name = f"{provider_name.replace('-', '_')}_model".replace('tinyllama_1.1b', 'tinyllama')
-                                    setattr(self, attr_name, model)
-                                else:
-                                    logger.warning(f"Erro ao carregar modelo {provider_name}: {str(e)}")
-                                    raise
-                        else:
-                            logger.warning(f"Arquivo de modelo {provider_name} não encontrado ou muito pequeno: {model_file}")
-                            attr_name = f"{provider_name.replace('-', '_')}_model".replace('tinyllama_1.1b', 'tinyllama')
-                            setattr(self, attr_name, None)
-                except Exception as e:
-                    logger.warning(f"Erro ao configurar modelo {provider_name}: {str(e)}")
-        except ImportError as e:
-            logger.warning(f"llama_cpp não disponível: {str(e)}")
-            # Define atributos de modelo como None para todos os modelos locais
-            config = load_config()
-            for provider in config['providers']:
-                if provider.get('remote', True) == False:
-                    provider_name = provider.get('name')
-                    attr_name = f"{provider_name.replace('-', '_')}_model".replace('tinyllama_1.1b', 'tinyllama')
-                    setattr(self, attr_name, None)
-
-    def _get_cache_key(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        entry = LOCAL_MODELS.acquire(provider_name, lambda: self._load_local_model(provider))
+        return entry if entry.state == "ready" else None
+
+    def warm_up(self, models: Optional[List[str]] = None, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Aquece os modelos configurados: carrega clientes/modelos e executa uma geração mínima.
+        
+        Por padrão aquece os modelos principal, de fallback e de elevação. Requisições que
+        chegam antes do fim do aquecimento aguardam apenas pelo modelo que utilizam.
+        
+        Args:
+            models: Lista de modelos a aquecer (opcional)
+            background: Se deve executar em uma thread de segundo plano
+            
+        Returns:
+            Thread de aquecimento (modo background) ou None
+        """
+        env = self.registry.get_env_vars()
+        warmup_config = self.config.get('warmup', {})
+        enabled = get_env_var(env.get('warmup_enabled', ''), str(warmup_config.get('enabled', True))).lower() == 'true'
+        if not enabled:
+            logger.info("Aquecimento de modelos desativado")
+            return None
+            
+        targets = [m for m in dict.fromkeys(models or [self.model_name, self.fallback_model, self.elevation_model]) if m]
+        for model_name in targets:
+            WARMUP.set_state(model_name, self._get_provider(model_name), "pending")
+            
+        logger.info(f"Aquecimento de modelos iniciado: {', '.join(targets)}")
+        if not background:
+            self._run_warm_up(targets, warmup_config)
+            return None
+            
+        thread = threading.Thread(
+            target=self._run_warm_up,
+            args=(targets, warmup_config),
+            name="model-warmup",
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _run_warm_up(self, targets: List[str], warmup_config: Dict[str, Any]) -> None:
+        """
+        Executa o aquecimento sequencial dos modelos.
+        
+        Args:
+            targets: Modelos a aquecer
+            warmup_config: Configuração de aquecimento do kernel.yaml
+        """
+        prime_prompt = warmup_config.get('prime_prompt', 'Olá')
+        prime_tokens = warmup_config.get('prime_tokens', 1)
+        
+        for model_name in targets:
+            provider = self._get_provider(model_name)
+            start = time.perf_counter()
+            WARMUP.set_state(model_name, provider, "loading")
+            try:
+                if provider in self.local_providers:
+                    entry = self._get_local_model(provider)
+                    if entry is None:
+                        raise ValueError(LOCAL_MODELS.get_entry(provider).error or f"Modelo {provider} indisponível")
+                    # Geração mínima: aloca buffers de computação e traz os pesos para a memória
+                    with entry.lock:
+                        entry.model(prime_prompt, max_tokens=prime_tokens, temperature=0.0)
+                elif not self._is_remote_client_ready(provider):
+                    raise ValueError(f"Cliente não configurado para provedor {provider}")
+                    
+                elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+                WARMUP.set_state(model_name, provider, "ready", elapsed_ms=elapsed_ms)
+                logger.info(f"Modelo {model_name} aquecido [{elapsed_ms:.0f}ms]")
+            except Exception as e:
+                WARMUP.set_state(model_name, provider, "error", error=str(e))
+                logger.warning(f"Falha no aquecimento do modelo {model_name}: {str(e)}")
+
+    def _is_remote_client_ready(self, provider: str) -> bool:
+        """
+        Verifica se o cliente de um provedor remoto foi configurado.
+        
+        Args:
+            provider: Nome do provedor
+            
+        Returns:
+            True se o cliente estiver configurado
+        """
+        if provider.startswith('openai'):
+            return self.openai_client is not None
+        if provider.startswith('openrouter'):
+            return self.openrouter_client is not None
+        if provider.startswith('gemini'):
+            return self.gemini_model is not None
+        if provider.startswith('anthropic'):
+            return self.anthropic_client is not None
+        return False
+
+    def get_readiness(self) -> Dict[str, Any]:
+        """
+        Obtém o estado de prontidão dos modelos aquecidos e do pool de modelos locais.
+        
+        Returns:
+            Dict com "ready", estado por modelo e estado dos modelos locais
+        """
+        readiness = WARMUP.status()
+        readiness["local_models"] = LOCAL_MODELS.status()
+        return readiness
+
+    def wait_until_ready(self, model_name: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Aguarda o aquecimento de um modelo.
+        
+        Args:
+            model_name: Nome do modelo (padrão: modelo principal)
+            timeout: Tempo máximo de espera em segundos (opcional)
+            
+        Returns:
+            True se o modelo está pronto
+        """
+        return WARMUP.wait(model_name or self.model_name, timeout)
+
+    def _setup_speculative(self, provider: Dict[str, Any]):
+        """
+        Cria o modelo de rascunho para decodificação especulativa de um provedor local.
+        
+        Args:
+            provider: Configuração do provedor
+            
+        Returns:
+            TrackingDraftModel ou None se o modo estiver desativado ou falhar
+        """
+        from src.core.speculative import build_draft_model, get_speculative_config
+        
+        env = self.registry.get_env_vars()
+        spec_config = get_speculative_config(provider, env.get('speculative_mode'))
+        if not spec_config:
+            return None
+            
+        try:
+            return build_draft_model(spec_config, self._load_draft_llama)
+        except Exception as e:
+            logger.warning(f"Decodificação especulativa indisponível para {provider.get('name')}: {str(e)}")
+            return None
+
+    def _load_draft_llama(self, provider_name: str, n_ctx: int):
+        """
+        Carrega uma instância dedicada de um modelo local para uso como rascunho.
+        
+        Args:
+            provider_name: Nome do provedor do modelo de rascunho
+            n_ctx: Tamanho do contexto
+            
+        Returns:
+            Instância Llama do modelo de rascunho
+            
+        Raises:
+            ValueError: Se o arquivo do modelo de rascunho não estiver disponível
+        """
+        from llama_cpp import Llama
+        
+        provider = apply_host_profile(self.registry.get_provider_config(provider_name), load_host_profile(load_config()))
+        model_file = ModelDownloader.get_provider_model_path(provider)
+        if not os.path.exists(model_file):
+            raise ValueError(f"Modelo de rascunho {provider_name} não encontrado: {model_file}")
+        ModelDownloader.touch_model(model_file)
+            
+        logger.info(f"Carregando modelo de rascunho {provider_name}: {model_file}")
+        return Llama(
+            model_path=model_file,
+            n_ctx=n_ctx,
+            n_threads=provider.get('n_threads', 4),
+            verbose=False
+        )
+
+    def _get_cache_key(self, prompt: str, system: Optional[str] = None,
+                       context: Optional[RequestContext] = None, **kwargs) -> str:
         """
         Gera chave de cache para um prompt.
         
         Args:
             prompt: Prompt para o modelo
             system: Prompt de sistema (opcional)
+            context: Contexto da chamada (padrão: contexto configurado)
             **kwargs: Argumentos adicionais
             
         Returns:
             String com a chave de cache
         """
+        context = context or self._context
         cache_key = {
             "prompt": prompt,
             "system": system,
-            "model": self.model_name,
-            "temperature": self.temperature,
-            "max_tokens": self.max_tokens,
+            "model": context.model,
+            "temperature": context.temperature,
+            "max_tokens": context.max_tokens,
             **kwargs
         }
         return json.dumps(cache_key, sort_keys=True)
@@ -346,6 +867,39 @@ class ModelManager:
         except Exception as e:
             logger.error(f"Erro ao salvar cache: {str(e)}")
             
+    @contextmanager
+    def track_usage(self) -> Iterator[Dict[str, Any]]:
+        """
+        Acumula o uso das chamadas de geração feitas pela thread atual dentro do bloco.
+        
+        Usado na telemetria por etapa do orquestrador: cada guardrail mede o modelo
+        efetivamente usado (inclusive o de fallback), os tokens e o uso do cache.
+        
+        Yields:
+            Dict com model, provider, tokens (None se o provedor não informa), cached
+            (todas as chamadas atendidas pelo cache) e calls, preenchido ao fim de cada chamada
+        """
+        usage = {"model": None, "provider": None, "tokens": None, "cached": False, "calls": 0}
+        previous = getattr(self._usage, "current", None)
+        self._usage.current = usage
+        try:
+            yield usage
+        finally:
+            self._usage.current = previous
+            
+    def _record_usage(self, model: str, provider: Optional[str], tokens: Optional[int] = None,
+                      cached: bool = False) -> None:
+        """Soma uma chamada concluída ao uso acompanhado pela thread atual (se houver)."""
+        usage = getattr(self._usage, "current", None)
+        if usage is None:
+            return
+        usage["cached"] = cached if usage["calls"] == 0 else usage["cached"] and cached
+        usage["calls"] += 1
+        usage["model"] = model
+        usage["provider"] = provider
+        if tokens is not None:
+            usage["tokens"] = (usage["tokens"] or 0) + tokens
+            
     def _get_provider(self, model: str) -> str:
         """
         Identifica o provedor com base no nome do modelo.
@@ -370,11 +924,52 @@ class ModelManager:
         """
         return self.registry.get_provider_config(provider)
 
+    @contextmanager
+    def _rate_limited(self, provider: str, prompt: str, system: Optional[str] = None,
+                      max_tokens: Optional[int] = None) -> Iterator[RateLimitedCall]:
+        """
+        Envolve uma chamada remota no orçamento e no limite de concorrência do provedor.
+        
+        Com várias chaves, escolhe a chave da chamada (menor espera pelo orçamento e menos
+        chamadas em andamento) e a ejeta temporariamente em erros de cota ou autenticação.
+        
+        Args:
+            provider: Provedor em models.rate_limits.providers (ex: "openai")
+            prompt: Prompt (para a estimativa de tokens)
+            system: Prompt de sistema (opcional)
+            max_tokens: Tokens máximos da resposta (padrão: self.max_tokens)
+            
+        Yields:
+            RateLimitedCall com o cliente da chave escolhida em `client`
+        """
+        pool = self.key_pools.get(provider)
+        key = None
+        if pool:
+            key = pool.acquire(
+                (lambda bucket: self.rate_limiter.estimate_wait(provider, bucket)) if self.rate_limiter else None
+            )
+        client = key.client if key else None
+        error = None
+        try:
+            if not self.rate_limiter:
+                yield RateLimitedCall(0, client)
+                return
+            with self.rate_limiter.limit(provider, estimate_tokens(prompt, system), max_tokens or self.max_tokens or 0,
+                                         bucket=key.bucket if key else None, client=client) as call:
+                yield call
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if key:
+                pool.release(key, error)
+
     def _generate_with_provider(
         self,
         provider: str,
         prompt: str,
         system: Optional[str] = None,
+        context: Optional[RequestContext] = None,
         **kwargs
     ) -> Tuple[str, Dict[str, Any]]:
         """
@@ -384,6 +979,7 @@ class ModelManager:
             provider: Nome do provedor
             prompt: Prompt para o modelo
             system: Prompt de sistema (opcional)
+            context: Contexto da chamada (padrão: contexto configurado)
             **kwargs: Argumentos adicionais
             
         Returns:
@@ -392,6 +988,7 @@ class ModelManager:
         Raises:
             ValueError: Se o provedor não estiver disponível
         """
+        context = self._resolve_context(context, kwargs)
         logger.info(f"Gerando resposta com provedor: {provider}")
         
         # Obtém configurações do provedor, incluindo se é remoto ou local
@@ -401,119 +998,85 @@ class ModelManager:
         # Verifica se o modelo está disponível com base na flag remote
         if is_remote is False:
             # Para modelos locais, verificar se a instância do modelo está carregada
-            attr_name = f"{provider.replace('-', '_')}_model".replace('tinyllama_1.1b', 'tinyllama')
-            model_instance = getattr(self, attr_name, None)
-            
-            if not model_instance:
+            if not self._get_local_model(provider):
                 logger.error(f"Modelo {provider} não está disponível localmente.")
-                if self.fallback_enabled:
+                if context.fallback_enabled:
                     logger.warning(f"Usando fallback para modelo {provider}")
-                    return self._generate_openai(prompt, system, **kwargs)
+                    return self._generate_openai(prompt, system, context=context, **kwargs)
                 else:
                     raise ValueError(f"Modelo {provider} não está disponível localmente. Verifique se o arquivo do modelo está presente e acessível.")
         
         # Provedores remotos (API)
         if is_remote is True:
             if provider.startswith('openai'):
-                return self._generate_openai(prompt, system, **kwargs)
+                return self._generate_openai(prompt, system, context=context, **kwargs)
             elif provider.startswith('openrouter'):
                 if not self.openrouter_client:
                     if not self.fallback_enabled:
                         raise ValueError("OpenRouter não configurado")
                     else:
-                        return self._generate_openai(prompt, system, **kwargs)
+                        return self._generate_openai(prompt, system, context=context, **kwargs)
                 # Usar o cliente OpenRouter diretamente (não chamar _generate_openai)
-                messages = []
-                if system:
-                    messages.append({"role": "system", "content": system})
-                messages.append({"role": "user", "content": prompt})
-                
-                response = self.openrouter_client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    temperature=kwargs.get('temperature', self.temperature),
-                    max_tokens=kwargs.get('max_tokens', self.max_tokens)
-                )
-                
-                return response.choices[0].message.content, {
-                    "model": response.model,
-                    "usage": response.usage.model_dump(),
-                    "status": "success"
-                }
+                return self._generate_openrouter(prompt, system, context=context, **kwargs)
             elif provider.startswith('gemini'):
                 if not self.gemini_model:
                     if not self.fallback_enabled:
                         raise ValueError("Gemini não configurado")
                     else:
-                        return self._generate_openai(prompt, system, **kwargs)
-                return self._generate_gemini(prompt, system, **kwargs)
+                        return self._generate_openai(prompt, system, context=context, **kwargs)
+                return self._generate_gemini(prompt, system, context=context, **kwargs)
             elif provider.startswith('anthropic'):
                 if not self.anthropic_client:
                     if not self.fallback_enabled:
                         raise ValueError("Anthropic não configurado")
                     else:
-                        return self._generate_openai(prompt, system, **kwargs)
-                return self._generate_anthropic(prompt, system, **kwargs)
+                        return self._generate_openai(prompt, system, context=context, **kwargs)
+                return self._generate_anthropic(prompt, system, context=context, **kwargs)
         # Provedores locais (usando llama.cpp)
         elif is_remote is False:
             if provider == 'tinyllama-1.1b' or provider == 'tinyllama':
-                return self._generate_tinyllama(prompt, system, **kwargs)
+                return self._generate_tinyllama(prompt, system, context=context, **kwargs)
             elif provider == 'phi1':
-                return self._generate_phi1(prompt, system, **kwargs)
+                return self._generate_phi1(prompt, system, context=context, **kwargs)
             elif provider == 'deepseek-local-coder':
-                return self._generate_deepseek(prompt, system, **kwargs)
+                return self._generate_deepseek(prompt, system, context=context, **kwargs)
             elif provider == 'phi3-mini':
-                return self._generate_phi3(prompt, system, **kwargs)
+                return self._generate_phi3(prompt, system, context=context, **kwargs)
+            raise ValueError(f"Provedor local {provider} não suportado")
         # Fallback para comportamento anterior
         else:
             if provider == 'openai':
-                return self._generate_openai(prompt, system, **kwargs)
+                return self._generate_openai(prompt, system, context=context, **kwargs)
             elif provider == 'openrouter':
                 if not self.openrouter_client:
                     if not self.fallback_enabled:
                         raise ValueError("OpenRouter não configurado")
                     else:
-                        return self._generate_openai(prompt, system, **kwargs)
+                        return self._generate_openai(prompt, system, context=context, **kwargs)
                 # Usar o cliente OpenRouter diretamente
-                messages = []
-                if system:
-                    messages.append({"role": "system", "content": system})
-                messages.append({"role": "user", "content": prompt})
-                
-                response = self.openrouter_client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    temperature=kwargs.get('temperature', self.temperature),
-                    max_tokens=kwargs.get('max_tokens', self.max_tokens)
-                )
-                
-                return response.choices[0].message.content, {
-                    "model": response.model,
-                    "usage": response.usage.model_dump(),
-                    "status": "success"
-                }
+                return self._generate_openrouter(prompt, system, context=context, **kwargs)
             elif provider == 'gemini':
                 if not self.gemini_model:
                     if not self.fallback_enabled:
                         raise ValueError("Gemini não configurado")
                     else:
-                        return self._generate_openai(prompt, system, **kwargs)
-                return self._generate_gemini(prompt, system, **kwargs)
+                        return self._generate_openai(prompt, system, context=context, **kwargs)
+                return self._generate_gemini(prompt, system, context=context, **kwargs)
             elif provider == 'anthropic':
                 if not self.anthropic_client:
                     if not self.fallback_enabled:
                         raise ValueError("Anthropic não configurado")
                     else:
-                        return self._generate_openai(prompt, system, **kwargs)
-                return self._generate_anthropic(prompt, system, **kwargs)
+                        return self._generate_openai(prompt, system, context=context, **kwargs)
+                return self._generate_anthropic(prompt, system, context=context, **kwargs)
             elif provider == 'tinyllama':
-                return self._generate_tinyllama(prompt, system, **kwargs)
+                return self._generate_tinyllama(prompt, system, context=context, **kwargs)
             elif provider == 'phi1':
-                return self._generate_phi1(prompt, system, **kwargs)
+                return self._generate_phi1(prompt, system, context=context, **kwargs)
             elif provider == 'deepseek_local':
-                return self._generate_deepseek(prompt, system, **kwargs)
+                return self._generate_deepseek(prompt, system, context=context, **kwargs)
             elif provider == 'phi3':
-                return self._generate_phi3(prompt, system, **kwargs)
+                return self._generate_phi3(prompt, system, context=context, **kwargs)
             else:
                 raise ValueError(f"Provedor {provider} não suportado")
 
@@ -522,6 +1085,7 @@ class ModelManager:
         prompt: str,
         system: Optional[str] = None,
         use_cache: bool = True,
+        context: Optional[RequestContext] = None,
         **kwargs
     ) -> Tuple[str, Dict[str, Any]]:
         """
@@ -531,20 +1095,24 @@ class ModelManager:
             prompt: Prompt para o modelo
             system: Prompt de sistema (opcional)
             use_cache: Se deve usar cache
-            **kwargs: Argumentos adicionais
+            context: Contexto da chamada (padrão: contexto configurado)
+            **kwargs: Argumentos adicionais (temperature e max_tokens sobrepõem o contexto)
             
         Returns:
             Tupla (resposta, metadados)
         """
+        context = self._resolve_context(context, kwargs)
+        
         # Verifica cache
         if use_cache and self.cache_enabled:
-            cache_key = self._get_cache_key(prompt, system, **kwargs)
+            cache_key = self._get_cache_key(prompt, system, context, **kwargs)
             cached = self._get_cached_response(cache_key)
             if cached:
+                self._record_usage(context.model, self._get_provider(context.model), 0, cached=True)
                 return cached
 
         # Identifica provedor
-        provider = self._get_provider(self.model_name)
+        provider = self._get_provider(context.model)
         
         # Tenta gerar resposta
         for attempt in range(self.max_retries):
@@ -553,6 +1121,7 @@ class ModelManager:
                     provider,
                     prompt,
                     system,
+                    context=context,
                     **kwargs
                 )
                 
@@ -560,13 +1129,14 @@ class ModelManager:
                     # Salva no cache
                     if use_cache and self.cache_enabled:
                         self._save_to_cache(cache_key, response, metadata)
+                    self._record_usage(context.model, provider, (metadata.get('usage') or {}).get('total_tokens'))
                     return response, metadata
                     
                 # Se falhou e fallback está habilitado, tenta outro provedor
-                if self.fallback_enabled and attempt == self.max_retries - 1:
-                    logger.warning(f"Fallback para modelo {self.elevation_model}")
-                    self.model_name = self.elevation_model
-                    provider = self._get_provider(self.model_name)
+                if context.can_fallback and attempt == self.max_retries - 1:
+                    logger.warning(f"Fallback para modelo {context.elevation_model}")
+                    context = context.fallback()
+                    provider = self._get_provider(context.model)
                     continue
                     
             except Exception as e:
@@ -574,14 +1144,14 @@ class ModelManager:
                 if attempt == self.max_retries - 1:
                     return "", {
                         "error": str(e),
-                        "model": self.model_name,
+                        "model": context.model,
                         "provider": provider,
                         "status": "error"
                     }
                     
         return "", {
             "error": "Máximo de tentativas excedido",
-            "model": self.model_name,
+            "model": context.model,
             "provider": provider,
             "status": "error"
         }
@@ -589,30 +1159,32 @@ class ModelManager:
     def get_available_models(self) -> Dict[str, list]:
         return self.registry.get_available_models()
 
-    def generate_response(self, messages: list, **kwargs) -> str:
+    def generate_response(self, messages: list, context: Optional[RequestContext] = None, **kwargs) -> str:
         """
         Gera uma resposta usando o modelo para um conjunto de mensagens.
 
         Args:
             messages: Lista de mensagens no formato [{"role": "system", "content": "..."}, {"role": "user", "content": "..."}]
-            **kwargs: Argumentos adicionais para o modelo
+            context: Contexto da chamada (padrão: contexto configurado)
+            **kwargs: Argumentos adicionais para o modelo (temperature e max_tokens sobrepõem o contexto)
 
         Returns:
             Resposta gerada
         """
+        context = self._resolve_context(context, kwargs)
+        
+        # Extrair o prompt do usuário e o prompt do sistema, se fornecidos
+        system_prompt = ""
+        user_prompt = ""
+        for msg in messages:
+            if msg["role"] == "system":
+                system_prompt = msg["content"]
+            elif msg["role"] == "user":
+                user_prompt = msg["content"]
+        
         try:
-            # Extrair o prompt do usuário e o prompt do sistema, se fornecidos
-            system_prompt = ""
-            user_prompt = ""
-            
-            for msg in messages:
-                if msg["role"] == "system":
-                    system_prompt = msg["content"]
-                elif msg["role"] == "user":
-                    user_prompt = msg["content"]
-            
             # Usa o método interno que já está implementado corretamente
-            response = self._generate_with_model(system_prompt, user_prompt)
+            response = self._generate_with_model(system_prompt, user_prompt, context, **kwargs)
             
             if response is None:
                 raise ValueError("Falha ao gerar resposta com o modelo")
@@ -620,27 +1192,11 @@ class ModelManager:
             return response
             
         except Exception as e:
-            logger.error(f"Erro ao gerar com {self.model_name}: {str(e)}")
-            if self.fallback_enabled:
-                # Tenta novamente com modelo de fallback
-                original_model = self.model_name
+            logger.error(f"Erro ao gerar com {context.model}: {str(e)}")
+            if context.can_fallback:
+                # Tenta novamente com o modelo de fallback, sem alterar o estado do gerenciador
                 try:
-                    # Configura para usar o modelo de fallback
-                    self.model_name = self.elevation_model
-                    system_prompt = ""
-                    user_prompt = ""
-                    
-                    for msg in messages:
-                        if msg["role"] == "system":
-                            system_prompt = msg["content"]
-                        elif msg["role"] == "user":
-                            user_prompt = msg["content"]
-                    
-                    # Tenta com modelo de fallback
-                    response = self._generate_with_model(system_prompt, user_prompt)
-                    
-                    # Restaura o modelo original
-                    self.model_name = original_model
+                    response = self._generate_with_model(system_prompt, user_prompt, context.fallback(), **kwargs)
                     
                     if response is None:
                         raise ValueError("Falha ao gerar resposta com modelo de fallback")
@@ -648,166 +1204,152 @@ class ModelManager:
                     return response
                     
                 except Exception as e2:
-                    # Restaura o modelo original
-                    self.model_name = original_model
                     raise ValueError(f"Erro no fallback: {e2}") from e2
             else:
                 raise ValueError(f"Erro ao gerar resposta: {e}") from e
 
-    def _generate_with_model(self, system_prompt: str, user_prompt: str) -> Optional[str]:
+    def _generate_with_model(self, system_prompt: str, user_prompt: str,
+                             context: Optional[RequestContext] = None, **kwargs) -> Optional[str]:
         """
         Gera resposta com um modelo específico.
         
         Args:
             system_prompt: Prompt de sistema
             user_prompt: Prompt do usuário
+            context: Contexto da chamada (padrão: contexto configurado)
+            **kwargs: Argumentos adicionais (ex: response_schema para saída JSON restrita)
             
         Returns:
             String com resposta ou None se falhar
         """
+        context = self._resolve_context(context, kwargs)
         try:
             # Identifica o provedor baseado no nome do modelo
-            provider = self._get_provider(self.model_name)
+            provider = self._get_provider(context.model)
                     
             if not provider:
-                logger.error(f"Provedor não identificado para modelo {self.model_name}")
+                logger.error(f"Provedor não identificado para modelo {context.model}")
                 return None
+            
+            # Modelos locais usam o mesmo caminho de geração de generate(), que aplica
+            # decodificação restrita por gramática quando há um schema de saída
+            provider_config = self.registry.get_provider_config(provider)
+            if provider_config.get('remote') is False:
+                response, metadata = self._generate_with_provider(provider, user_prompt, system_prompt, context=context, **kwargs)
+                if metadata.get('status') != 'success':
+                    logger.error(f"Falha ao gerar com {context.model}: {metadata.get('error')}")
+                    return None
+                self._record_usage(context.model, provider, (metadata.get('usage') or {}).get('total_tokens'))
+                return response
                 
-            if provider == 'openai':
-                response = self.openai_client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens
-                )
+            if provider.startswith('openai'):
+                with self._rate_limited('openai', user_prompt, system_prompt, context.max_tokens) as call:
+                    response = call.client.chat.completions.create(
+                        model=context.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=context.temperature,
+                        max_tokens=context.max_tokens
+                    )
+                    call.record_usage(getattr(response.usage, "total_tokens", None))
+                self._record_usage(context.model, provider, getattr(response.usage, "total_tokens", None))
                 return response.choices[0].message.content
                 
-            elif provider == 'openrouter' and self.openrouter_client:
-                response = self.openrouter_client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens
-                )
+            elif provider.startswith('openrouter') and self.openrouter_client:
+                with self._rate_limited('openrouter', user_prompt, system_prompt, context.max_tokens) as call:
+                    response = call.client.chat.completions.create(
+                        model=context.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=context.temperature,
+                        max_tokens=context.max_tokens
+                    )
+                    call.record_usage(getattr(response.usage, "total_tokens", None))
+                self._record_usage(context.model, provider, getattr(response.usage, "total_tokens", None))
                 return response.choices[0].message.content
                 
-            elif provider == 'gemini' and self.gemini_model:
-                response = self.gemini_model.generate_content(
-                    f"{system_prompt}\n\n{user_prompt}",
-                    generation_config={
-                        "temperature": self.temperature,
-                        "max_output_tokens": self.max_tokens
-                    }
-                )
+            elif provider.startswith('gemini') and self.gemini_model:
+                with self._rate_limited('gemini', user_prompt, system_prompt, context.max_tokens):
+                    response = self.gemini_model.generate_content(
+                        f"{system_prompt}\n\n{user_prompt}",
+                        generation_config={
+                            "temperature": context.temperature,
+                            "max_output_tokens": context.max_tokens
+                        }
+                    )
+                self._record_usage(context.model, provider,
+                                   getattr(getattr(response, "usage_metadata", None), "total_token_count", None))
                 return response.text
                 
-            elif provider == 'tinyllama' and self.tinyllama_model:
-                response = self.tinyllama_model.create_chat_completion(
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens
-                )
-                return response['choices'][0]['message']['content']
-                
-            elif provider == 'phi1' and self.phi1_model:
-                # Formata o prompt para Phi-1
-                full_prompt = ""
-                if system_prompt:
-                    full_prompt += f"<|system|>\n{system_prompt}\n"
-                full_prompt += f"<|user|>\n{user_prompt}\n<|assistant|>\n"
-                
-                # Parâmetros para geração
-                phi1_config = self.registry.get_provider_config('phi1')
-                max_tokens = self.max_tokens or phi1_config.get('default_max_tokens', 100)
-                stop = ["</s>", "<|user|>", "<|system|>", "<|assistant|>"]
-                
-                response = self.phi1_model(
-                    full_prompt,
-                    max_tokens=max_tokens,
-                    temperature=self.temperature,
-                    stop=stop
-                )
-                return response["choices"][0]["text"].strip()
-                
-            elif provider == 'deepseek_local' and self.deepseek_model:
-                # Formata o prompt para DeepSeek Coder
-                full_prompt = ""
-                if system_prompt:
-                    full_prompt += f" \n{system}\n Arbitro \n"
-                full_prompt += f"<user>\n{user_prompt}\n</user>\n<assistant>\n"
-                
-                # Parâmetros para geração
-                deepseek_config = self.registry.get_provider_config('deepseek_local')
-                max_tokens = self.max_tokens or deepseek_config.get('default_max_tokens', 512)
-                temperature = kwargs.get('temperature', self.temperature)
-                stop = ["</assistant>", "<user>", " ", "</user>", " Arbitro "]
-                
-                response = self.deepseek_model(
-                    full_prompt,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    stop=stop
-                )
-                return response["choices"][0]["text"].strip()
-                
-            elif provider == 'phi3' and self.phi3_model:
-                # Formata o prompt para Phi-3 Mini
-                full_prompt = ""
-                if system_prompt:
-                    full_prompt += f"<|system|>\n{system}\n"
-                full_prompt += f"<|user|>\n{user_prompt}\n<|assistant|>\n"
-                
-                # Parâmetros para geração
-                phi3_config = self.registry.get_provider_config('phi3')
-                max_tokens = self.max_tokens or phi3_config.get('default_max_tokens', 512)
-                temperature = kwargs.get('temperature', self.temperature)
-                stop = ["<|user|>", "<|system|>", "<|assistant|>"]
-                
-                response = self.phi3_model(
-                    full_prompt,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    stop=stop
-                )
-                return response["choices"][0]["text"].strip()
+            elif provider.startswith('anthropic') and self.anthropic_client:
+                response, metadata = self._generate_anthropic(user_prompt, system_prompt, context=context)
+                self._record_usage(context.model, provider, (metadata.get('usage') or {}).get('total_tokens'))
+                return response
                 
             # Se chegou aqui, o provedor não está configurado
             logger.error(f"Cliente não configurado para provedor {provider}")
             return None
             
         except Exception as e:
-            logger.error(f"Erro ao gerar com {self.model_name}: {str(e)}")
+            logger.error(f"Erro ao gerar com {context.model}: {str(e)}")
             return None
 
-    def _generate_openai(self, prompt: str, system: Optional[str] = None, **kwargs) -> Tuple[str, Dict[str, Any]]:
+    def _generate_openai(self, prompt: str, system: Optional[str] = None,
+                        context: Optional[RequestContext] = None, **kwargs) -> Tuple[str, Dict[str, Any]]:
         """Gera resposta usando OpenAI."""
         messages = []
         if system:
             messages.append({"role": "system", "content": system})
         messages.append({"role": "user", "content": prompt})
         
-        response = self.openai_client.chat.completions.create(
-            model=self.model_name,
-            messages=messages,
-            temperature=kwargs.get('temperature', self.temperature),
-            max_tokens=kwargs.get('max_tokens', self.max_tokens)
-        )
+        context = self._resolve_context(context, kwargs)
+        max_tokens = context.max_tokens
+        with self._rate_limited('openai', prompt, system, max_tokens) as call:
+            response = call.client.chat.completions.create(
+                model=context.model,
+                messages=messages,
+                temperature=context.temperature,
+                max_tokens=max_tokens
+            )
+            call.record_usage(getattr(response.usage, "total_tokens", None))
+        
+        return response.choices[0].message.content, {
+            "model": response.model,
+            "usage": response.usage.model_dump(),
+            "status": "success"
+        }
+
+    def _generate_openrouter(self, prompt: str, system: Optional[str] = None,
+                            context: Optional[RequestContext] = None, **kwargs) -> Tuple[str, Dict[str, Any]]:
+        """Gera resposta usando OpenRouter."""
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+        
+        context = self._resolve_context(context, kwargs)
+        max_tokens = context.max_tokens
+        with self._rate_limited('openrouter', prompt, system, max_tokens) as call:
+            response = call.client.chat.completions.create(
+                model=context.model,
+                messages=messages,
+                temperature=context.temperature,
+                max_tokens=max_tokens
+            )
+            call.record_usage(getattr(response.usage, "total_tokens", None))
         
         return response.choices[0].message.content, {
             "model": response.model,
-            "usage": response.usage.model_dump()
+            "usage": response.usage.model_dump(),
+            "status": "success"
         }
 
-    def _generate_gemini(self, prompt: str, system: Optional[str] = None, **kwargs) -> Tuple[str, Dict[str, Any]]:
+    def _generate_gemini(self, prompt: str, system: Optional[str] = None,
+                        context: Optional[RequestContext] = None, **kwargs) -> Tuple[str, Dict[str, Any]]:
         """Gera resposta usando Gemini."""
         if not self.gemini_model:
             raise ValueError("Gemini não configurado")
@@ -817,20 +1359,25 @@ class ModelManager:
             messages.append({"role": "system", "content": system})
         messages.append({"role": "user", "content": prompt})
         
-        response = self.gemini_model.generate_content(
-            messages,
-            generation_config={
-                "temperature": kwargs.get('temperature', self.temperature),
-                "max_output_tokens": kwargs.get('max_tokens', self.max_tokens)
-            }
-        )
+        context = self._resolve_context(context, kwargs)
+        max_tokens = context.max_tokens
+        with self._rate_limited('gemini', prompt, system, max_tokens):
+            response = self.gemini_model.generate_content(
+                messages,
+                generation_config={
+                    "temperature": context.temperature,
+                    "max_output_tokens": max_tokens
+                }
+            )
         
         return response.text, {
-            "model": self.model_name,
-            "usage": {}
+            "model": context.model,
+            "usage": {},
+            "status": "success"
         }
 
-    def _generate_anthropic(self, prompt: str, system: Optional[str] = None, **kwargs) -> Tuple[str, Dict[str, Any]]:
+    def _generate_anthropic(self, prompt: str, system: Optional[str] = None,
+                           context: Optional[RequestContext] = None, **kwargs) -> Tuple[str, Dict[str, Any]]:
         """Gera resposta usando Anthropic."""
         if not self.anthropic_client:
             raise ValueError("Anthropic não configurado")
@@ -840,18 +1387,50 @@ class ModelManager:
             messages.append({"role": "system", "content": system})
         messages.append({"role": "user", "content": prompt})
         
-        response = self.anthropic_client.messages.create(
-            model=self.model_name,
-            messages=messages,
-            temperature=kwargs.get('temperature', self.temperature),
-            max_tokens=kwargs.get('max_tokens', self.max_tokens)
-        )
+        context = self._resolve_context(context, kwargs)
+        max_tokens = context.max_tokens
+        with self._rate_limited('anthropic', prompt, system, max_tokens) as call:
+            response = call.client.messages.create(
+                model=context.model,
+                messages=messages,
+                temperature=context.temperature,
+                max_tokens=max_tokens
+            )
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                call.record_usage((usage.input_tokens or 0) + (usage.output_tokens or 0))
         
         return response.content[0].text, {
             "model": response.model,
-            "usage": {}
+            "usage": {"total_tokens": (usage.input_tokens or 0) + (usage.output_tokens or 0)} if usage is not None else {},
+            "status": "success"
         }
 
+    def _get_json_grammar(self, schema: Dict[str, Any]):
+        """
+        Obtém a gramática llama.cpp (GBNF) gerada a partir de um JSON schema.
+        
+        As gramáticas são cacheadas por schema, pois a conversão é feita uma única
+        vez por guardrail e reutilizada em todas as gerações.
+        
+        Args:
+            schema: JSON schema da saída esperada
+            
+        Returns:
+            LlamaGrammar correspondente ao schema
+        """
+        from llama_cpp import LlamaGrammar
+        
+        schema_key = json.dumps(schema, sort_keys=True)
+        with self._grammar_lock:
+            grammar = self._grammar_cache.get(schema_key)
+        if grammar is None:
+            grammar = LlamaGrammar.from_json_schema(schema_key, verbose=False)
+            with self._grammar_lock:
+                grammar = self._grammar_cache.setdefault(schema_key, grammar)
+            logger.debug(f"Gramática JSON gerada para schema: {schema_key[:100]}...")
+        return grammar
+
     def _generate_local_model(
         self,
         provider_name: str,
@@ -860,11 +1439,18 @@ class ModelManager:
         formatter: Callable[[str, str], str],
         stop: List[str],
         model_id: str,
+        context: Optional[RequestContext] = None,
         **kwargs
     ) -> Tuple[str, Dict[str, Any]]:
         """
         Método genérico para gerar respostas usando modelos locais.
         
+        Quando `response_schema` é informado, a decodificação é restrita por uma
+        gramática derivada do schema: a saída é JSON válido por construção e a
+        geração termina assim que o objeto raiz é fechado. Nesse modo as strings
+        de parada não são usadas, e uma saída cortada por `max_tokens` é
+        reportada como truncamento em vez de erro de parse.
+        
         Args:
             provider_name: Nome do provedor
             prompt: Prompt para o modelo
@@ -872,86 +1458,86 @@ class ModelManager:
             formatter: Função que formata o prompt completo
             stop: Lista de strings de parada
             model_id: Identificador do modelo para metadados
-            **kwargs: Argumentos adicionais
+            context: Contexto da chamada (padrão: contexto configurado)
+            **kwargs: Argumentos adicionais (temperature, max_tokens, response_schema)
             
         Returns:
             Tupla (resposta, metadados)
         """
-        # Obtém o atributo com o modelo
-        attr_name = f"{provider_name.replace('-', '_')}_model".replace('tinyllama_1.1b', 'tinyllama')
-        model_instance = getattr(self, attr_name, None)
+        context = self._resolve_context(context, kwargs)
         
-        if not model_instance:
+        # Obtém o modelo do pool (aguarda o aquecimento se estiver em andamento)
+        entry = self._get_local_model(provider_name)
+        
+        if not entry:
             raise ValueError(f"Modelo {provider_name} não está disponível.")
             
-        try:
-            # Formata o prompt usando a função específica
-            full_prompt = formatter(system, prompt)
+        response_schema = kwargs.get('response_schema')
+        full_prompt = formatter(system, prompt)
             
+        try:
             # Parâmetros para geração
             provider_config = self.registry.get_provider_config(provider_name)
-            max_tokens = kwargs.get('max_tokens', self.max_tokens) or provider_config.get('default_max_tokens', 512)
-            temperature = kwargs.get('temperature', self.temperature)
+            max_tokens = context.max_tokens or provider_config.get('default_max_tokens', 512)
+            temperature = context.temperature
+            
+            generation_params = {
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+            }
+            if response_schema:
+                # A gramática já encerra a geração ao fechar o objeto raiz; as
+                # strings de parada do formato de chat cortariam o JSON no meio
+                generation_params["grammar"] = self._get_json_grammar(response_schema)
+            else:
+                generation_params["stop"] = stop
             
             # Usa a API do modelo
-            response = model_instance(
-                full_prompt,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                stop=stop
-            )
-            text = response["choices"][0]["text"].strip()
+            draft = entry.draft
+            with entry.lock:
+                draft_before = draft.snapshot() if draft else None
+                response = entry.model(full_prompt, **generation_params)
+                speculative_stats = draft.stats_since(draft_before) if draft else None
+            choice = response["choices"][0]
+            text = choice["text"].strip()
             
-            # Tenta extrair JSON se presente
-            try:
-                if '{' in text and '}' in text:
-                    start = text.find('{')
-                    end = text.rfind('}') + 1
-                    json_str = text[start:end]
-                    
-                    # Limpa o JSON
-                    json_str = json_str.replace('\n', ' ').replace('\r', '')
-                    while '  ' in json_str:
-                        json_str = json_str.replace('  ', ' ')
-                    
-                    # Valida se é um JSON válido
-                    json_data = json.loads(json_str)
+            if response_schema and choice.get("finish_reason") == "length":
+                raise ValueError(
+                    f"Saída estruturada truncada em {max_tokens} tokens antes de fechar o JSON; "
+                    f"aumente max_tokens"
+                )
+            if response_schema:
+                # Saída restrita pela gramática: apenas normaliza a serialização
+                text = json.dumps(json.loads(text), ensure_ascii=False)
+            elif '{' in text and '}' in text:
+                # Sem schema, tenta extrair um objeto JSON presente no texto
+                try:
+                    json_data = json.loads(text[text.find('{'):text.rfind('}') + 1], strict=False)
                     text = json.dumps(json_data, ensure_ascii=False)
-                else:
-                    # Se não encontrou JSON, retorna texto normal
-                    text = text
-            except Exception as e:
-                logger.error(f"Erro ao processar resposta JSON: {str(e)}")
-                # Mantém o texto original em caso de erro
+                except ValueError:
+                    logger.debug(f"Resposta de {provider_name} não contém JSON válido, mantendo texto")
             
-            return text, {
+            usage = response.get("usage") or {
+                "prompt_tokens": len(full_prompt.split()),
+                "completion_tokens": len(text.split()),
+                "total_tokens": len(full_prompt.split()) + len(text.split())
+            }
+            metadata = {
                 "model": model_id,
-                "usage": {
-                    "prompt_tokens": len(full_prompt.split()),
-                    "completion_tokens": len(text.split()),
-                    "total_tokens": len(full_prompt.split()) + len(text.split())
-                }
+                "usage": usage,
+                "constrained": bool(response_schema),
+                "status": "success"
             }
+            if speculative_stats:
+                metadata["speculative"] = speculative_stats
+            return text, metadata
             
         except Exception as e:
             logger.error(f"Erro ao gerar resposta com {provider_name}: {str(e)}")
-            # Retorna estrutura padrão em caso de erro
-            text = json.dumps({
-                "name": "Sistema Genérico",
-                "description": "Sistema a ser especificado",
-                "objectives": ["Definir objetivos específicos"],
-                "requirements": ["Definir requisitos específicos"],
-                "constraints": ["Definir restrições do sistema"]
-            }, ensure_ascii=False)
-            
-            return text, {
+            return "", {
                 "model": model_id,
                 "error": str(e),
-                "usage": {
-                    "prompt_tokens": len(prompt.split()),
-                    "completion_tokens": len(text.split()),
-                    "total_tokens": len(prompt.split()) + len(text.split())
-                }
+                "status": "error"
             }
 
     def _generate_tinyllama(self, prompt: str, system: Optional[str] = None, **kwargs) -> Tuple[str, Dict[str, Any]]:
@@ -965,7 +1551,7 @@ class ModelManager:
             
         stop = [" Arbitro ", "<|user|>", "<|system|>", "<|assistant|>"]
         return self._generate_local_model(
-            provider_name='tinyllama',
+            provider_name='tinyllama-1.1b',
             prompt=prompt,
             system=system,
             formatter=formatter,
@@ -1005,7 +1591,7 @@ class ModelManager:
             
         stop = ["</assistant>", "<user>", " ", "</user>", " Arbitro "]
         return self._generate_local_model(
-            provider_name='deepseek',
+            provider_name='deepseek-local-coder',
             prompt=prompt,
             system=system,
             formatter=formatter,
@@ -1025,7 +1611,7 @@ class ModelManager:
             
         stop = ["<|user|>", "<|system|>", "<|assistant|>"]
         return self._generate_local_model(
-            provider_name='phi3',
+            provider_name='phi3-mini',
             prompt=prompt,
             system=system,
             formatter=formatter,
@@ -1065,12 +1651,43 @@ class ModelRegistry:
         """
         return self.config['defaults']['elevation_model']
 
+    @staticmethod
+    def _get_prefix_patterns(provider: Dict[str, Any]) -> List[str]:
+        """
+        Obtém os padrões de prefixo de um provedor.
+        
+        Aceita tanto `prefix_pattern` (valor único, usado no kernel.yaml) quanto
+        `prefix_patterns` (lista).
+        
+        Args:
+            provider: Configuração do provedor
+            
+        Returns:
+            Lista de padrões de prefixo
+        """
+        patterns = list(provider.get('prefix_patterns', []))
+        if provider.get('prefix_pattern'):
+            patterns.append(provider['prefix_pattern'])
+        return patterns
+
     def get_provider_by_model_id(self, model_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtém a configuração do provedor cujo prefixo mais longo casa com o modelo.
+        
+        Args:
+            model_id: ID do modelo
+            
+        Returns:
+            Configuração do provedor ou None
+        """
+        best_match = None
+        best_length = -1
         for provider in self.providers:
-            for pattern in provider.get('prefix_patterns', []):
-                if model_id.startswith(pattern):
-                    return provider
-        return None
+            for pattern in self._get_prefix_patterns(provider):
+                if model_id.startswith(pattern) and len(pattern) > best_length:
+                    best_match = provider
+                    best_length = len(pattern)
+        return best_match
 
     def get_model_config(self, model_id: str) -> Optional[Dict[str, Any]]:
         provider = self.get_provider_by_model_id(model_id)
@@ -1108,11 +1725,9 @@ class ModelRegistry:
         Returns:
             Nome do provedor ou 'openai' como fallback
         """
-        for provider in self.providers:
-            name = provider.get('name')
-            for pattern in provider.get('prefix_patterns', []):
-                if model_id.startswith(pattern):
-                    return name
+        provider = self.get_provider_by_model_id(model_id)
+        if provider:
+            return provider.get('name')
         
         # Se não encontrou correspondência, retorna openai como fallback
         return 'openai'
@@ -1145,7 +1760,41 @@ class ModelRegistry:
         return {}
 
     def get_available_models(self) -> Dict[str, List[str]]:
-        return {p['name']: p.get('models', []) for p in self.providers}
+        """
+        Obtém os modelos disponíveis por provedor.
+        
+        Modelos locais só são listados se o arquivo GGUF existir e tiver cabeçalho
+        válido, consultado no índice GGUF (sem carregar o modelo).
+        
+        Returns:
+            Dict provedor -> lista de modelos
+        """
+        available = {}
+        for p in self.providers:
+            models = list(p.get('models', [])) or ([p['model']] if p.get('model') else [])
+            if p.get('remote') is False:
+                models = models if self.get_local_model_info(p['name']).get('info') else []
+            available[p['name']] = models
+        return available
+
+    def get_local_model_info(self, provider_name: str) -> Dict[str, Any]:
+        """
+        Obtém os metadados GGUF do arquivo de um provedor local.
+        
+        Args:
+            provider_name: Nome do provedor local
+            
+        Returns:
+            Dict com provider, model, path e info (resumo do cabeçalho ou None)
+        """
+        provider = self.get_provider_config(provider_name)
+        model_file = ModelDownloader.get_provider_model_path(provider)
+        return {
+            "provider": provider_name,
+            "model": provider.get('model'),
+            "path": model_file,
+            "info": ModelDownloader.get_gguf_index().get(model_file)
+        }
 
     def resolve_model_config(self, model_id: Optional[str] = None) -> Dict[str, Any]:
         model_name = model_id or self.get_default_model()
@@ -1172,11 +1821,15 @@ class ModelRegistry:
 # Função para verificar e baixar modelos
 class ModelDownloader:
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    _store: Optional[ModelStore] = None
+    _store_lock = threading.Lock()
     
     @staticmethod
     def verify_and_download_models():
         logger.info("Iniciando verificação de modelos...")
         config = load_config()
+        downloads_config = config.get('downloads', {})
+        pending = []
         for provider in config['providers']:
             model_name = provider.get('model')
             download_url = provider.get('download_url')
@@ -1194,8 +1847,22 @@ class ModelDownloader:
                 if remote is None:
                     logger.warning(f"Flag 'remote' não definida para o modelo {model_name}. Assumindo comportamento padrão.")
                 
+                # Provedores com variantes baixam apenas a maior que cabe neste host
+                variant = ModelDownloader.resolve_variant(provider, config=config)
+                download_url = variant['download_url']
                 if model_name and download_url and ModelDownloader.is_valid_url(download_url):
-                    ModelDownloader.download_model(model_name, download_url, model_dir)
+                    pending.append((variant['file'], download_url, model_dir, variant['sha256']))
+        
+        # Modelos diferentes são baixados em paralelo (cada um já usa múltiplas conexões)
+        max_parallel = max(1, downloads_config.get('max_parallel_models', 2))
+        with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="model-download") as executor:
+            futures = [
+                executor.submit(ModelDownloader.download_model, model_name, download_url, model_dir,
+                                sha256=sha256, downloads_config=downloads_config)
+                for model_name, download_url, model_dir, sha256 in pending
+            ]
+            for future in futures:
+                future.result()
         
         logger.info("Verificação de modelos concluída.")
 
@@ -1209,45 +1876,268 @@ class ModelDownloader:
             return False
 
     @staticmethod
-    def download_model(model_name, download_url, model_dir='./models'):
-        # Normaliza o caminho do diretório do modelo
+    def download_model(model_name, download_url, model_dir='./models', sha256: Optional[str] = None,
+                       downloads_config: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Baixa o arquivo GGUF de um modelo local, se ainda não estiver disponível.
+        
+        O download usa múltiplas conexões HTTP Range, retoma a partir do arquivo .part
+        de uma execução interrompida e verifica o SHA-256 quando configurado.
+        
+        Args:
+            model_name: Nome do modelo
+            download_url: URL do arquivo GGUF
+            model_dir: Diretório do modelo relativo à raiz do projeto
+            sha256: Digest SHA-256 esperado (opcional)
+            downloads_config: Seção models.downloads do kernel.yaml (opcional)
+            
+        Returns:
+            True se o modelo está disponível ao final
+        """
+        model_path = ModelDownloader.get_model_path(model_name, model_dir)
+        
+        if ModelDownloader.is_model_available(model_name, model_dir):
+            if not ModelDownloader._verify_existing(model_path, download_url, sha256):
+                logger.warning(f"Modelo {model_name} não confere com o SHA-256 configurado; baixando novamente")
+                os.remove(model_path)
+            else:
+                print(f"✅ Modelo {model_name} já está disponível.")
+                logger.info(f"Modelo {model_name} já está disponível")
+                return True
+        
+        # Verifica se a URL é válida
+        if not ModelDownloader.is_valid_url(download_url):
+            print(f"⚠️ URL inválida para o modelo {model_name}: {download_url}")
+            logger.warning(f"URL inválida para modelo {model_name}: {download_url}")
+            return False
+        
+        try:
+            if downloads_config is None:
+                downloads_config = load_config().get('downloads', {})
+            store = ModelDownloader.get_store()
+            
+            # Pesos já presentes no armazenamento (mesmo digest ou mesma URL) são apenas vinculados
+            digest = sha256.lower() if sha256 else (store.find_by_url(download_url) if store else None)
+            if store and store.has_blob(digest):
+                store.link(digest, model_path)
+                print(f"✅ Modelo {model_name} vinculado ao armazenamento local.")
+                logger.info(f"Modelo {model_name} vinculado ao blob sha256-{digest}")
+                return True
+            
+            print(f"📥 Baixando modelo {model_name}...")
+            logger.info(f"Baixando modelo {model_name} de {download_url}")
+            downloader = RangeDownloader.from_config(downloads_config)
+            if not store:
+                downloader.download(download_url, model_path, sha256=sha256)
+            else:
+                tmp_path = store.temp_path(f"{model_name}.gguf")
+                digest = downloader.download(download_url, tmp_path, sha256=sha256)
+                store.add(tmp_path, digest=digest, url=download_url)
+                store.link(digest, model_path)
+                store.evict(keep={digest})
+            print(f"✅ Modelo {model_name} baixado com sucesso!")
+            logger.info(f"Modelo {model_name} baixado com sucesso")
+            return True
+        except Exception as e:
+            print(f"❌ Erro ao baixar o modelo {model_name}: {str(e)}")
+            logger.error(f"Erro ao baixar modelo {model_name}: {str(e)}")
+            return False
+
+    @staticmethod
+    def _verify_existing(model_path: str, download_url: Optional[str], sha256: Optional[str]) -> bool:
+        """
+        Registra um modelo já presente no armazenamento e confere o digest esperado.
+        
+        O digest fica em cache por inode/mtime/tamanho, então só a primeira verificação lê o arquivo.
+        """
+        try:
+            store = ModelDownloader.get_store()
+            if not store:
+                return True
+            digest = store.adopt(model_path, url=download_url)
+        except OSError as e:
+            logger.warning(f"Falha ao registrar {model_path} no armazenamento: {str(e)}")
+            return True
+        return not sha256 or digest == sha256.lower()
+
+    @staticmethod
+    def get_store() -> Optional[ModelStore]:
+        """
+        Obtém o armazenamento de modelos endereçado por conteúdo (compartilhado no processo).
+        
+        Returns:
+            ModelStore ou None se desativado em models.store
+        """
+        with ModelDownloader._store_lock:
+            if ModelDownloader._store is None:
+                config = load_config()
+                store_config = config.get('store', {})
+                if not store_config.get('enabled', True):
+                    return None
+                ModelDownloader._store = ModelStore.from_config(
+                    ModelDownloader.BASE_DIR, store_config, config.get('env_vars', {})
+                )
+            return ModelDownloader._store
+
+    @staticmethod
+    def get_gguf_index() -> GGUFIndex:
+        """
+        Obtém o índice de cabeçalhos GGUF do diretório models/.
+        
+        Returns:
+            GGUFIndex compartilhado no processo
+        """
+        return get_gguf_index(os.path.join(ModelDownloader.BASE_DIR, 'models'))
+
+    @staticmethod
+    def touch_model(model_file: str) -> None:
+        """
+        Registra o uso de um modelo local para a política LRU do armazenamento.
+        
+        O modelo fica protegido da remoção, por qualquer processo, enquanto este
+        processo existir (os modelos carregados não são descarregados).
+        
+        Args:
+            model_file: Caminho do arquivo do modelo
+        """
+        try:
+            store = ModelDownloader.get_store()
+            if store:
+                store.touch(model_file)
+                store.hold(model_file)
+        except Exception as e:
+            logger.debug(f"Falha ao registrar uso de {model_file}: {str(e)}")
+
+    @staticmethod
+    def get_model_path(model_name: str, model_dir='./models') -> str:
+        """
+        Obtém o caminho absoluto do arquivo GGUF de um modelo local.
+        
+        Args:
+            model_name: Nome do modelo
+            model_dir: Diretório do modelo relativo à raiz do projeto
+            
+        Returns:
+            Caminho do arquivo do modelo
+        """
         full_model_dir = os.path.join(ModelDownloader.BASE_DIR, os.path.normpath(model_dir.lstrip('./')))
-        model_path = os.path.join(full_model_dir, f"{model_name}.gguf")
+        return os.path.join(full_model_dir, f"{model_name}.gguf")
+
+    @staticmethod
+    def get_variants(provider: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Obtém as variantes (quantizações) de um provedor local, da maior para a menor.
+        
+        Provedores sem a lista `variants` têm uma única variante com o arquivo
+        `<model>.gguf` e a `download_url` do próprio provedor.
         
-        if not ModelDownloader.is_model_available(model_name, model_dir):
+        Args:
+            provider: Configuração do provedor
+            
+        Returns:
+            Lista de dicts com quant, file, download_url, sha256 e memory_mb
+        """
+        model_name = provider.get('model', provider.get('name'))
+        if not provider.get('variants'):
+            return [{
+                "quant": None,
+                "file": model_name,
+                "download_url": provider.get('download_url'),
+                "sha256": provider.get('sha256'),
+                "memory_mb": provider.get('memory_mb')
+            }]
+        variants = [
+            {
+                "quant": variant['quant'],
+                "file": variant.get('file', f"{model_name}-{variant['quant']}"),
+                "download_url": variant.get('download_url'),
+                "sha256": variant.get('sha256'),
+                "memory_mb": variant.get('memory_mb')
+            }
+            for variant in provider['variants']
+        ]
+        return sorted(variants, key=lambda variant: variant['memory_mb'] or 0, reverse=True)
+
+    @staticmethod
+    def get_memory_limit_mb(provider_name: Optional[str] = None, config: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Calcula a memória disponível para um modelo local.
+        
+        Considera a memória livre do host (e do cgroup), a reserva `memory.headroom_mb` e o
+        orçamento `memory.budget_mb` (ou MODEL_MEMORY_BUDGET_MB) descontado dos modelos já
+        carregados no pool.
+        
+        Args:
+            provider_name: Provedor sendo carregado (desconsiderado no uso atual)
+            config: Configuração de modelos (opcional)
+            
+        Returns:
+            Memória disponível em MB
+        """
+        config = config or load_config()
+        memory_config = config.get('memory', {})
+        limit = get_available_memory() // MB - memory_config.get('headroom_mb', 512)
+        
+        budget = memory_config.get('budget_mb')
+        env_var = config.get('env_vars', {}).get('memory_budget_mb')
+        env_budget = get_env_var(env_var) if env_var else None
+        if env_budget:
             try:
-                print(f"📥 Baixando modelo {model_name}...")
-                logger.info(f"Baixando modelo {model_name} de {download_url}")
-                
-                # Garante que o diretório exista
-                os.makedirs(full_model_dir, exist_ok=True)
-                
-                # Verifica se a URL é válida
-                if not download_url.startswith(('http://', 'https://')):
-                    print(f"⚠️ URL inválida para o modelo {model_name}: {download_url}")
-                    logger.warning(f"URL inválida para modelo {model_name}: {download_url}")
-                    return
-                
-                # Tenta fazer o download
-                response = requests.get(download_url, stream=True, timeout=30)
-                if response.status_code == 200:
-                    with open(model_path, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    print(f"✅ Modelo {model_name} baixado com sucesso!")
-                    logger.info(f"Modelo {model_name} baixado com sucesso")
-                else:
-                    print(f"❌ Falha ao baixar o modelo {model_name}. Código de status: {response.status_code}")
-                    logger.error(f"Falha ao baixar modelo {model_name}. Status: {response.status_code}")
-            except Exception as e:
-                print(f"❌ Erro ao baixar o modelo {model_name}: {str(e)}")
-                logger.error(f"Erro ao baixar modelo {model_name}: {str(e)}")
-        else:
-            print(f"✅ Modelo {model_name} já está disponível.")
-            logger.info(f"Modelo {model_name} já está disponível")
+                budget = int(env_budget)
+            except ValueError:
+                logger.warning(f"Orçamento de memória inválido em {env_var}: {env_budget}")
+        if budget:
+            limit = min(limit, int(budget) - LOCAL_MODELS.memory_in_use_mb(exclude=provider_name))
+        return max(0, limit)
+
+    @staticmethod
+    def resolve_variant(provider: Dict[str, Any], available_only: bool = False,
+                        config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Escolhe a maior variante de um provedor local que cabe na memória.
+        
+        Args:
+            provider: Configuração do provedor
+            available_only: Considera apenas variantes já baixadas
+            config: Configuração de modelos (opcional)
+            
+        Returns:
+            Variante escolhida; se nenhuma couber, a menor (com aviso)
+        """
+        variants = ModelDownloader.get_variants(provider)
+        if len(variants) == 1:
+            return variants[0]
+        
+        model_dir = provider.get('dir', './models')
+        if available_only:
+            downloaded = [v for v in variants if ModelDownloader.is_model_available(v['file'], model_dir)]
+            variants = downloaded or variants
+        
+        limit_mb = ModelDownloader.get_memory_limit_mb(provider.get('name'), config)
+        for variant in variants:
+            if (variant['memory_mb'] or 0) <= limit_mb:
+                logger.debug(f"Variante {variant['quant']} escolhida para {provider.get('name')} [{variant['memory_mb']}MB de {limit_mb}MB disponíveis]")
+                return variant
+        
+        smallest = variants[-1]
+        logger.warning(f"Nenhuma variante de {provider.get('name')} cabe em {limit_mb}MB; usando a menor ({smallest['quant']}, {smallest['memory_mb']}MB)")
+        return smallest
+
+    @staticmethod
+    def get_provider_model_path(provider: Dict[str, Any]) -> str:
+        """
+        Obtém o caminho do arquivo GGUF que seria carregado para um provedor local.
+        
+        Args:
+            provider: Configuração do provedor
+            
+        Returns:
+            Caminho do arquivo da variante escolhida
+        """
+        variant = ModelDownloader.resolve_variant(provider, available_only=True)
+        return ModelDownloader.get_model_path(variant['file'], provider.get('dir', './models'))
 
     @staticmethod
     def is_model_available(model_name: str, model_dir='./models') -> bool:
-        full_model_dir = os.path.join(ModelDownloader.BASE_DIR, os.path.normpath(model_dir.lstrip('./')))
-        model_path = os.path.join(full_model_dir, f"{model_name}.gguf")
+        model_path = ModelDownloader.get_model_path(model_name, model_dir)
         return os.path.exists(model_path) and os.path.getsize(model_path) >= 1000000
\ No newline at end of file
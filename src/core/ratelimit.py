@@ -0,0 +1,430 @@
+"""
+# src/core/ratelimit.py
+Limite de taxa e concorrência adaptativa dos provedores remotos.
+
+Cada provedor (conta de API: openai, openrouter, gemini, anthropic) tem orçamentos de
+requisições e de tokens por minuto (seção models.rate_limits do kernel.yaml). Os
+orçamentos são baldes de fichas gravados em SQLite e compartilhados por todos os
+processos do host: uma chamada reserva as fichas em uma transação e, se o saldo não
+basta, aguarda o tempo de reposição fora da transação. O saldo pode ficar negativo,
+o que ordena as esperas entre processos sem consultas repetidas.
+
+Com várias chaves por provedor (src/core/keypool.py), cada chave tem os próprios
+baldes e limite de concorrência.
+
+Em cada processo, um limite de concorrência AIMD por balde cresce de forma aditiva
+enquanto as respostas são normais e cai pela metade em um 429 ou em um pico de
+latência. Um 429 também esvazia o balde compartilhado pelo tempo de Retry-After,
+para que os demais processos recuem juntos.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_DB_PATH = "logs/rate_limits.db"
+DEFAULT_MAX_WAIT = 60.0
+# Espera aplicada a todos os processos após um 429 sem Retry-After (s)
+DEFAULT_PENALTY = 5.0
+# Peso da última chamada na média móvel de latência
+LATENCY_SMOOTHING = 0.2
+# Caracteres por token na estimativa do tamanho do prompt
+CHARS_PER_TOKEN = 4
+
+class RateLimitExceeded(Exception):
+    """Orçamento do provedor esgotado por mais tempo que a espera máxima."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Limite de taxa de {provider} esgotado, tente novamente em {math.ceil(retry_after)}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Verifica se um erro dos clientes remotos indica limite de taxa (HTTP 429).
+
+    Args:
+        error: Exceção lançada pelo cliente
+
+    Returns:
+        True para 429 / RateLimitError / ResourceExhausted
+    """
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    return type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Obtém o Retry-After (s) da resposta de um erro do cliente, se houver.
+
+    Args:
+        error: Exceção lançada pelo cliente
+
+    Returns:
+        Segundos ou None
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def estimate_tokens(*texts: Optional[str]) -> int:
+    """Estimativa grosseira de tokens de um conjunto de textos."""
+    return sum(len(text or "") for text in texts) // CHARS_PER_TOKEN + 1
+
+class TokenBucketStore:
+    """Baldes de fichas em SQLite compartilhados entre processos."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        """
+        Inicializa o armazenamento.
+
+        Args:
+            db_path: Caminho do banco SQLite
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        # Transações explícitas (BEGIN IMMEDIATE); a conexão é protegida pelo lock
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _refill(conn: sqlite3.Connection, name: str, rate: float, capacity: float, now: float) -> float:
+        row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return capacity
+        tokens, updated_at = row
+        return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+    @staticmethod
+    def _store(conn: sqlite3.Connection, name: str, tokens: float, now: float) -> None:
+        conn.execute("""
+            INSERT INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+        """, (name, tokens, now))
+
+    def reserve(self, requests: List[Tuple[str, float, float, float]], max_wait: float) -> float:
+        """
+        Reserva fichas em vários baldes de uma vez.
+
+        Args:
+            requests: Lista de (balde, fichas, reposição por segundo, capacidade)
+            max_wait: Espera máxima aceita (s); acima disso nada é reservado
+
+        Returns:
+            Tempo (s) a aguardar antes de usar as fichas reservadas (0 se há saldo)
+
+        Raises:
+            RateLimitExceeded: A espera necessária excede max_wait
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            balances = []
+            wait = 0.0
+            for name, amount, rate, capacity in requests:
+                # Reservas maiores que o balde esperam apenas pelo balde cheio
+                amount = min(amount, capacity)
+                tokens = self._refill(conn, name, rate, capacity, now)
+                wait = max(wait, (amount - tokens) / rate)
+                balances.append((name, tokens - amount))
+            if wait > max_wait:
+                raise RateLimitExceeded(requests[0][0].split(":")[0], wait)
+            for name, tokens in balances:
+                self._store(conn, name, tokens, now)
+        return max(0.0, wait)
+
+    def adjust(self, name: str, delta: float, rate: float, capacity: float) -> None:
+        """
+        Devolve (delta > 0) ou debita (delta < 0) fichas de um balde.
+
+        Args:
+            name: Balde
+            delta: Fichas
+            rate: Reposição por segundo
+            capacity: Capacidade
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            tokens = self._refill(conn, name, rate, capacity, now)
+            self._store(conn, name, min(capacity, tokens + delta), now)
+
+    def penalize(self, name: str, seconds: float, rate: float, capacity: float) -> None:
+        """
+        Esvazia um balde para que nenhum processo o use pelos próximos `seconds`.
+
+        Args:
+            name: Balde
+            seconds: Tempo de espera imposto
+            rate: Reposição por segundo
+            capacity: Capacidade
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            tokens = self._refill(conn, name, rate, capacity, now)
+            self._store(conn, name, min(tokens, -seconds * rate), now)
+
+    def peek(self, name: str, rate: float, capacity: float) -> float:
+        """Saldo atual de um balde (com a reposição), sem reservar."""
+        with self._lock:
+            return self._refill(self.conn, name, rate, capacity, time.time())
+
+    def status(self) -> Dict[str, Dict[str, float]]:
+        """Saldo gravado de cada balde (sem a reposição desde a última alteração)."""
+        with self._lock:
+            rows = self.conn.execute("SELECT name, tokens, updated_at FROM buckets ORDER BY name").fetchall()
+        return {name: {"tokens": round(tokens, 2), "updated_at": updated_at} for name, tokens, updated_at in rows}
+
+class AdaptiveLimit:
+    """Limite de concorrência AIMD (aumento aditivo, redução multiplicativa) de um provedor."""
+
+    def __init__(self, max_limit: int, min_limit: int = 1, latency_spike: float = 3.0,
+                 decrease_factor: float = 0.5, cooldown: float = 5.0):
+        """
+        Inicializa o limite.
+
+        Args:
+            max_limit: Concorrência máxima (valor inicial)
+            min_limit: Concorrência mínima
+            latency_spike: Latência acima de N vezes a média conta como sobrecarga
+            decrease_factor: Fator aplicado ao limite em uma sobrecarga
+            cooldown: Intervalo mínimo entre reduções (s), para que um surto conte uma vez
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.latency_spike = latency_spike
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda uma vaga; retorna False se o tempo limite for atingido."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False) -> None:
+        """
+        Devolve a vaga e ajusta o limite.
+
+        Args:
+            latency: Duração da chamada (s); None para falhas que não indicam carga
+            overloaded: A chamada recebeu 429
+        """
+        with self._condition:
+            self.in_flight -= 1
+            spike = latency is not None and self.latency is not None and \
+                latency > self.latency * self.latency_spike
+            if overloaded or spike:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    previous = self.limit
+                    self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+                    logger.warning(f"Concorrência reduzida de {previous:.1f} para {self.limit:.1f} "
+                                   f"({'429' if overloaded else f'pico de latência {latency:.1f}s'})")
+            elif latency is not None:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            if latency is not None and not overloaded:
+                self.latency = latency if self.latency is None else \
+                    (1 - LATENCY_SMOOTHING) * self.latency + LATENCY_SMOOTHING * latency
+            self._condition.notify_all()
+
+class RateLimitedCall:
+    """Chamada em andamento; recebe o uso real de tokens para acertar o orçamento."""
+
+    def __init__(self, reserved_tokens: int, client: Any = None):
+        self.reserved_tokens = reserved_tokens
+        self.used_tokens: Optional[int] = None
+        # Cliente da chave escolhida para a chamada
+        self.client = client
+
+    def record_usage(self, total_tokens: Optional[int]) -> None:
+        """Registra os tokens efetivamente consumidos (prompt + resposta)."""
+        if total_tokens:
+            self.used_tokens = int(total_tokens)
+
+class RateLimiter:
+    """Orçamentos compartilhados e concorrência adaptativa por provedor remoto."""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Inicializa o limitador.
+
+        Args:
+            config: Seção models.rate_limits do kernel.yaml (opcional)
+        """
+        config = config or {}
+        self.providers: Dict[str, Dict[str, Any]] = config.get('providers') or {}
+        self.max_wait = float(config.get('max_wait', DEFAULT_MAX_WAIT))
+        self.adaptive = config.get('adaptive') or {}
+        self.store = TokenBucketStore(config.get('db_path', DEFAULT_DB_PATH))
+        self._limits: Dict[str, AdaptiveLimit] = {}
+        self._lock = threading.Lock()
+
+    def _get_limit(self, bucket: str, settings: Dict[str, Any]) -> AdaptiveLimit:
+        with self._lock:
+            limit = self._limits.get(bucket)
+            if limit is None:
+                limit = AdaptiveLimit(
+                    max_limit=settings.get('max_concurrency') or 8,
+                    min_limit=self.adaptive.get('min_concurrency', 1),
+                    latency_spike=self.adaptive.get('latency_spike', 3.0),
+                    decrease_factor=self.adaptive.get('decrease_factor', 0.5),
+                    cooldown=self.adaptive.get('cooldown', 5.0)
+                )
+                self._limits[bucket] = limit
+            return limit
+
+    def _buckets(self, bucket: str, settings: Dict[str, Any], tokens: int) -> List[Tuple[str, float, float, float]]:
+        """Baldes (nome, fichas, reposição/s, capacidade) de uma chamada."""
+        buckets = []
+        if settings.get('requests_per_minute'):
+            rpm = float(settings['requests_per_minute'])
+            buckets.append((f"{bucket}:requests", 1.0, rpm / 60, rpm))
+        if settings.get('tokens_per_minute'):
+            tpm = float(settings['tokens_per_minute'])
+            buckets.append((f"{bucket}:tokens", float(tokens), tpm / 60, tpm))
+        return buckets
+
+    def estimate_wait(self, provider: str, bucket: Optional[str] = None) -> float:
+        """
+        Estima a espera (s) de uma nova requisição pelo orçamento de requisições de um balde.
+
+        Args:
+            provider: Provedor (chave em rate_limits.providers)
+            bucket: Nome do balde (padrão: o provedor)
+
+        Returns:
+            Segundos (0 se há saldo ou o provedor não tem limite)
+        """
+        settings = self.providers.get(provider) or {}
+        if not settings.get('requests_per_minute'):
+            return 0.0
+        rpm = float(settings['requests_per_minute'])
+        tokens = self.store.peek(f"{bucket or provider}:requests", rpm / 60, rpm)
+        return max(0.0, (1.0 - tokens) / (rpm / 60))
+
+    @contextmanager
+    def limit(self, provider: str, prompt_tokens: int, max_tokens: int,
+              bucket: Optional[str] = None, client: Any = None) -> Iterator[RateLimitedCall]:
+        """
+        Executa uma chamada ao provedor dentro do orçamento e do limite de concorrência.
+
+        Args:
+            provider: Provedor (chave em rate_limits.providers, ex: "openai")
+            prompt_tokens: Tokens estimados do prompt
+            max_tokens: Tokens máximos da resposta
+            bucket: Nome do balde compartilhado (padrão: o provedor)
+            client: Cliente usado na chamada, repassado em RateLimitedCall.client (opcional)
+
+        Yields:
+            RateLimitedCall para registrar o uso real
+
+        Raises:
+            RateLimitExceeded: Sem orçamento ou vaga dentro da espera máxima
+        """
+        settings = self.providers.get(provider)
+        call = RateLimitedCall(prompt_tokens + max_tokens, client)
+        if not settings:
+            yield call
+            return
+
+        bucket = bucket or provider
+        buckets = self._buckets(bucket, settings, call.reserved_tokens)
+        wait = self.store.reserve(buckets, self.max_wait) if buckets else 0.0
+        if wait > 0:
+            logger.info(f"Aguardando orçamento de {bucket} [{wait:.1f}s]")
+            time.sleep(wait)
+
+        limit = self._get_limit(bucket, settings)
+        if not limit.acquire(self.max_wait):
+            raise RateLimitExceeded(provider, self.max_wait)
+
+        start = time.monotonic()
+        latency = None
+        overloaded = False
+        try:
+            yield call
+            latency = time.monotonic() - start
+        except Exception as e:
+            if is_rate_limit_error(e):
+                overloaded = True
+                penalty = get_retry_after(e) or DEFAULT_PENALTY
+                logger.warning(f"429 de {bucket}; orçamento suspenso por {penalty:.0f}s")
+                for name, _, rate, capacity in buckets[:1]:
+                    self.store.penalize(name, penalty, rate, capacity)
+            raise
+        finally:
+            limit.release(latency, overloaded)
+
+        # Devolve ao balde de tokens a diferença entre a reserva e o uso real
+        if call.used_tokens is not None:
+            for name, amount, rate, capacity in buckets:
+                if name.endswith(":tokens"):
+                    self.store.adjust(name, amount - call.used_tokens, rate, capacity)
+
+    def status(self) -> Dict[str, Any]:
+        """Limites de concorrência do processo (por balde) e saldos dos baldes."""
+        with self._lock:
+            limits = {
+                bucket: {"limit": round(limit.limit, 2), "in_flight": limit.in_flight,
+                           "latency_s": round(limit.latency, 3) if limit.latency is not None else None}
+                for bucket, limit in self._limits.items()
+            }
+        return {"concurrency": limits, "buckets": self.store.status()}
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(config: Optional[Dict[str, Any]] = None) -> RateLimiter:
+    """
+    Obtém o limitador do processo (um por banco), compartilhado por todos os ModelManager.
+
+    Args:
+        config: Seção models.rate_limits do kernel.yaml (opcional)
+
+    Returns:
+        RateLimiter
+    """
+    db_path = (config or {}).get('db_path', DEFAULT_DB_PATH)
+    with _limiters_lock:
+        if db_path not in _limiters:
+            _limiters[db_path] = RateLimiter(config)
+        return _limiters[db_path]
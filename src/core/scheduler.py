@@ -0,0 +1,326 @@
+"""
+# src/core/scheduler.py
+Escalonamento por prioridade e controle de admissão entre sessões.
+
+Nos modos em que várias sessões dividem os mesmos orquestradores (`serve` e MCP
+persistente), cada execução obtém uma vaga do escalonador antes de usar os modelos.
+As requisições são classificadas pelo `session_id` e pela origem (caller) em classes
+de prioridade com peso e limite de fila próprios (seção scheduler do kernel.yaml).
+
+As vagas são distribuídas por enfileiramento justo ponderado: cada sessão é um fluxo
+com o peso da sua classe, e a próxima vaga vai para a requisição com a menor marca
+de término virtual. Assim um lote grande de uma sessão não bloqueia as demais, e as
+classes interativas passam à frente das de lote sem deixá-las paradas. Acima do
+limite de fila da classe a requisição é rejeitada imediatamente com uma estimativa
+de quando tentar novamente, em vez de aguardar até o tempo limite.
+"""
+import fnmatch
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_CLASS = "default"
+DEFAULT_CLASSES = {
+    "interactive": {"weight": 8, "queue_limit": 16},
+    "default": {"weight": 2, "queue_limit": 32},
+    "batch": {"weight": 1, "queue_limit": 256}
+}
+# Peso da última execução na média móvel de latência (usada na estimativa de nova tentativa)
+LATENCY_SMOOTHING = 0.2
+# Acima deste número de fluxos, as marcas de fluxos já alcançados pelo tempo virtual são descartadas
+MAX_FLOWS = 1024
+
+class SchedulerSaturated(Exception):
+    """Fila da classe de prioridade cheia; a requisição deve ser repetida após retry_after segundos."""
+
+    def __init__(self, priority: str, retry_after: int):
+        super().__init__(f"Fila de prioridade '{priority}' cheia, tente novamente em {retry_after}s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+@dataclass(frozen=True)
+class PriorityClass:
+    """Classe de prioridade: peso na divisão das vagas e limite de requisições em espera."""
+    name: str
+    weight: float
+    queue_limit: int
+
+class SchedulingPolicy:
+    """Classificação das requisições em classes de prioridade."""
+
+    def __init__(self, classes: Optional[Dict[str, Dict[str, Any]]] = None,
+                 callers: Optional[Dict[str, str]] = None,
+                 sessions: Optional[Dict[str, str]] = None,
+                 default_class: str = DEFAULT_CLASS):
+        """
+        Inicializa a política.
+
+        Args:
+            classes: Classe -> {"weight", "queue_limit"} (padrão: DEFAULT_CLASSES)
+            callers: Origem da requisição -> classe (ex: {"api-batch": "batch"})
+            sessions: Padrão de session_id (fnmatch) -> classe; tem precedência sobre callers
+            default_class: Classe das requisições não classificadas
+        """
+        self.classes: Dict[str, PriorityClass] = {}
+        for name, options in (classes or DEFAULT_CLASSES).items():
+            options = options or {}
+            self.classes[name] = PriorityClass(
+                name=name,
+                weight=max(float(options.get("weight", 1)), 0.01),
+                queue_limit=max(int(options.get("queue_limit", 0)), 0)
+            )
+        if default_class not in self.classes:
+            self.classes[default_class] = PriorityClass(default_class, 1.0, 0)
+        self.callers = dict(callers or {})
+        self.sessions = dict(sessions or {})
+        self.default_class = default_class
+
+        for target in list(self.callers.values()) + list(self.sessions.values()):
+            if target not in self.classes:
+                logger.warning(f"Classe de prioridade desconhecida no escalonador: {target}")
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> "SchedulingPolicy":
+        """
+        Cria a política a partir da seção scheduler do kernel.yaml.
+
+        Args:
+            config: Configuração do escalonador (opcional)
+
+        Returns:
+            SchedulingPolicy configurada
+        """
+        config = config or {}
+        return cls(
+            classes=config.get('classes'),
+            callers=config.get('callers'),
+            sessions=config.get('sessions'),
+            default_class=config.get('default_class', DEFAULT_CLASS)
+        )
+
+    def classify(self, session_id: Optional[str], caller: Optional[str]) -> PriorityClass:
+        """
+        Determina a classe de uma requisição.
+
+        Args:
+            session_id: Sessão da requisição (opcional)
+            caller: Origem da requisição (ex: "api", "mcp")
+
+        Returns:
+            Classe de prioridade
+        """
+        if session_id:
+            for pattern, name in self.sessions.items():
+                if fnmatch.fnmatchcase(session_id, pattern) and name in self.classes:
+                    return self.classes[name]
+        name = self.callers.get(caller or "")
+        return self.classes.get(name, self.classes[self.default_class])
+
+class Ticket:
+    """Requisição registrada no escalonador, aguardando ou ocupando uma vaga."""
+
+    def __init__(self, priority: PriorityClass, flow: Tuple[str, str], start: float, finish: float,
+                 on_grant: Optional[Callable[["Ticket"], None]]):
+        self.priority = priority
+        self.flow = flow
+        self.start = start
+        self.finish = finish
+        self.on_grant = on_grant
+        self.queued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.cancelled = False
+        self._granted = threading.Event()
+
+    @property
+    def granted(self) -> bool:
+        return self._granted.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda a vaga; retorna False se o tempo limite for atingido."""
+        return self._granted.wait(timeout)
+
+class FairScheduler:
+    """Escalonador de vagas com enfileiramento justo ponderado por sessão e limite de fila por classe."""
+
+    def __init__(self, policy: Optional[SchedulingPolicy] = None, slots: int = 1):
+        """
+        Inicializa o escalonador.
+
+        Args:
+            policy: Política de classificação (padrão: SchedulingPolicy())
+            slots: Execuções simultâneas
+        """
+        self.policy = policy or SchedulingPolicy()
+        self.slots = max(1, slots)
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, int, Ticket]] = []
+        self._sequence = itertools.count()
+        self._virtual = 0.0
+        self._finish: Dict[Tuple[str, str], float] = {}
+        self._queued: Dict[str, int] = {name: 0 for name in self.policy.classes}
+        self._running: Dict[str, int] = {name: 0 for name in self.policy.classes}
+        self._rejected: Dict[str, int] = {name: 0 for name in self.policy.classes}
+        self._latency: Optional[float] = None
+
+    def submit(self, session_id: Optional[str], caller: Optional[str],
+               on_grant: Optional[Callable[[Ticket], None]] = None,
+               cost: float = 1.0, enforce_limit: bool = True) -> Ticket:
+        """
+        Registra uma requisição; a vaga é concedida agora ou quando chegar a sua vez.
+
+        on_grant é chamado (fora do lock, na thread que liberou a vaga) quando a vaga é
+        concedida; quem recebe a vaga deve devolvê-la com release().
+
+        Args:
+            session_id: Sessão da requisição (fluxo da divisão justa)
+            caller: Origem da requisição
+            on_grant: Callback chamado com o ticket ao receber a vaga (opcional)
+            cost: Custo relativo da requisição
+            enforce_limit: Se False, ignora o limite de fila (ex: aquecimento)
+
+        Returns:
+            Ticket da requisição
+
+        Raises:
+            SchedulerSaturated: Fila da classe cheia
+        """
+        priority = self.policy.classify(session_id, caller)
+        with self._lock:
+            limit = priority.queue_limit
+            if enforce_limit and limit and self._queued[priority.name] >= limit:
+                self._rejected[priority.name] += 1
+                retry_after = self._retry_after()
+                logger.warning(f"Requisição rejeitada: fila '{priority.name}' cheia "
+                               f"[{self._queued[priority.name]}/{limit}, sessão {session_id}]")
+                raise SchedulerSaturated(priority.name, retry_after)
+
+            flow = (priority.name, session_id or "")
+            start = max(self._virtual, self._finish.get(flow, 0.0))
+            ticket = Ticket(priority, flow, start, start + cost / priority.weight, on_grant)
+            self._finish[flow] = ticket.finish
+            heapq.heappush(self._heap, (ticket.finish, next(self._sequence), ticket))
+            self._queued[priority.name] += 1
+            granted = self._dispatch()
+        self._notify(granted)
+        return ticket
+
+    def cancel(self, ticket: Ticket) -> bool:
+        """
+        Retira da fila uma requisição que ainda não recebeu vaga.
+
+        Returns:
+            True se a requisição foi retirada; False se já tinha recebido a vaga
+        """
+        with self._lock:
+            if ticket.granted or ticket.cancelled:
+                return False
+            ticket.cancelled = True
+            self._queued[ticket.priority.name] -= 1
+            return True
+
+    def release(self, ticket: Ticket) -> None:
+        """Devolve a vaga de uma requisição concluída e concede a próxima."""
+        with self._lock:
+            if ticket.granted_at is None:
+                return
+            seconds = time.monotonic() - ticket.granted_at
+            ticket.granted_at = None
+            self._running[ticket.priority.name] -= 1
+            self._latency = seconds if self._latency is None else \
+                (1 - LATENCY_SMOOTHING) * self._latency + LATENCY_SMOOTHING * seconds
+            granted = self._dispatch()
+        self._notify(granted)
+
+    @contextmanager
+    def acquire(self, session_id: Optional[str], caller: Optional[str],
+                timeout: Optional[float] = None) -> Iterator[Ticket]:
+        """
+        Obtém uma vaga na thread atual (bloqueante) e a devolve ao sair do bloco.
+
+        Raises:
+            SchedulerSaturated: Fila da classe cheia
+            TimeoutError: A vaga não foi concedida dentro do tempo limite
+        """
+        ticket = self.submit(session_id, caller)
+        if not ticket.wait(timeout) and self.cancel(ticket):
+            raise TimeoutError(f"Sem vaga no escalonador após {timeout:.0f}s")
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def set_limit(self, slots: int) -> None:
+        """Altera o número de execuções simultâneas (as vagas em uso não são interrompidas)."""
+        with self._lock:
+            self.slots = max(1, slots)
+            granted = self._dispatch()
+        self._notify(granted)
+
+    def retry_after(self) -> int:
+        """Estimativa (em segundos) para a fila atual esvaziar."""
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self) -> int:
+        latency = self._latency or 1.0
+        waves = (sum(self._queued.values()) + sum(self._running.values()) + 1) / self.slots
+        return max(1, math.ceil(latency * waves))
+
+    def _dispatch(self) -> List[Ticket]:
+        """Concede as vagas livres às requisições de menor término virtual (com o lock)."""
+        granted = []
+        while self._heap and sum(self._running.values()) < self.slots:
+            _, _, ticket = heapq.heappop(self._heap)
+            if ticket.cancelled:
+                continue
+            self._virtual = max(self._virtual, ticket.start)
+            self._queued[ticket.priority.name] -= 1
+            self._running[ticket.priority.name] += 1
+            ticket.granted_at = time.monotonic()
+            granted.append(ticket)
+
+        if len(self._finish) > MAX_FLOWS:
+            self._finish = {flow: finish for flow, finish in self._finish.items() if finish > self._virtual}
+        return granted
+
+    def _notify(self, granted: List[Ticket]) -> None:
+        for ticket in granted:
+            ticket._granted.set()
+            if ticket.on_grant:
+                try:
+                    ticket.on_grant(ticket)
+                except Exception as e:
+                    logger.error(f"Erro ao iniciar requisição escalonada: {str(e)}")
+                    self.release(ticket)
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Obtém o estado das filas.
+
+        Returns:
+            Dict com vagas, latência média e, por classe, peso, limite, em espera, em execução e rejeitadas
+        """
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "latency_s": round(self._latency, 3) if self._latency is not None else None,
+                "classes": {
+                    name: {
+                        "weight": priority.weight,
+                        "queue_limit": priority.queue_limit,
+                        "queued": self._queued[name],
+                        "running": self._running[name],
+                        "rejected": self._rejected[name]
+                    }
+                    for name, priority in self.policy.classes.items()
+                }
+            }
@@ -0,0 +1,241 @@
+"""
+# src/core/speculative.py
+Decodificação especulativa para modelos locais executados via llama.cpp.
+
+Suporta dois modos de rascunho:
+- prompt_lookup: proposta de tokens por busca de n-gramas no próprio contexto
+- draft_model: proposta de tokens por um modelo local menor (ex: tinyllama)
+"""
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from src.core.kernel import get_env_var
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+SPECULATIVE_MODES = ("prompt_lookup", "draft_model")
+
+class TrackingDraftModel:
+    """
+    Envoltório de um modelo de rascunho que contabiliza a taxa de aceitação.
+
+    O llama.cpp chama o modelo de rascunho a cada passo com o contexto atual. Como o
+    contexto da chamada seguinte contém os tokens aceitos da proposta anterior, a
+    aceitação é medida pelo prefixo comum entre a proposta e os novos tokens.
+    """
+
+    def __init__(self, proposer: Callable[..., np.ndarray], mode: str):
+        """
+        Inicializa o envoltório.
+
+        Args:
+            proposer: Objeto chamável compatível com LlamaDraftModel
+            mode: Modo de rascunho (prompt_lookup ou draft_model)
+        """
+        self.proposer = proposer
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._last_context_len = 0
+        self._last_context_tail: Optional[np.ndarray] = None
+        self._last_proposal: Optional[np.ndarray] = None
+        self.steps = 0
+        self.drafted_tokens = 0
+        self.accepted_tokens = 0
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        with self._lock:
+            self._account_previous_proposal(input_ids)
+            proposal = np.asarray(self.proposer(input_ids, **kwargs), dtype=np.intc)
+            self._last_context_len = len(input_ids)
+            # Guarda apenas o final do contexto: suficiente para detectar troca de geração
+            self._last_context_tail = np.array(input_ids[-8:], dtype=np.intc)
+            self._last_proposal = proposal if len(proposal) else None
+            self.steps += 1
+            return proposal
+
+    def _account_previous_proposal(self, input_ids: np.ndarray) -> None:
+        """Contabiliza quantos tokens da proposta anterior foram aceitos pelo modelo alvo."""
+        proposal = self._last_proposal
+        self._last_proposal = None
+        if proposal is None or len(input_ids) <= self._last_context_len:
+            return
+
+        tail_start = self._last_context_len - len(self._last_context_tail)
+        if not np.array_equal(input_ids[tail_start:self._last_context_len], self._last_context_tail):
+            # Nova geração: a proposta anterior nunca foi verificada
+            return
+
+        new_tokens = input_ids[self._last_context_len:]
+        limit = min(len(proposal), len(new_tokens))
+        mismatches = np.nonzero(proposal[:limit] != new_tokens[:limit])[0]
+        accepted = int(mismatches[0]) if len(mismatches) else limit
+
+        self.drafted_tokens += len(proposal)
+        self.accepted_tokens += accepted
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        Obtém os contadores acumulados.
+
+        Returns:
+            Dict com passos, tokens propostos e tokens aceitos
+        """
+        with self._lock:
+            return {
+                "steps": self.steps,
+                "drafted_tokens": self.drafted_tokens,
+                "accepted_tokens": self.accepted_tokens
+            }
+
+    def stats_since(self, before: Dict[str, int]) -> Dict[str, Any]:
+        """
+        Calcula as estatísticas de uma geração a partir de um snapshot anterior.
+
+        Args:
+            before: Snapshot obtido antes da geração
+
+        Returns:
+            Dict com modo, contadores e taxa de aceitação
+        """
+        after = self.snapshot()
+        drafted = after["drafted_tokens"] - before["drafted_tokens"]
+        accepted = after["accepted_tokens"] - before["accepted_tokens"]
+        return {
+            "mode": self.mode,
+            "steps": after["steps"] - before["steps"],
+            "drafted_tokens": drafted,
+            "accepted_tokens": accepted,
+            "acceptance_rate": round(accepted / drafted, 4) if drafted else 0.0
+        }
+
+class LlamaDraftModelDecoding:
+    """
+    Rascunho por um modelo llama.cpp menor.
+
+    Quando os vocabulários do modelo alvo e do modelo de rascunho diferem, o contexto
+    é convertido via texto (detokenização no alvo e tokenização no rascunho) e a
+    proposta faz o caminho inverso. A verificação pelo modelo alvo garante que a
+    saída final é a mesma da decodificação sem rascunho.
+    """
+
+    def __init__(self, draft_model: Any, num_pred_tokens: int = 8):
+        """
+        Inicializa o rascunho.
+
+        Args:
+            draft_model: Instância Llama usada para propor tokens
+            num_pred_tokens: Quantidade de tokens propostos por passo
+        """
+        self.draft_model = draft_model
+        self.num_pred_tokens = num_pred_tokens
+        self.target_model: Optional[Any] = None
+        self._shared_vocab: Optional[bool] = None
+
+    def bind_target(self, target_model: Any) -> None:
+        """
+        Associa o modelo alvo, necessário para converter tokens entre vocabulários.
+
+        Args:
+            target_model: Instância Llama que verifica as propostas
+        """
+        self.target_model = target_model
+        self._shared_vocab = target_model.n_vocab() == self.draft_model.n_vocab()
+        logger.info(f"Rascunho associado ao modelo alvo [vocabulário compartilhado={self._shared_vocab}]")
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        if self.target_model is None:
+            return np.array([], dtype=np.intc)
+
+        if self._shared_vocab:
+            context = [int(t) for t in input_ids]
+        else:
+            text = self.target_model.detokenize(input_ids.tolist(), special=True)
+            context = self.draft_model.tokenize(text, add_bos=True, special=True)
+
+        draft_tokens = []
+        eos = self.draft_model.token_eos()
+        for token in self.draft_model.generate(context, temp=0.0, top_k=1):
+            if token == eos:
+                break
+            draft_tokens.append(token)
+            if len(draft_tokens) >= self.num_pred_tokens:
+                break
+
+        if self._shared_vocab:
+            return np.array(draft_tokens, dtype=np.intc)
+
+        draft_text = self.draft_model.detokenize(draft_tokens, prev_tokens=context, special=True)
+        if not draft_text:
+            return np.array([], dtype=np.intc)
+        return np.array(
+            self.target_model.tokenize(draft_text, add_bos=False, special=True)[:self.num_pred_tokens],
+            dtype=np.intc
+        )
+
+def get_speculative_config(provider: Dict[str, Any], env_var_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Resolve a configuração de decodificação especulativa de um provedor local.
+
+    A variável de ambiente (se configurada) sobrepõe o modo do kernel.yaml: "off"
+    desativa, "prompt_lookup" ou "draft_model" ativam o modo indicado.
+
+    Args:
+        provider: Configuração do provedor
+        env_var_name: Nome da variável de ambiente de sobreposição (opcional)
+
+    Returns:
+        Dict com a configuração efetiva ou None se desativada
+    """
+    config = dict(provider.get('speculative') or {})
+    override = get_env_var(env_var_name) if env_var_name else None
+
+    if override:
+        override = override.strip().lower()
+        if override in ("off", "false", "0", "none"):
+            return None
+        if override in SPECULATIVE_MODES:
+            config['enabled'] = True
+            config['mode'] = override
+
+    if not config.get('enabled', False):
+        return None
+
+    mode = config.get('mode', 'prompt_lookup')
+    if mode not in SPECULATIVE_MODES:
+        logger.warning(f"Modo especulativo desconhecido para {provider.get('name')}: {mode}")
+        return None
+    if mode == 'draft_model' and not config.get('draft_provider'):
+        logger.warning(f"Provedor {provider.get('name')} sem draft_provider; usando prompt_lookup")
+        mode = 'prompt_lookup'
+
+    config['mode'] = mode
+    return config
+
+def build_draft_model(config: Dict[str, Any], load_draft: Callable[[str, int], Any]) -> TrackingDraftModel:
+    """
+    Cria o modelo de rascunho para um provedor local.
+
+    Args:
+        config: Configuração especulativa efetiva (ver get_speculative_config)
+        load_draft: Função que carrega um Llama de rascunho a partir do nome do provedor e n_ctx
+
+    Returns:
+        TrackingDraftModel pronto para ser passado como draft_model ao Llama
+    """
+    num_pred_tokens = int(config.get('num_pred_tokens', 8))
+
+    if config['mode'] == 'draft_model':
+        draft_llama = load_draft(config['draft_provider'], int(config.get('draft_n_ctx', 2048)))
+        proposer = LlamaDraftModelDecoding(draft_llama, num_pred_tokens=num_pred_tokens)
+    else:
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+        proposer = LlamaPromptLookupDecoding(
+            max_ngram_size=int(config.get('max_ngram_size', 2)),
+            num_pred_tokens=num_pred_tokens
+        )
+
+    logger.info(f"Decodificação especulativa configurada [modo={config['mode']}, num_pred_tokens={num_pred_tokens}]")
+    return TrackingDraftModel(proposer, config['mode'])
@@ -0,0 +1,282 @@
+"""
+# src/core/tuning.py
+Ajuste automático de n_threads, n_threads_batch e n_batch dos modelos locais por host.
+
+O comando `prompt_tdd tune` mede a avaliação do prompt e a geração de cada modelo
+local em diferentes configurações, respeitando a afinidade de CPU e a cota do
+cgroup, e grava as melhores em `models/host_profiles/<host>.yaml`. O ModelManager
+aplica o perfil do host automaticamente ao registrar os modelos locais.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+
+from src.core.host import get_affinity_cpus, get_cgroup_cpu_quota, get_cpu_limit, get_host_name
+from src.core.kernel import get_env_var
+from src.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+DEFAULT_PROFILES_DIR = "./models/host_profiles"
+DEFAULT_BATCH_SIZES = [64, 128, 256, 512]
+# Parâmetros de carregamento do Llama definidos pelo perfil do host
+TUNED_KEYS = ("n_threads", "n_threads_batch", "n_batch")
+# Texto repetido para compor o prompt sintético do benchmark
+BENCHMARK_TEXT = (
+    "Sistema de cadastro de pessoas com nome, e-mail, CPF e data de nascimento. "
+    "Dado um usuário autenticado, quando enviar o formulário, então o cadastro deve ser salvo. "
+)
+
+_profile_cache: Dict[str, Optional[Dict[str, Any]]] = {}
+_profile_lock = threading.Lock()
+
+def get_profile_path(config: Dict[str, Any], host: Optional[str] = None) -> str:
+    """
+    Obtém o caminho do perfil de ajuste do host.
+
+    A variável de ambiente configurada em env_vars.host_profile sobrepõe o caminho.
+
+    Args:
+        config: Configuração de modelos (kernel.yaml)
+        host: Nome do host (padrão: host atual)
+
+    Returns:
+        Caminho do arquivo YAML do perfil
+    """
+    env_var = config.get('env_vars', {}).get('host_profile')
+    override = get_env_var(env_var) if env_var else None
+    if override:
+        return override
+    profiles_dir = config.get('tuning', {}).get('profiles_dir', DEFAULT_PROFILES_DIR)
+    return os.path.join(BASE_DIR, os.path.normpath(profiles_dir), f"{host or get_host_name()}.yaml")
+
+def load_host_profile(config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Carrega o perfil de ajuste do host (com cache por processo).
+
+    Args:
+        config: Configuração de modelos (kernel.yaml)
+
+    Returns:
+        Perfil ou None se o host ainda não foi ajustado
+    """
+    path = get_profile_path(config)
+    with _profile_lock:
+        if path not in _profile_cache:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    _profile_cache[path] = yaml.safe_load(f) or {}
+                logger.info(f"Perfil de ajuste do host carregado: {path}")
+            except FileNotFoundError:
+                _profile_cache[path] = None
+            except (OSError, yaml.YAMLError) as e:
+                logger.warning(f"Falha ao ler perfil de ajuste {path}: {str(e)}")
+                _profile_cache[path] = None
+        return _profile_cache[path]
+
+def save_host_profile(config: Dict[str, Any], profile: Dict[str, Any]) -> str:
+    """
+    Grava o perfil de ajuste do host.
+
+    Args:
+        config: Configuração de modelos (kernel.yaml)
+        profile: Perfil a ser gravado
+
+    Returns:
+        Caminho do arquivo gravado
+    """
+    path = get_profile_path(config, profile.get('host'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(profile, f, sort_keys=False, allow_unicode=True)
+    os.replace(tmp_path, path)
+    with _profile_lock:
+        _profile_cache[path] = profile
+    return path
+
+def apply_host_profile(provider: Dict[str, Any], profile: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Aplica o perfil do host à configuração de um provedor local.
+
+    Mesmo sem perfil, o número de threads é limitado às CPUs disponíveis para o processo.
+
+    Args:
+        provider: Configuração do provedor (kernel.yaml)
+        profile: Perfil do host (opcional)
+
+    Returns:
+        Cópia da configuração com os parâmetros ajustados
+    """
+    tuned = dict(provider)
+    settings = ((profile or {}).get('providers') or {}).get(provider.get('name'), {})
+    for key in TUNED_KEYS:
+        if settings.get(key):
+            tuned[key] = settings[key]
+
+    cpu_limit = get_cpu_limit()
+    tuned['n_threads'] = min(tuned.get('n_threads', 4), cpu_limit)
+    if tuned.get('n_threads_batch'):
+        tuned['n_threads_batch'] = min(tuned['n_threads_batch'], cpu_limit)
+    return tuned
+
+def thread_candidates(cpu_limit: int) -> List[int]:
+    """
+    Gera os números de threads avaliados: potências de 2, metade e total das CPUs.
+
+    Args:
+        cpu_limit: CPUs disponíveis para o processo
+
+    Returns:
+        Lista ordenada de candidatos
+    """
+    candidates = {cpu_limit, max(1, cpu_limit // 2)}
+    threads = 1
+    while threads < cpu_limit:
+        candidates.add(threads)
+        threads *= 2
+    return sorted(candidates)
+
+def measure(load_model: Callable[..., Any], n_threads: int, n_threads_batch: int, n_batch: int,
+            prompt_tokens: int, generation_tokens: int) -> Dict[str, float]:
+    """
+    Mede a avaliação do prompt e a geração para uma configuração.
+
+    Args:
+        load_model: Função que carrega um Llama com os parâmetros informados
+        n_threads: Threads da geração
+        n_threads_batch: Threads da avaliação do prompt
+        n_batch: Tamanho do lote de avaliação do prompt
+        prompt_tokens: Tokens do prompt sintético
+        generation_tokens: Tokens gerados
+
+    Returns:
+        Dict com prompt_tps e generation_tps (tokens/s)
+    """
+    model = load_model(n_threads=n_threads, n_threads_batch=n_threads_batch, n_batch=n_batch)
+    try:
+        text = BENCHMARK_TEXT
+        tokens = model.tokenize(text.encode("utf-8"), add_bos=True)
+        while len(tokens) < prompt_tokens:
+            text += BENCHMARK_TEXT
+            tokens = model.tokenize(text.encode("utf-8"), add_bos=True)
+        tokens = tokens[:prompt_tokens]
+
+        model.reset()
+        start = time.perf_counter()
+        model.eval(tokens)
+        prompt_seconds = time.perf_counter() - start
+
+        # generate() reaproveita o prompt já avaliado (prefixo no cache de KV)
+        generated = 0
+        start = time.perf_counter()
+        for _ in model.generate(tokens, temp=0.0, top_k=1):
+            generated += 1
+            if generated >= generation_tokens:
+                break
+        generation_seconds = time.perf_counter() - start
+    finally:
+        close = getattr(model, "close", None)
+        if close:
+            close()
+
+    return {
+        "prompt_tps": round(len(tokens) / prompt_seconds, 2) if prompt_seconds else 0.0,
+        "generation_tps": round(generated / generation_seconds, 2) if generation_seconds else 0.0
+    }
+
+def tune_model(model_file: str, tuning_config: Optional[Dict[str, Any]] = None,
+               threads: Optional[List[int]] = None, batch_sizes: Optional[List[int]] = None,
+               on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Encontra as melhores configurações de threads e lote para um modelo.
+
+    Primeiro avalia os números de threads (com o lote padrão), escolhendo o melhor para
+    a geração e o melhor para o prompt; depois avalia os tamanhos de lote com as threads
+    escolhidas. Cada configuração recarrega o modelo (via mmap, a partir do cache de páginas).
+
+    Args:
+        model_file: Caminho do arquivo GGUF
+        tuning_config: Seção models.tuning do kernel.yaml (opcional)
+        threads: Números de threads a avaliar (padrão: thread_candidates)
+        batch_sizes: Tamanhos de lote a avaliar (padrão: configuração)
+        on_result: Callback chamado com cada medição (opcional)
+
+    Returns:
+        Dict com n_threads, n_threads_batch, n_batch, prompt_tps, generation_tps e as medições
+    """
+    from llama_cpp import Llama
+
+    tuning_config = tuning_config or {}
+    prompt_tokens = tuning_config.get('prompt_tokens', 256)
+    generation_tokens = tuning_config.get('generation_tokens', 32)
+    threads = threads or thread_candidates(get_cpu_limit())
+    batch_sizes = batch_sizes or tuning_config.get('batch_sizes', DEFAULT_BATCH_SIZES)
+    default_batch = max(batch_sizes)
+
+    def load_model(n_threads: int, n_threads_batch: int, n_batch: int):
+        return Llama(
+            model_path=model_file,
+            n_ctx=prompt_tokens + generation_tokens + 16,
+            n_threads=n_threads,
+            n_threads_batch=n_threads_batch,
+            n_batch=n_batch,
+            n_ubatch=n_batch,
+            verbose=False
+        )
+
+    measurements = []
+
+    def run(n_threads: int, n_threads_batch: int, n_batch: int) -> Dict[str, Any]:
+        result = dict(
+            measure(load_model, n_threads, n_threads_batch, n_batch, prompt_tokens, generation_tokens),
+            n_threads=n_threads, n_threads_batch=n_threads_batch, n_batch=n_batch
+        )
+        measurements.append(result)
+        logger.debug(f"Medição {os.path.basename(model_file)}: {result}")
+        if on_result:
+            on_result(result)
+        return result
+
+    thread_results = [run(t, t, default_batch) for t in threads]
+    best_generation = max(thread_results, key=lambda r: r["generation_tps"])
+    best_prompt = max(thread_results, key=lambda r: r["prompt_tps"])
+
+    batch_results = [best_prompt] + [
+        run(best_generation["n_threads"], best_prompt["n_threads_batch"], n_batch)
+        for n_batch in batch_sizes if n_batch != default_batch
+    ]
+    best_batch = max(batch_results, key=lambda r: r["prompt_tps"])
+
+    return {
+        "n_threads": best_generation["n_threads"],
+        "n_threads_batch": best_prompt["n_threads_batch"],
+        "n_batch": best_batch["n_batch"],
+        "prompt_tps": best_batch["prompt_tps"],
+        "generation_tps": best_generation["generation_tps"],
+        "measurements": measurements
+    }
+
+def new_host_profile() -> Dict[str, Any]:
+    """
+    Cria um perfil vazio com a identificação do host e dos limites de CPU.
+
+    Returns:
+        Perfil sem provedores
+    """
+    return {
+        "host": get_host_name(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "cpu": {
+            "affinity": get_affinity_cpus(),
+            "cgroup_quota": get_cgroup_cpu_quota(),
+            "limit": get_cpu_limit()
+        },
+        "providers": {}
+    }
@@ -9,15 +9,27 @@ import os
 import sys
 import json
 import argparse
+import functools
+import threading
+import time
 import uuid
-from typing import Dict, Any, Optional
+from datetime import datetime
+from typing import Callable, Dict, Any, Optional
 from dataclasses import dataclass
 from rich.console import Console
+from rich.table import Table
 
 from src.core.agents import AgentOrchestrator
-from src.core.models import ModelManager
+from src.core.models import ModelManager, ModelDownloader, ModelRegistry, load_config
+from src.core.tuning import load_host_profile, new_host_profile, save_host_profile, tune_model
 from src.core.db import DatabaseManager
+from src.core.http_server import ServerSettings, run_server
+from src.core.jobs import FAILED, FINAL_STATES, QUEUED, RUNNING, SUCCEEDED, Job, JobQueue, run_worker_pool
+from src.core.kernel import CONFIG
 from src.core.logger import get_logger
+from src.core.mcp_spool import DEFAULT_RESCAN_INTERVAL, SpoolWorker, write_atomic
+from src.core.mcp_stdio import StdioServer
+from src.core.scheduler import FairScheduler, SchedulingPolicy
 
 # Configuração do logger
 logger = get_logger(__name__)
@@ -39,12 +51,14 @@ class Response:
 
 # ----- Funções utilitárias compartilhadas -----
 
-def get_orchestrator(model_name: Optional[str] = None) -> AgentOrchestrator:
+def get_orchestrator(model_name: Optional[str] = None, write_behind: Optional[bool] = None) -> AgentOrchestrator:
     """
     Obtém uma instância configurada do orquestrador de agentes.
     
     Args:
         model_name: Nome do modelo a ser usado (opcional)
+        write_behind: Se os registros de execução são gravados em segundo plano
+                      (padrão: database.write_behind do kernel.yaml)
     
     Returns:
         AgentOrchestrator configurado
@@ -52,7 +66,7 @@ def get_orchestrator(model_name: Optional[str] = None) -> AgentOrchestrator:
     try:
         # Inicializa componentes
         model_manager = ModelManager(model_name=model_name)
-        db = DatabaseManager()
+        db = DatabaseManager(write_behind=write_behind)
         
         # Cria e configura orquestrador - apenas nome do modelo como parâmetro
         orchestrator = AgentOrchestrator(model_manager.model_name)
@@ -61,6 +75,9 @@ def get_orchestrator(model_name: Optional[str] = None) -> AgentOrchestrator:
         # Define o db como atributo separado
         orchestrator.db = db
         
+        # Aquece os modelos em segundo plano; a execução aguarda apenas o modelo que usar
+        model_manager.warm_up()
+        
         logger.info(f"Orquestrador inicializado com sucesso usando modelo {model_manager.model_name}")
         return orchestrator
         
@@ -80,6 +97,7 @@ def run_cli_mode(args):
     Returns:
         Código de saída (0 para sucesso, 1 para erro)
     """
+    orchestrator = None
     try:
         # Imprime o cabeçalho
         print("🖥️ CLI do projeto prompt-tdd")
@@ -100,13 +118,13 @@ def run_cli_mode(args):
         if result.output:
             print("\n" + result.output)
             
-        # Registra a execução no banco
-        db = DatabaseManager()
-        db.log_run(
+        # Registra a execução pelo banco do orquestrador (mesmo gravador de serve e worker)
+        orchestrator.db.log_run(
             args.session_id if hasattr(args, 'session_id') else str(uuid.uuid4()),
             input=args.prompt,
             final_output=result.output,
-            output_type=args.format
+            output_type=args.format,
+            stages=result.raw_responses
         )
             
         return 0
@@ -115,6 +133,10 @@ def run_cli_mode(args):
         logger.error(error_msg)
         print(error_msg, file=sys.stderr)
         return 1
+    finally:
+        # Grava os registros pendentes e fecha as conexões
+        if orchestrator is not None:
+            orchestrator.db.close()
 
 # ----- Funcionalidade MCP -----
 
@@ -136,6 +158,8 @@ class MCPHandler:
         self.orchestrator.model_manager = self.model_manager
         # Define o db como atributo separado
         self.orchestrator.db = self.db
+        # Aquece os modelos em segundo plano
+        self.model_manager.warm_up()
         logger.info(f"MCPHandler inicializado com modelo {self.model_manager.model_name}")
         
     def process_message(self, message: Message) -> Response:
@@ -149,17 +173,20 @@ class MCPHandler:
             Resposta processada
         """
         try:
+            # O formato pode vir em metadata.format ou em metadata.options.format
+            metadata = message.metadata or {}
+            format = metadata.get("format") or (metadata.get("options") or {}).get("format") or "json"
+            
             # Executa o orquestrador
             result = self.orchestrator.execute(
                 prompt=message.content,
-                format=message.metadata.get("format", "json")
+                format=format
             )
             
             return Response(
                 content=result.output,
                 metadata={
                     "status": "success",
-                    "items": len(result.items),
                     "guardrails": len(result.guardrails),
                     "raw_responses": len(result.raw_responses)
                 }
@@ -172,24 +199,23 @@ class MCPHandler:
                 metadata={"status": "error"}
             )
             
-    def handle_message(self, message: Message) -> None:
+    def handle_message(self, message: Message, output_file: str = "logs/mcp_output.log") -> None:
         """
         Manipula uma mensagem MCP.
         
         Args:
             message: Mensagem a ser manipulada
+            output_file: Arquivo de resposta (gravado de forma atômica)
         """
         try:
             # Processa a mensagem
             response = self.process_message(message)
             
             # Salva resposta no arquivo de saída
-            output_file = "logs/mcp_output.log"
-            with open(output_file, "w") as f:
-                json.dump({
-                    "content": response.content,
-                    "metadata": response.metadata
-                }, f, indent=2)
+            write_atomic(output_file, json.dumps({
+                "content": response.content,
+                "metadata": response.metadata
+            }, indent=2))
                 
             logger.info(f"Resposta salva em: {output_file}")
             
@@ -197,12 +223,30 @@ class MCPHandler:
             logger.error(f"Erro ao manipular mensagem: {str(e)}")
             
             # Salva erro no arquivo de saída
-            output_file = "logs/mcp_output.log"
-            with open(output_file, "w") as f:
-                json.dump({
-                    "content": {"error": str(e)},
-                    "metadata": {"status": "error"}
-                }, f, indent=2)
+            write_atomic(output_file, json.dumps({
+                "content": {"error": str(e)},
+                "metadata": {"status": "error"}
+            }, indent=2))
+
+    @staticmethod
+    def parse_message(content: str) -> Message:
+        """
+        Converte o conteúdo de um arquivo de mensagem (JSON ou texto puro).
+        
+        Args:
+            content: Conteúdo lido
+            
+        Returns:
+            Mensagem MCP
+        """
+        try:
+            message_data = json.loads(content)
+            return Message(
+                content=message_data["content"],
+                metadata=message_data.get("metadata", {})
+            )
+        except json.JSONDecodeError:
+            return Message(content=content, metadata={})
 
     def run(self):
         """Executa o manipulador MCP."""
@@ -218,18 +262,8 @@ class MCPHandler:
                 logger.warning("Arquivo vazio")
                 return
                 
-            # Processa o conteúdo
-            try:
-                message_data = json.loads(content)
-                message = Message(
-                    content=message_data["content"],
-                    metadata=message_data.get("metadata", {})
-                )
-            except json.JSONDecodeError:
-                message = Message(content=content, metadata={})
-            
             # Processa a mensagem
-            self.handle_message(message)
+            self.handle_message(self.parse_message(content))
             
             # Remove o arquivo após processamento
             os.remove(pipe_file)
@@ -239,11 +273,385 @@ class MCPHandler:
             logger.error(f"Erro ao executar MCP: {str(e)}")
             raise
 
+def thread_local_handler(model_name: Optional[str] = None) -> Callable[[], MCPHandler]:
+    """
+    Cria uma função que retorna o MCPHandler da thread atual (criado no primeiro uso).
+    
+    O orquestrador e as conexões SQLite não são compartilhados entre threads, então
+    cada thread dos pools do MCP mantém seu próprio handler aquecido.
+    
+    Args:
+        model_name: Nome do modelo a ser usado (opcional)
+    
+    Returns:
+        Função sem argumentos que retorna o handler
+    """
+    local = threading.local()
+    
+    def get_handler() -> MCPHandler:
+        if not hasattr(local, "handler"):
+            local.handler = MCPHandler(model_name=model_name)
+        return local.handler
+    
+    return get_handler
+
 def run_mcp_mode():
     """Executa o sistema no modo MCP."""
     handler = MCPHandler()
     handler.run()
 
+def run_mcp_stdio_mode(args) -> int:
+    """
+    Executa o modo MCP persistente sobre stdin/stdout (JSON-RPC por linha).
+    
+    Args:
+        args: Argumentos da linha de comando
+    
+    Returns:
+        Código de saída
+    """
+    get_handler = thread_local_handler(args.model)
+    
+    def process(message: Dict[str, Any]) -> Dict[str, Any]:
+        response = get_handler().process_message(Message(content=message["content"], metadata=message["metadata"]))
+        return {"content": response.content, "metadata": response.metadata}
+    
+    scheduler = FairScheduler(SchedulingPolicy.from_config(CONFIG.get('scheduler')), slots=args.workers)
+    return StdioServer(process, workers=args.workers, warm_up=get_handler, scheduler=scheduler).serve()
+
+def run_mcp_spool_mode(args) -> int:
+    """
+    Executa o worker MCP que processa as mensagens de um diretório de spool.
+    
+    Args:
+        args: Argumentos da linha de comando
+    
+    Returns:
+        Código de saída
+    """
+    get_handler = thread_local_handler(args.model)
+    
+    def handle(input_path: str, output_path: str) -> None:
+        with open(input_path, "r", encoding="utf-8") as f:
+            content = f.read().strip()
+        get_handler().handle_message(MCPHandler.parse_message(content), output_file=output_path)
+    
+    return SpoolWorker(
+        args.spool,
+        handle,
+        workers=args.workers,
+        warm_up=get_handler,
+        rescan_interval=CONFIG.get('mcp', {}).get('rescan_interval', DEFAULT_RESCAN_INTERVAL),
+        scheduler=FairScheduler(SchedulingPolicy.from_config(CONFIG.get('scheduler')), slots=args.workers)
+    ).serve()
+
+# ----- Prontidão dos modelos -----
+
+def run_ready_mode(args) -> int:
+    """
+    Aquece os modelos configurados e exibe o estado de prontidão.
+    
+    Args:
+        args: Argumentos da linha de comando
+    
+    Returns:
+        Código de saída (0 se todos os modelos estão prontos, 1 caso contrário)
+    """
+    model_manager = ModelManager(model_name=args.model)
+    model_manager.warm_up(background=False)
+    readiness = model_manager.get_readiness()
+    
+    for model_name, state in readiness["models"].items():
+        icon = "✅" if state["state"] == "ready" else "❌"
+        elapsed = f" [{state['elapsed_ms']:.0f}ms]" if state.get("elapsed_ms") is not None else ""
+        detail = f" - {state['error']}" if state.get("error") else ""
+        print(f"{icon} {model_name} ({state['provider']}): {state['state']}{elapsed}{detail}")
+        
+    return 0 if readiness["ready"] else 1
+
+# ----- Fila de jobs -----
+
+JOB_ICONS = {QUEUED: "⏳", RUNNING: "⚙️", SUCCEEDED: "✅", FAILED: "❌"}
+
+def run_submit_mode(args) -> int:
+    """
+    Enfileira um prompt para execução em segundo plano pelos workers.
+    
+    Args:
+        args: Argumentos da linha de comando
+    
+    Returns:
+        Código de saída (com --wait, 1 se o job falhar)
+    """
+    queue = JobQueue.from_config(CONFIG.get('jobs'))
+    job = queue.submit(
+        args.prompt,
+        format=args.format,
+        session_id=args.session_id,
+        model=args.model,
+        idempotency_key=args.idempotency_key,
+        max_attempts=args.max_attempts
+    )
+    print(job.id)
+    if not args.wait:
+        return 0
+    
+    poll_interval = CONFIG.get('jobs', {}).get('poll_interval', 1.0)
+    while job.status not in FINAL_STATES:
+        time.sleep(poll_interval)
+        job = queue.get(job.id)
+    return print_job(job)
+
+def print_job(job: Job, as_json: bool = False) -> int:
+    """
+    Exibe um job e, se concluído, sua saída.
+    
+    Returns:
+        Código de saída (1 se o job falhou)
+    """
+    if as_json:
+        print(json.dumps(job.to_dict(), indent=2, ensure_ascii=False, default=str))
+    else:
+        attempts = f"tentativa {job.attempts}/{job.max_attempts}"
+        print(f"{JOB_ICONS.get(job.status, '')} {job.id}: {job.status} [{attempts}]")
+        if job.error:
+            print(f"   Erro: {job.error}")
+        if job.result and job.result.get("output"):
+            print("\n" + str(job.result["output"]))
+    return 1 if job.status == FAILED else 0
+
+def run_status_mode(args) -> int:
+    """
+    Exibe o estado de um job ou lista os jobs recentes.
+    
+    Args:
+        args: Argumentos da linha de comando
+    
+    Returns:
+        Código de saída
+    """
+    queue = JobQueue.from_config(CONFIG.get('jobs'))
+    if args.job_id:
+        job = queue.get(args.job_id)
+        if job is None:
+            print(f"❌ Job não encontrado: {args.job_id}", file=sys.stderr)
+            return 1
+        return print_job(job, as_json=args.json)
+    
+    jobs = queue.list(limit=args.limit)
+    if args.json:
+        print(json.dumps([job.to_dict() for job in jobs], indent=2, ensure_ascii=False, default=str))
+        return 0
+    
+    counts = queue.counts()
+    table = Table(title="Jobs " + " | ".join(f"{status}: {counts.get(status, 0)}" for status in JOB_ICONS))
+    for column in ("ID", "Estado", "Tentativas", "Sessão", "Prompt", "Criado em"):
+        table.add_column(column)
+    for job in jobs:
+        table.add_row(job.id[:12], f"{JOB_ICONS.get(job.status, '')} {job.status}",
+                      f"{job.attempts}/{job.max_attempts}", job.session_id, job.prompt[:40],
+                      datetime.fromtimestamp(job.created_at).strftime("%Y-%m-%d %H:%M:%S"))
+    console.print(table)
+    return 0
+
+def run_worker_mode(args) -> int:
+    """
+    Executa o pool de processos que consome a fila de jobs.
+    
+    Args:
+        args: Argumentos da linha de comando
+    
+    Returns:
+        Código de saída
+    """
+    config = CONFIG.get('jobs', {})
+    processes = args.processes or config.get('processes', 1)
+    console.print(f"👷 Iniciando {processes} worker(s) de jobs [{config.get('db_path', 'logs/jobs.db')}]")
+    # Processos de longa duração: registros gravados em lote pela thread de write-behind
+    factory = functools.partial(get_orchestrator, write_behind=True)
+    return run_worker_pool(config, factory, processes=processes, default_model=args.model,
+                           poll_interval=config.get('poll_interval', 1.0))
+
+# ----- Inspeção de modelos locais -----
+
+def format_size(size: int) -> str:
+    """Formata um tamanho em bytes para exibição."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+        size /= 1024
+
+def run_models_mode(args) -> int:
+    """
+    Lista os modelos locais a partir do índice de cabeçalhos GGUF, sem carregá-los.
+    
+    Args:
+        args: Argumentos da linha de comando
+    
+    Returns:
+        Código de saída
+    """
+    index = ModelDownloader.get_gguf_index()
+    entries = index.scan()
+    
+    if args.json:
+        print(json.dumps(entries, indent=2, ensure_ascii=False))
+        return 0
+    
+    # Relaciona cada arquivo aos provedores que o utilizam
+    registry = ModelRegistry()
+    providers_by_path = {}
+    for provider in registry.providers:
+        if provider.get('remote') is False:
+            for variant in ModelDownloader.get_variants(provider):
+                path = os.path.relpath(
+                    ModelDownloader.get_model_path(variant['file'], provider.get('dir', './models')),
+                    index.models_dir
+                )
+                label = f"{provider['name']} ({variant['quant']})" if variant['quant'] else provider['name']
+                providers_by_path.setdefault(path, []).append(label)
+    
+    table = Table(title=f"Modelos locais ({index.models_dir})")
+    table.add_column("Arquivo", style="cyan")
+    table.add_column("Provedores")
+    table.add_column("Arquitetura")
+    table.add_column("Quantização")
+    table.add_column("Parâmetros", justify="right")
+    table.add_column("Contexto", justify="right")
+    table.add_column("Tamanho", justify="right")
+    
+    for entry in entries:
+        info = entry.get("info") or {}
+        table.add_row(
+            entry["path"],
+            ", ".join(providers_by_path.get(entry["path"], [])) or "-",
+            info.get("architecture") or f"[red]{entry.get('error')}[/red]",
+            info.get("quantization") or "-",
+            f"{info['parameters'] / 1e9:.2f}B" if info.get("parameters") else "-",
+            str(info.get("context_length") or "-"),
+            format_size(entry["size"])
+        )
+    console.print(table)
+    
+    indexed = {entry["path"] for entry in entries}
+    missing = sorted(
+        provider['name'] for provider in registry.providers
+        if provider.get('remote') is False and not any(
+            os.path.relpath(ModelDownloader.get_model_path(variant['file'], provider.get('dir', './models')),
+                            index.models_dir) in indexed
+            for variant in ModelDownloader.get_variants(provider)
+        )
+    )
+    if missing:
+        console.print(f"⚠️ Provedores sem arquivo local: {', '.join(missing)}")
+    return 0
+
+# ----- Ajuste de threads/lote por host -----
+
+def parse_int_list(value: Optional[str]) -> Optional[list]:
+    """Converte uma lista separada por vírgulas em inteiros."""
+    return [int(item) for item in value.split(",") if item.strip()] if value else None
+
+def run_tune_mode(args) -> int:
+    """
+    Mede cada modelo local em diferentes threads/lotes e grava o perfil do host.
+    
+    Args:
+        args: Argumentos da linha de comando
+    
+    Returns:
+        Código de saída (1 se nenhum modelo pôde ser ajustado)
+    """
+    config = load_config()
+    registry = ModelRegistry()
+    providers = [
+        provider for provider in registry.providers
+        if provider.get('remote') is False and (not args.provider or provider['name'] in args.provider)
+    ]
+    
+    # Mantém os ajustes de provedores não avaliados nesta execução
+    previous = load_host_profile(config) or {}
+    profile = new_host_profile()
+    profile['providers'] = dict(previous.get('providers') or {})
+    console.print(f"⚙️ Ajustando modelos locais em {profile['host']} [CPUs disponíveis: {profile['cpu']['limit']}]")
+    
+    table = Table(title=f"Perfil de ajuste - {profile['host']}")
+    for column in ("Provedor", "Variante", "n_threads", "n_threads_batch", "n_batch", "Prompt (tok/s)", "Geração (tok/s)"):
+        table.add_column(column, justify="left" if column in ("Provedor", "Variante") else "right")
+    
+    tuned = 0
+    for provider in providers:
+        model_file = ModelDownloader.get_provider_model_path(provider)
+        if not os.path.exists(model_file):
+            console.print(f"⚠️ {provider['name']}: arquivo não encontrado ({model_file})")
+            continue
+        
+        console.print(f"🏁 {provider['name']}: {os.path.basename(model_file)}")
+        try:
+            result = tune_model(
+                model_file,
+                config.get('tuning'),
+                threads=parse_int_list(args.threads),
+                batch_sizes=parse_int_list(args.batch_sizes),
+                on_result=lambda r: console.print(
+                    f"   threads={r['n_threads']} lote={r['n_batch']}: "
+                    f"prompt {r['prompt_tps']:.1f} tok/s, geração {r['generation_tps']:.1f} tok/s"
+                )
+            )
+        except Exception as e:
+            console.print(f"❌ {provider['name']}: {str(e)}")
+            logger.error(f"Falha ao ajustar {provider['name']}: {str(e)}")
+            continue
+        
+        result.pop('measurements')
+        profile['providers'][provider['name']] = dict(model_file=os.path.basename(model_file), **result)
+        table.add_row(provider['name'], os.path.basename(model_file), str(result['n_threads']),
+                      str(result['n_threads_batch']), str(result['n_batch']),
+                      f"{result['prompt_tps']:.1f}", f"{result['generation_tps']:.1f}")
+        tuned += 1
+    
+    if not tuned:
+        console.print("❌ Nenhum modelo local disponível para ajuste")
+        return 1
+    
+    console.print(table)
+    path = save_host_profile(config, profile)
+    console.print(f"✅ Perfil gravado em {path}")
+    return 0
+
+# ----- Servidor HTTP -----
+
+def run_serve_mode(args) -> int:
+    """
+    Executa a API HTTP com orquestradores aquecidos até receber SIGTERM/SIGINT.
+    
+    Args:
+        args: Argumentos da linha de comando
+    
+    Returns:
+        Código de saída
+    """
+    settings = ServerSettings.from_config(CONFIG.get('server'), {
+        "host": args.host,
+        "port": args.port,
+        "concurrency": args.concurrency
+    })
+    policy = SchedulingPolicy.from_config(CONFIG.get('scheduler'))
+    console.print(f"🌐 Servidor HTTP em http://{settings.host}:{settings.port} "
+                  f"[concorrência: {settings.concurrency}, classes: {', '.join(policy.classes)}]")
+    try:
+        factory = functools.partial(get_orchestrator, write_behind=True)
+        # Apenas modelos configurados: nomes de provedor e de modelo do kernel.yaml
+        registry = ModelRegistry()
+        models = set(registry.list_providers()) | set(registry.list_all_models())
+        models.update(p['model'] for p in registry.providers if p.get('model'))
+        run_server(settings, factory, default_model=args.model, policy=policy, models=models)
+    except OSError as e:
+        logger.error(f"Falha ao iniciar servidor HTTP: {str(e)}")
+        print(f"❌ Falha ao iniciar servidor HTTP: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
 # ----- Função principal -----
 
 def main():
@@ -264,6 +672,55 @@ def main():
     
     # Subparser para o modo mcp
     mcp_parser = subparsers.add_parser("mcp", help="Executa no modo MCP")
+    mcp_parser.add_argument("--stdio", action="store_true",
+                            help="Processo persistente com JSON-RPC por linha em stdin/stdout")
+    mcp_parser.add_argument("--spool", nargs="?", const=CONFIG.get('mcp', {}).get('spool_dir', "logs/mcp_spool"),
+                            help="Worker persistente que processa as mensagens de um diretório de spool")
+    mcp_parser.add_argument("--workers", type=int, default=CONFIG.get('mcp', {}).get('workers', 2),
+                            help="Mensagens processadas simultaneamente (--stdio/--spool)")
+    mcp_parser.add_argument("--model", help="Nome do modelo a ser usado")
+    
+    # Subparser para o modo ready
+    ready_parser = subparsers.add_parser("ready", help="Aquece os modelos e exibe o estado de prontidão")
+    ready_parser.add_argument("--model", help="Nome do modelo principal")
+    
+    # Subparser para o modo submit
+    submit_parser = subparsers.add_parser("submit", help="Enfileira um prompt para execução em segundo plano")
+    submit_parser.add_argument("prompt", help="Prompt para o agente")
+    submit_parser.add_argument("--format", default="json", choices=["json", "markdown", "text"], help="Formato de saída")
+    submit_parser.add_argument("--session-id", default="jobs", help="ID da sessão")
+    submit_parser.add_argument("--model", help="Nome do modelo (padrão: modelo do worker)")
+    submit_parser.add_argument("--idempotency-key", help="Chave de idempotência; reenvios retornam o mesmo job")
+    submit_parser.add_argument("--max-attempts", type=int, help="Tentativas em caso de falha (padrão: kernel.yaml)")
+    submit_parser.add_argument("--wait", action="store_true", help="Aguarda a conclusão e exibe a saída")
+    
+    # Subparser para o modo status
+    status_parser = subparsers.add_parser("status", help="Exibe o estado e a saída de um job (sem ID, lista os recentes)")
+    status_parser.add_argument("job_id", nargs="?", help="ID (ou prefixo) de um job enviado com submit")
+    status_parser.add_argument("--limit", type=int, default=20, help="Quantidade de jobs listados")
+    status_parser.add_argument("--json", action="store_true", help="Exibe o job em JSON")
+    
+    # Subparser para o modo worker
+    worker_parser = subparsers.add_parser("worker", help="Executa o pool de processos que consome a fila de jobs")
+    worker_parser.add_argument("--processes", type=int, help="Número de processos (padrão: kernel.yaml)")
+    worker_parser.add_argument("--model", help="Modelo dos jobs que não informam um")
+    
+    # Subparser para o modo models
+    models_parser = subparsers.add_parser("models", help="Lista os modelos locais e seus metadados GGUF")
+    models_parser.add_argument("--json", action="store_true", help="Exibe o índice em JSON")
+    
+    # Subparser para o modo tune
+    tune_parser = subparsers.add_parser("tune", help="Ajusta n_threads/n_batch dos modelos locais para este host")
+    tune_parser.add_argument("--provider", action="append", help="Provedor local a ajustar (pode repetir; padrão: todos)")
+    tune_parser.add_argument("--threads", help="Números de threads a avaliar, separados por vírgula (padrão: automático)")
+    tune_parser.add_argument("--batch-sizes", help="Tamanhos de lote a avaliar, separados por vírgula (padrão: kernel.yaml)")
+    
+    # Subparser para o modo serve
+    serve_parser = subparsers.add_parser("serve", help="Executa a API HTTP com orquestradores aquecidos")
+    serve_parser.add_argument("--host", help="Endereço de escuta (padrão: kernel.yaml)")
+    serve_parser.add_argument("--port", type=int, help="Porta (padrão: kernel.yaml)")
+    serve_parser.add_argument("--concurrency", type=int, help="Execuções simultâneas (padrão: kernel.yaml)")
+    serve_parser.add_argument("--model", help="Modelo padrão das requisições")
     
     args = parser.parse_args()
     
@@ -276,8 +733,26 @@ def main():
     if args.mode == "cli":
         return run_cli_mode(args)
     elif args.mode == "mcp":
+        if args.stdio:
+            return run_mcp_stdio_mode(args)
+        if args.spool:
+            return run_mcp_spool_mode(args)
         run_mcp_mode()
         return 0
+    elif args.mode == "ready":
+        return run_ready_mode(args)
+    elif args.mode == "models":
+        return run_models_mode(args)
+    elif args.mode == "tune":
+        return run_tune_mode(args)
+    elif args.mode == "serve":
+        return run_serve_mode(args)
+    elif args.mode == "submit":
+        return run_submit_mode(args)
+    elif args.mode == "worker":
+        return run_worker_mode(args)
+    elif args.mode == "status":
+        return run_status_mode(args)
     
     return 0
 
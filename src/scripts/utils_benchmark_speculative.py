@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Script de benchmark da decodificação especulativa para modelos locais.
+Compara tokens/s de um provedor local com e sem o modo especulativo.
+"""
+import argparse
+import time
+from typing import Any, Dict, List, Optional
+
+from rich.console import Console
+from rich.table import Table
+
+from src.core.logger import get_logger
+from src.core.models import ModelDownloader, ModelRegistry
+from src.core.speculative import LlamaDraftModelDecoding, build_draft_model, get_speculative_config
+
+logger = get_logger(__name__)
+console = Console()
+
+# Prompt padrão no estilo dos guardrails TDD: repete trechos da entrada, caso típico do prompt lookup
+DEFAULT_PROMPT = (
+    "Sistema de cadastro de pessoas com nome, e-mail, CPF e data de nascimento.\n"
+    "title: Cadastro de pessoas\n"
+    "description: Sistema de cadastro de pessoas com nome, e-mail, CPF e data de nascimento.\n"
+    "Com base nas informações extraídas (título, descrição, campos), gere um prompt no estilo TDD "
+    "com critérios de aceite no formato BDD, repetindo os nomes dos campos exatamente como informados."
+)
+
+def load_target(provider: Dict[str, Any], draft=None):
+    """
+    Carrega o modelo alvo, opcionalmente com um modelo de rascunho.
+
+    Args:
+        provider: Configuração do provedor local
+        draft: TrackingDraftModel (opcional)
+
+    Returns:
+        Instância Llama
+    """
+    from llama_cpp import Llama
+
+    model_file = ModelDownloader.get_provider_model_path(provider)
+    params = {"draft_model": draft} if draft else {}
+    model = Llama(
+        model_path=model_file,
+        n_ctx=provider.get('n_ctx', 2048),
+        n_threads=provider.get('n_threads', 4),
+        verbose=False,
+        **params
+    )
+    if draft and isinstance(draft.proposer, LlamaDraftModelDecoding):
+        draft.proposer.bind_target(model)
+    return model
+
+def run_benchmark(model, prompt: str, runs: int, max_tokens: int, draft=None) -> Dict[str, Any]:
+    """
+    Executa gerações determinísticas e mede o throughput.
+
+    Args:
+        model: Instância Llama
+        prompt: Prompt de entrada
+        runs: Número de execuções
+        max_tokens: Máximo de tokens por geração
+        draft: TrackingDraftModel (opcional) para estatísticas de aceitação
+
+    Returns:
+        Dict com tokens gerados, tempo total, tokens/s e estatísticas especulativas
+    """
+    total_tokens = 0
+    total_seconds = 0.0
+    draft_before = draft.snapshot() if draft else None
+
+    for run in range(runs):
+        # Reinicia o estado para não medir reaproveitamento do cache de KV entre execuções
+        model.reset()
+        start = time.perf_counter()
+        response = model(prompt, max_tokens=max_tokens, temperature=0.0)
+        elapsed = time.perf_counter() - start
+        tokens = response["usage"]["completion_tokens"]
+        total_tokens += tokens
+        total_seconds += elapsed
+        logger.debug(f"Execução {run + 1}: {tokens} tokens em {elapsed:.2f}s")
+
+    result = {
+        "tokens": total_tokens,
+        "seconds": total_seconds,
+        "tokens_per_second": total_tokens / total_seconds if total_seconds else 0.0
+    }
+    if draft:
+        result["speculative"] = draft.stats_since(draft_before)
+    return result
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Função principal."""
+    parser = argparse.ArgumentParser(description="Benchmark de decodificação especulativa")
+    parser.add_argument("--provider", default="deepseek-local-coder", help="Provedor local a ser avaliado")
+    parser.add_argument("--mode", choices=["prompt_lookup", "draft_model"],
+                        help="Modo especulativo (padrão: kernel.yaml)")
+    parser.add_argument("--draft-provider", help="Provedor do modelo de rascunho (modo draft_model)")
+    parser.add_argument("--num-pred-tokens", type=int, help="Tokens propostos por passo")
+    parser.add_argument("--runs", type=int, default=3, help="Número de execuções por configuração")
+    parser.add_argument("--max-tokens", type=int, default=256, help="Máximo de tokens por geração")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="Prompt usado no benchmark")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry()
+    provider = registry.get_provider_config(args.provider)
+    if not provider or provider.get('remote') is not False:
+        console.print(f"[red]Provedor local não encontrado: {args.provider}[/red]")
+        return 1
+
+    # Força o modo especulativo com as sobreposições da linha de comando
+    spec_provider = dict(provider)
+    spec_provider['speculative'] = dict(provider.get('speculative') or {}, enabled=True)
+    overrides = (
+        ("mode", args.mode),
+        ("draft_provider", args.draft_provider),
+        ("num_pred_tokens", args.num_pred_tokens),
+    )
+    for key, value in overrides:
+        if value is not None:
+            spec_provider['speculative'][key] = value
+    spec_config = get_speculative_config(spec_provider)
+
+    def load_draft(provider_name: str, n_ctx: int):
+        from llama_cpp import Llama
+        draft_provider = registry.get_provider_config(provider_name)
+        return Llama(
+            model_path=ModelDownloader.get_provider_model_path(draft_provider),
+            n_ctx=n_ctx,
+            n_threads=draft_provider.get('n_threads', 4),
+            verbose=False
+        )
+
+    console.print(f"🏁 Benchmark de {args.provider} [modo={spec_config['mode']}, execuções={args.runs}]")
+
+    baseline_model = load_target(provider)
+    baseline = run_benchmark(baseline_model, args.prompt, args.runs, args.max_tokens)
+    del baseline_model
+
+    draft = build_draft_model(spec_config, load_draft)
+    speculative_model = load_target(provider, draft)
+    speculative = run_benchmark(speculative_model, args.prompt, args.runs, args.max_tokens, draft)
+
+    table = Table(title=f"Decodificação especulativa - {args.provider}")
+    table.add_column("Configuração", style="cyan")
+    table.add_column("Tokens", justify="right")
+    table.add_column("Tempo (s)", justify="right")
+    table.add_column("Tokens/s", justify="right", style="green")
+    table.add_column("Aceitação", justify="right")
+    table.add_row("desligado", str(baseline["tokens"]), f"{baseline['seconds']:.2f}",
+                  f"{baseline['tokens_per_second']:.2f}", "N/A")
+    stats = speculative["speculative"]
+    table.add_row(stats["mode"], str(speculative["tokens"]), f"{speculative['seconds']:.2f}",
+                  f"{speculative['tokens_per_second']:.2f}",
+                  f"{stats['acceptance_rate']:.1%} ({stats['accepted_tokens']}/{stats['drafted_tokens']})")
+    console.print(table)
+
+    if baseline["tokens_per_second"]:
+        console.print(f"⚡ Speedup: {speculative['tokens_per_second'] / baseline['tokens_per_second']:.2f}x")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Manutenção do banco de logs: backup online, limpeza pela política de retenção e partições.
+"""
+import argparse
+import os
+from typing import List, Optional
+
+from rich.console import Console
+from rich.table import Table
+
+from src.core.db import DatabaseManager, get_database_config, partition_name, partition_range
+
+console = Console()
+
+def _file_size(path: str) -> int:
+    """Tamanho do banco somado ao do WAL (bytes)."""
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+def _total_size(db: DatabaseManager) -> int:
+    """Tamanho do banco principal e de todas as partições (bytes)."""
+    return sum(_file_size(db.partition_path(partition)) for partition in db.partitions())
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def run_backup(db: DatabaseManager, output: Optional[str]) -> int:
+    """
+    Cria um backup consistente do banco, sem interromper as gravações.
+
+    Args:
+        db: Gerenciador do banco
+        output: Arquivo de destino (opcional)
+
+    Returns:
+        Código de saída
+    """
+    path = db.backup(output)
+    console.print(f"✅ Backup criado em {path} ({_format_size(_file_size(path))})")
+    return 0
+
+def run_prune(db: DatabaseManager, tables: List[str], max_age_days: Optional[int],
+              max_rows: Optional[int], full_vacuum: bool) -> int:
+    """
+    Remove os registros fora da política de retenção e libera o espaço em disco.
+
+    Args:
+        db: Gerenciador do banco
+        tables: Tabelas limpas (padrão: as da política configurada)
+        max_age_days: Idade máxima em dias, no lugar da configurada (opcional)
+        max_rows: Máximo de registros, no lugar do configurado (opcional)
+        full_vacuum: Se executa VACUUM completo (bloqueia gravações)
+
+    Returns:
+        Código de saída
+    """
+    policies = dict((db.config.get('retention') or {}).get('tables') or {})
+    for table in tables:
+        policies.setdefault(table, {})
+    if tables:
+        policies = {table: policies[table] for table in tables}
+    if max_age_days is not None or max_rows is not None:
+        overrides = {"max_age_days": max_age_days, "max_rows": max_rows}
+        policies = {table: {**(policy or {}), **{k: v for k, v in overrides.items() if v is not None}}
+                    for table, policy in policies.items()}
+
+    size_before = _total_size(db)
+    removed = db.prune(policies)
+    if full_vacuum:
+        db.vacuum()
+        freed = None
+    else:
+        freed = db.incremental_vacuum()
+
+    table = Table(title="Retenção do banco de logs")
+    table.add_column("Tabela", style="cyan")
+    table.add_column("Idade máx. (dias)", justify="right")
+    table.add_column("Máx. registros", justify="right")
+    table.add_column("Removidos", justify="right", style="green")
+    for name, policy in policies.items():
+        policy = policy or {}
+        table.add_row(name, str(policy.get('max_age_days', "-")), str(policy.get('max_rows', "-")),
+                      str(removed.get(name, 0)))
+    console.print(table)
+    if freed is not None:
+        console.print(f"Páginas liberadas (incremental_vacuum): {freed}")
+    console.print(f"Tamanho: {_format_size(size_before)} → {_format_size(_total_size(db))}")
+    return 0
+
+def run_partitions(db: DatabaseManager) -> int:
+    """
+    Lista o banco principal e as partições, com período, tamanho e execuções.
+
+    Args:
+        db: Gerenciador do banco
+
+    Returns:
+        Código de saída
+    """
+    table = Table(title=f"Partições do banco de logs ({db.partitioning})")
+    table.add_column("Partição", style="cyan")
+    table.add_column("Início (UTC)")
+    table.add_column("Arquivo")
+    table.add_column("Tamanho", justify="right")
+    table.add_column("Execuções", justify="right", style="green")
+    for partition in db.partitions():
+        path = db.partition_path(partition)
+        name = partition_name(partition) if partition else "principal"
+        start = partition_range(partition)[0][:10] if partition else "-"
+        table.add_row(name, start, path, _format_size(_file_size(path)), str(db.count("runs", partition)))
+    console.print(table)
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Função principal."""
+    parser = argparse.ArgumentParser(description="Manutenção do banco de logs")
+    parser.add_argument("--db", help="Banco de dados (padrão: database.db_path do kernel.yaml)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = subparsers.add_parser("backup", help="Backup online (API de backup do SQLite)")
+    backup_parser.add_argument("--output", help="Arquivo de destino (padrão: backups/<nome>_<data>.db)")
+
+    subparsers.add_parser("partitions", help="Lista as partições do banco")
+
+    prune_parser = subparsers.add_parser("prune", help="Remove registros fora da política de retenção")
+    prune_parser.add_argument("--table", action="append", default=[],
+                              help="Tabela a limpar (repetível; padrão: as da política configurada)")
+    prune_parser.add_argument("--max-age-days", type=int, help="Idade máxima dos registros em dias")
+    prune_parser.add_argument("--max-rows", type=int, help="Máximo de registros por tabela")
+    prune_parser.add_argument("--full-vacuum", action="store_true",
+                              help="VACUUM completo ao final (bloqueia gravações; ativa o vacuum incremental "
+                                   "em bancos antigos)")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or get_database_config().get('db_path')
+    if db_path and not os.path.exists(db_path):
+        console.print(f"[red]❌ Banco de dados não encontrado: {db_path}[/red]")
+        return 1
+    db = DatabaseManager(db_path=db_path, write_behind=False, retention=False)
+    try:
+        if args.command == "backup":
+            return run_backup(db, args.output)
+        if args.command == "partitions":
+            return run_partitions(db)
+        return run_prune(db, args.table, args.max_age_days, args.max_rows, args.full_vacuum)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    raise SystemExit(main())
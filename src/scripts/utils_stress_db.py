@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Teste de carga do DatabaseManager.
+Executa log_run e consultas de histórico em várias threads (e processos) sobre o
+mesmo banco e verifica se todos os registros foram gravados, sem ids duplicados.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from rich.console import Console
+from rich.table import Table
+
+from src.core.db import DatabaseManager
+
+console = Console()
+
+# Etapas (telemetria) registradas por execução
+STAGES = 3
+
+def run_worker(db_path: str, threads: int, runs: int, readers: int, write_behind: bool) -> Dict[str, Any]:
+    """
+    Grava execuções em várias threads de um processo, com leitores simultâneos.
+
+    Args:
+        db_path: Caminho do banco
+        threads: Threads gravando
+        runs: Execuções registradas por thread
+        readers: Threads consultando o histórico durante a gravação
+        write_behind: Se usa a fila de gravação em segundo plano
+
+    Returns:
+        Dict com ids gerados, erros, consultas e tempo de gravação
+    """
+    db = DatabaseManager(db_path=db_path, write_behind=write_behind, retention=False)
+    run_ids: List[int] = []
+    errors: List[str] = []
+    queries = [0]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def write(index: int) -> None:
+        for n in range(runs):
+            try:
+                stages = [{"guardrail": f"guardrail_{g}", "stage": "input", "latency_ms": 50.0 * (g + 1) + n % 7,
+                           "model": "stress", "tokens": 100, "cached": n % 5 == 0} for g in range(STAGES)]
+                run_id = db.log_run(f"stress-{os.getpid()}-{index}", input=f"prompt {n}, thread {index}",
+                                    final_output='{"ok": true}', output_type="json", stages=stages)
+                db.log_run_item(run_id, "MessageOutput", {"n": n, "text": "a, b, c"})
+                db.log_guardrail_results(run_id, "output", {"passed": n % 10 != 0})
+                db.log_raw_response(run_id, {"text": f"resposta {n}"})
+                with lock:
+                    run_ids.append(run_id)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+    def read() -> None:
+        while not done.is_set():
+            try:
+                db.get_run_history(limit=20)
+                with lock:
+                    queries[0] += 1
+            except Exception as e:
+                with lock:
+                    errors.append(f"leitura {type(e).__name__}: {e}")
+
+    reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=write, args=(i,)) for i in range(threads)]
+    for thread in reader_threads:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    db.flush()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+    db.close()
+    return {"run_ids": run_ids, "errors": errors, "queries": queries[0], "seconds": elapsed}
+
+def _process_entry(args) -> Dict[str, Any]:
+    return run_worker(*args)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Função principal."""
+    parser = argparse.ArgumentParser(description="Teste de carga do banco de logs")
+    parser.add_argument("--db", help="Banco usado no teste (padrão: arquivo temporário)")
+    parser.add_argument("--processes", type=int, default=2, help="Processos gravando no mesmo banco")
+    parser.add_argument("--threads", type=int, default=8, help="Threads gravando por processo")
+    parser.add_argument("--runs", type=int, default=200, help="Execuções registradas por thread")
+    parser.add_argument("--readers", type=int, default=2, help="Threads lendo o histórico por processo")
+    parser.add_argument("--sync", action="store_true", help="Desativa o write-behind")
+    args = parser.parse_args(argv)
+
+    tmp_dir = None
+    db_path = args.db
+    if not db_path:
+        tmp_dir = tempfile.TemporaryDirectory(prefix="stress-db-")
+        db_path = os.path.join(tmp_dir.name, "agent_logs.db")
+    # Cria o schema antes de iniciar os processos
+    DatabaseManager(db_path=db_path, write_behind=False, retention=False).close()
+
+    console.print(f"🏋️ Teste de carga em {db_path} (processos={args.processes}, threads={args.threads}, "
+                  f"execuções/thread={args.runs}, leitores={args.readers}, "
+                  f"write-behind={'não' if args.sync else 'sim'})")
+    worker_args = [(db_path, args.threads, args.runs, args.readers, not args.sync)] * args.processes
+    start = time.perf_counter()
+    if args.processes > 1:
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            results = pool.map(_process_entry, worker_args)
+    else:
+        results = [run_worker(*worker_args[0])]
+    elapsed = time.perf_counter() - start
+
+    expected = args.processes * args.threads * args.runs
+    run_ids = [run_id for result in results for run_id in result["run_ids"]]
+    errors = [error for result in results for error in result["errors"]]
+    db = DatabaseManager(db_path=db_path, write_behind=False, retention=False)
+    counts = {table: db.count(table) for table in ("runs", "run_items", "guardrail_results", "raw_responses",
+                                                   "run_stages")}
+    staged = sum(rollup.count for rollup in db.get_stage_rollups(group_by=[]))
+    db.close()
+
+    table = Table(title="Teste de carga do banco")
+    table.add_column("Métrica", style="cyan")
+    table.add_column("Valor", justify="right")
+    table.add_row("log_run esperados", str(expected))
+    table.add_row("ids retornados (únicos)", f"{len(run_ids)} ({len(set(run_ids))})")
+    for name, count in counts.items():
+        table.add_row(f"linhas em {name}", str(count))
+    table.add_row("etapas nos agregados", str(staged))
+    table.add_row("consultas de histórico", str(sum(result["queries"] for result in results)))
+    table.add_row("erros", str(len(errors)))
+    table.add_row("tempo (s)", f"{elapsed:.2f}")
+    table.add_row("log_run/s", f"{expected / elapsed:.0f}")
+    console.print(table)
+    for error in errors[:10]:
+        console.print(f"[red]{error}[/red]")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+    # log_run grava 1 item, 1 guardrail e 1 resposta; o teste acrescenta mais um de cada (2 respostas)
+    ok = (not errors and len(set(run_ids)) == expected and counts["runs"] == expected
+          and counts["run_items"] == 2 * expected and counts["guardrail_results"] == 2 * expected
+          and counts["raw_responses"] == 3 * expected and counts["run_stages"] == STAGES * expected
+          and staged == STAGES * expected)
+    console.print("✅ Todos os registros gravados" if ok else "[red]❌ Registros perdidos ou com erro[/red]")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,105 +2,197 @@
 Script para visualização dos logs do banco de dados.
 """
 import argparse
-from typing import Dict, Any, List
+import json
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, List
 
 from rich.console import Console
+from rich.markup import escape
 from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
 
-from src.core.db import DatabaseManager
+from src.core.db import SNIPPET_MARKERS, STAGE_ROLLUP_GROUPS, DatabaseManager, RunRecord, SearchHit, StageRollup
 from src.core.kernel import format_timestamp, format_json
 
 console = Console()
 
-def show_run_details(run: Dict[str, Any]) -> None:
+# Execuções por tabela (e por consulta) na listagem
+PAGE_SIZE = 50
+
+def _format_content(content: Any) -> str:
+    """Formata o conteúdo de um registro (JSON decodificado ou texto)."""
+    if isinstance(content, str):
+        return format_json(content)
+    return json.dumps(content, indent=2, ensure_ascii=False)
+
+def show_run_details(run: RunRecord) -> None:
     """Mostra detalhes de uma execução."""
     # Cabeçalho
     console.print(Panel(
-        f"[bold blue]Execução {run['id']}[/bold blue]\n"
-        f"Session: {run['session_id']}\n"
-        f"Timestamp: {format_timestamp(run['timestamp'])}\n"
-        f"Agente: {run['last_agent'] or 'N/A'}\n"
-        f"Tipo de Saída: {run['output_type'] or 'N/A'}"
+        f"[bold blue]Execução {run.id}[/bold blue]\n"
+        f"Session: {run.session_id}\n"
+        f"Timestamp: {format_timestamp(run.created_at)}\n"
+        f"Tipo de Saída: {run.format or 'N/A'}"
     ))
     
     # Input/Output
     console.print("\n[bold]Input:[/bold]")
-    console.print(run['input'])
-    if run['final_output']:
+    console.print(run.prompt)
+    if run.final_output:
         console.print("\n[bold]Output:[/bold]")
-        console.print(format_json(run['final_output']))
+        console.print(_format_content(run.final_output))
     
     # Itens gerados
-    if run['items']:
+    if run.items:
         table = Table(title="Itens Gerados")
         table.add_column("Tipo", style="cyan")
-        table.add_column("Origem", style="green")
-        table.add_column("Destino", style="green")
         table.add_column("Conteúdo")
         
-        for item in run['items']:
+        for item in run.items:
             table.add_row(
-                item['item_type'],
-                item['source_agent'] or "N/A",
-                item['target_agent'] or "N/A",
-                Text(format_json(item['raw_item'])[:100] + "...")
+                item.type,
+                Text(_format_content(item.content)[:100] + "...")
             )
         
         console.print("\n")
         console.print(table)
     
     # Guardrails
-    if run['guardrails']:
+    if run.guardrails:
         table = Table(title="Resultados de Guardrails")
         table.add_column("Tipo", style="cyan")
-        table.add_column("Resultados")
+        table.add_column("Passou")
+        table.add_column("Erro")
         
-        for guard in run['guardrails']:
+        for guard in run.guardrails:
             table.add_row(
-                guard['guardrail_type'],
-                Text(format_json(guard['results'])[:100] + "...")
+                guard.type,
+                "✅" if guard.passed else "❌",
+                Text(guard.error or "")
             )
         
         console.print("\n")
         console.print(table)
     
     # Respostas brutas
-    if run['raw_responses']:
+    if run.responses:
         table = Table(title="Respostas Brutas do LLM")
         table.add_column("ID", style="dim")
         table.add_column("Resposta")
         
-        for resp in run['raw_responses']:
+        for resp in run.responses:
+            table.add_row(
+                resp.response_id,
+                Text(_format_content(resp.content)[:100] + "...")
+            )
+        
+        console.print("\n")
+        console.print(table)
+    
+    # Telemetria por etapa
+    if run.stages:
+        table = Table(title="Etapas")
+        table.add_column("Etapa", style="cyan")
+        table.add_column("Guardrail")
+        table.add_column("Modelo", style="blue")
+        table.add_column("Latência (ms)", justify="right")
+        table.add_column("Tokens", justify="right")
+        table.add_column("Cache")
+        table.add_column("Erro")
+        
+        for stage in run.stages:
             table.add_row(
-                str(resp['id']),
-                Text(format_json(resp['response'])[:100] + "...")
+                stage.stage,
+                stage.guardrail,
+                stage.model or "-",
+                f"{stage.latency_ms:.1f}",
+                str(stage.tokens) if stage.tokens is not None else "-",
+                "✅" if stage.cached else "",
+                Text(stage.error or "")
             )
         
         console.print("\n")
         console.print(table)
 
-def show_run_list(runs: List[Dict[str, Any]]) -> None:
+def show_run_list(runs: List[RunRecord]) -> None:
     """Mostra lista resumida de execuções."""
     table = Table(title="Histórico de Execuções")
     table.add_column("ID", style="dim")
     table.add_column("Timestamp", style="cyan")
     table.add_column("Session", style="green")
-    table.add_column("Agente", style="blue")
+    table.add_column("Formato", style="blue")
     table.add_column("Items", justify="right")
     table.add_column("Guards", justify="right")
     table.add_column("Resps", justify="right")
     
     for run in runs:
         table.add_row(
-            str(run['id']),
-            format_timestamp(run['timestamp']),
-            run['session_id'][:8] + "...",
-            run['last_agent'] or "N/A",
-            str(len(run['items'])),
-            str(len(run['guardrails'])),
-            str(len(run['raw_responses']))
+            str(run.id),
+            format_timestamp(run.created_at),
+            run.session_id[:8] + "...",
+            run.format or "N/A",
+            str(len(run.items)),
+            str(len(run.guardrails)),
+            str(len(run.responses))
+        )
+    
+    console.print(table)
+
+def show_stage_rollups(rollups: List[StageRollup], group_by: List[str]) -> None:
+    """Mostra os agregados da telemetria por etapa."""
+    table = Table(title="Telemetria por Etapa")
+    titles = {"hour": "Hora (UTC)", "model": "Modelo", "guardrail": "Guardrail"}
+    for column in group_by:
+        table.add_column(titles[column], style="cyan")
+    for title in ("Etapas", "Erros", "Cache", "Tokens", "Média (ms)", "p50 (ms)", "p95 (ms)", "Máx. (ms)"):
+        table.add_column(title, justify="right")
+    
+    def ms(value):
+        return f"{value:.1f}" if value is not None else "-"
+    
+    for rollup in rollups:
+        keys = [getattr(rollup, column) or "-" for column in group_by]
+        table.add_row(
+            *keys,
+            str(rollup.count),
+            str(rollup.errors),
+            str(rollup.cache_hits),
+            str(rollup.tokens),
+            ms(rollup.latency_ms_avg),
+            ms(rollup.latency_ms_p50),
+            ms(rollup.latency_ms_p95),
+            ms(rollup.latency_ms_max)
+        )
+    
+    console.print(table)
+
+def _highlight(snippet: str) -> str:
+    """Converte os marcadores do trecho encontrado em destaque do rich."""
+    start, end = SNIPPET_MARKERS
+    text = escape(" ".join(snippet.split()))
+    return text.replace(start, "[bold yellow]").replace(end, "[/bold yellow]")
+
+def show_search_results(hits: List[SearchHit], query: str) -> None:
+    """Mostra os resultados da busca textual, em ordem de relevância."""
+    table = Table(title=f"Busca: {query}")
+    table.add_column("ID", style="dim")
+    table.add_column("Timestamp", style="cyan")
+    table.add_column("Session", style="green")
+    table.add_column("Origem", style="blue")
+    table.add_column("Score", justify="right")
+    table.add_column("Trecho")
+    
+    for hit in hits:
+        run = hit.run
+        table.add_row(
+            str(hit.run_id),
+            format_timestamp(run.created_at) if run else "",
+            run.session_id[:8] + "..." if run else "",
+            hit.source,
+            f"{-hit.score:.2f}",
+            _highlight(hit.snippet)
         )
     
     console.print(table)
@@ -108,37 +200,92 @@ def show_run_list(runs: List[Dict[str, Any]]) -> None:
 def main():
     """Função principal."""
     parser = argparse.ArgumentParser(description="Visualizador de logs do Agent Flow TDD")
-    parser.add_argument("--limit", type=int, default=10, help="Número máximo de registros")
-    parser.add_argument("--session", type=str, help="Filtrar por session ID")
-    parser.add_argument("--agent", type=str, help="Filtrar por agente")
+    parser.add_argument("--limit", type=int, default=10, help="Número máximo de registros (0 = todos, em páginas)")
+    parser.add_argument("--session", type=str, help="Filtrar por session ID (aceita * e ?)")
     parser.add_argument("--id", type=int, help="Mostrar detalhes de uma execução específica")
+    parser.add_argument("--output", type=str, help="Filtrar por formato de saída (ex: json, markdown)")
+    parser.add_argument("--since", type=str, help="Execuções a partir de YYYY-MM-DD[ HH:MM:SS] (UTC)")
+    parser.add_argument("--until", type=str, help="Execuções antes de YYYY-MM-DD[ HH:MM:SS] (UTC)")
+    parser.add_argument("--date", type=str, help="Execuções de um dia YYYY-MM-DD (UTC)")
+    status = parser.add_mutually_exclusive_group()
+    status.add_argument("--passed", action="store_true", help="Apenas execuções sem guardrail reprovado")
+    status.add_argument("--failed", action="store_true", help="Apenas execuções com guardrail reprovado")
+    cursor = parser.add_mutually_exclusive_group()
+    cursor.add_argument("--before-id", type=int, help="Execuções anteriores a este ID (próxima página)")
+    cursor.add_argument("--after-id", type=int,
+                        help="Execuções posteriores a este ID, das mais antigas às mais recentes")
+    parser.add_argument("--search", type=str, help="Busca textual em prompts, itens e respostas (\"termo*\" = prefixo)")
+    parser.add_argument("--page", type=int, default=1, help="Página dos resultados da busca (com --limit por página)")
+    parser.add_argument("--stats", action="store_true", help="Telemetria agregada por etapa (latência, tokens, cache)")
+    parser.add_argument("--group-by", type=str, default="model,guardrail",
+                        help=f"Agrupamento de --stats, separado por vírgula ({', '.join(STAGE_ROLLUP_GROUPS)})")
     args = parser.parse_args()
     
     db = None  # Inicializa db como None
     
     try:
-        db = DatabaseManager()
+        # Apenas leitura: sem limpeza nem fila de gravação em segundo plano
+        db = DatabaseManager(write_behind=False, retention=False)
         
         # Se tiver ID, busca diretamente
         if args.id:
-            runs = db.get_run_history(run_id=args.id)
-            if runs:
-                show_run_details(runs[0])
+            run = db.get_run(args.id)
+            if run:
+                show_run_details(run)
             else:
                 console.print(f"[red]Execução {args.id} não encontrada![/red]")
             return
-            
-        # Caso contrário, busca lista completa
-        runs = db.get_run_history(limit=args.limit)
         
-        # Filtra resultados se necessário
-        if args.session:
-            runs = [r for r in runs if args.session in r['session_id']]
-        if args.agent:
-            runs = [r for r in runs if r['last_agent'] and args.agent in r['last_agent']]
+        since, until = args.since, args.until
+        if args.date:
+            day = datetime.strptime(args.date, "%Y-%m-%d")
+            since, until = day.strftime("%Y-%m-%d"), (day + timedelta(days=1)).strftime("%Y-%m-%d")
+            
+        # Telemetria: apenas os agregados por hora, modelo e guardrail são consultados
+        if args.stats:
+            group_by = [column.strip() for column in args.group_by.split(",") if column.strip()]
+            show_stage_rollups(db.get_stage_rollups(since=since, until=until, group_by=group_by), group_by)
+            return
+            
+        # Busca textual: resultados por relevância, paginados por --page
+        if args.search:
+            limit = args.limit if args.limit > 0 else PAGE_SIZE
+            hits = db.search(args.search, limit=limit, offset=(max(args.page, 1) - 1) * limit,
+                             session_id=args.session, since=since, until=until)
+            show_search_results(hits, args.search)
+            if len(hits) == limit:
+                console.print(f"[dim]Próxima página: --page {max(args.page, 1) + 1}[/dim]")
+            return
+            
+        # Filtros e paginação são aplicados na consulta; as execuções chegam em páginas
+        runs = db.iter_runs(
+            session_id=args.session,
+            since=since,
+            until=until,
+            format=args.output,
+            passed=True if args.passed else False if args.failed else None,
+            before_id=args.before_id,
+            after_id=args.after_id,
+            page_size=min(args.limit, PAGE_SIZE) if args.limit > 0 else PAGE_SIZE
+        )
+        if args.limit > 0:
+            runs = islice(runs, args.limit)
         
-        # Mostra lista resumida
-        show_run_list(runs)
+        # Mostra lista resumida, uma tabela por página
+        page: List[RunRecord] = []
+        shown = 0
+        for run in runs:
+            page.append(run)
+            if len(page) == PAGE_SIZE:
+                show_run_list(page)
+                shown, page = shown + len(page), []
+        if page or not shown:
+            show_run_list(page)
+            shown += len(page)
+        if shown:
+            last_id = (page or [run])[-1].id
+            option = "--after-id" if args.after_id is not None else "--before-id"
+            console.print(f"[dim]Próxima página: {option} {last_id}[/dim]")
         
     except Exception as e:
         console.print(f"[red]Erro ao acessar logs: {str(e)}[/red]")
@@ -147,4 +294,4 @@ def main():
             db.close()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
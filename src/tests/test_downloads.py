@@ -0,0 +1,139 @@
+"""
+# src/tests/test_downloads.py
+Testes do RangeDownloader contra um servidor HTTP local com suporte a Range.
+"""
+import hashlib
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.core.downloads import DownloadError, RangeDownloader
+
+pytestmark = pytest.mark.core
+
+DATA = os.urandom(1024 * 1024 + 123)
+DIGEST = hashlib.sha256(DATA).hexdigest()
+SEGMENT_SIZE = 128 * 1024
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serve DATA; o comportamento é controlado pelos atributos do servidor."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._send_headers(200, len(DATA))
+
+    def do_GET(self):
+        server = self.server
+        header = self.headers.get("Range")
+        with server.lock:
+            server.requests.append(header)
+        if not header or not server.ranges:
+            self._send_headers(200, len(DATA))
+            self.wfile.write(DATA)
+            return
+
+        start, end = header.split("=", 1)[1].split("-")
+        start = int(start)
+        end = int(end) if end else len(DATA) - 1
+        body = DATA[start:end + 1]
+        self._send_headers(206, len(body), {"Content-Range": f"bytes {start}-{end}/{len(DATA)}"})
+        with server.lock:
+            drop = server.drops > 0 and start > 0
+            server.drops -= drop
+        if drop:
+            # Envia metade da faixa e derruba a conexão
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def _send_headers(self, status, length, extra=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+@pytest.fixture
+def server():
+    """Servidor HTTP local em uma porta livre, encerrado ao fim do teste."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    httpd.daemon_threads = True
+    httpd.ranges = True
+    httpd.drops = 0
+    httpd.requests = []
+    httpd.lock = threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/model.gguf"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def make_downloader(retries=1):
+    return RangeDownloader(connections=4, chunk_size=16 * 1024, timeout=5, retries=retries,
+                           min_segment_size=SEGMENT_SIZE)
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_parallel_segments(server, tmp_path):
+    dest = tmp_path / "model.gguf"
+    digest = make_downloader().download(server.url, str(dest), sha256=DIGEST)
+
+    assert digest == DIGEST
+    assert read(dest) == DATA
+    assert len(server.requests) == 4
+    assert all(header and header.startswith("bytes=") for header in server.requests)
+    assert not os.path.exists(f"{dest}.part")
+    assert not os.path.exists(f"{dest}.part.json")
+
+def test_resume_after_dropped_connection(server, tmp_path):
+    dest = tmp_path / "model.gguf"
+    server.drops = 3
+
+    with pytest.raises(DownloadError):
+        make_downloader().download(server.url, str(dest), sha256=DIGEST)
+    assert not dest.exists()
+    assert os.path.exists(f"{dest}.part")
+    assert os.path.exists(f"{dest}.part.json")
+
+    resumed_from = len(server.requests)
+    digest = make_downloader().download(server.url, str(dest), sha256=DIGEST)
+
+    assert digest == DIGEST
+    assert read(dest) == DATA
+    # Apenas o que faltava é pedido de novo, a partir do meio das faixas interrompidas
+    segment = -(-len(DATA) // 4)
+    starts = [int(header[6:].split("-")[0]) for header in server.requests[resumed_from:]]
+    assert len(starts) == 3 and all(start % segment for start in starts)
+
+def test_sha_mismatch_leaves_no_final_file(server, tmp_path):
+    dest = tmp_path / "model.gguf"
+
+    with pytest.raises(DownloadError, match="SHA-256"):
+        make_downloader().download(server.url, str(dest), sha256="0" * 64)
+
+    assert not dest.exists()
+    assert not os.path.exists(f"{dest}.part")
+    assert not os.path.exists(f"{dest}.part.json")
+
+def test_fallback_without_ranges(server, tmp_path):
+    dest = tmp_path / "model.gguf"
+    server.ranges = False
+
+    digest = make_downloader().download(server.url, str(dest), sha256=DIGEST)
+
+    assert digest == DIGEST
+    assert read(dest) == DATA
+    assert server.requests == [None]
@@ -165,6 +165,8 @@ class TDDPromptApp(App):
         # Inicializa o ModelManager para obter a lista de modelos disponíveis
         try:
             self.model_manager = ModelManager()
+            # Aquece os modelos em segundo plano enquanto a interface é montada
+            self.model_manager.warm_up()
             # Obtemos todos os modelos disponíveis dinamicamente
             models_by_provider = self.model_manager.get_available_models()
             # Criamos uma lista plana com todos os modelos de todas as categorias
@@ -277,7 +279,8 @@ class TDDPromptApp(App):
                 self.session_id,
                 input=prompt,
                 final_output=result.output,
-                output_type=formato
+                output_type=formato,
+                stages=result.raw_responses
             )
             
         except Exception as e: